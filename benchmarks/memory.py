@@ -0,0 +1,125 @@
+"""
+Memory used by a fully built level.
+
+Builds every room (and the enemies and commands in them) of a ``--size`` x ``--size`` level and reports the
+bytes per object of each core class, next to what the same object takes with its attributes in a ``__dict__``,
+as well as the total traced by :py:mod:`tracemalloc` for the whole level: ::
+
+    python benchmarks/memory.py --size 256
+
+"""
+import os
+import sys
+import random
+import argparse
+import tracemalloc
+
+from collections import defaultdict
+
+# Run as a script from anywhere, the package is imported from the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from turnable.chars import AIEntity, PlayableEntity
+from turnable.command import Command
+from turnable.game import Game
+from turnable.geometry import Position
+from turnable.map import Map
+from turnable.rooms import FightRoom, Room
+from turnable.state import States
+
+
+def build_level(size: int, seed: int) -> Game:
+    """ Returns a game with a ``size`` x ``size`` level where every room and its enemy commands are built. """
+    FightRoom.set_enemy_dist(FightRoom.DEFAULT_DIST)
+    Map.set_room_dist(Map.DEFAULT_DIST)
+    game = Game('Memory', PlayableEntity('Player'), Map(), None, None, rng=random.Random(seed))
+    game.state = States.IN_FIGHT
+    flags = Map.LAZY_ROOMS, Map.COMPACT_GRID
+    Map.LAZY_ROOMS = False
+    Map.COMPACT_GRID = False
+    try:
+        game.map._generate_grid(size, size)
+    finally:
+        Map.LAZY_ROOMS, Map.COMPACT_GRID = flags
+    for room in _rooms(game):
+        for enemy in getattr(room, 'enemies', ()):
+            enemy.actions
+    return game
+
+
+def _rooms(game: Game):
+    for column in game.map.grid:
+        yield from column
+
+
+def _fields(obj) -> dict:
+    names = [name for klass in type(obj).__mro__ for name in getattr(klass, '__slots__', ())]
+    fields = {name: getattr(obj, name) for name in names if hasattr(obj, name)}
+    fields.update(getattr(obj, '__dict__', {}))
+    return fields
+
+
+_plain_classes = {}
+
+
+def dict_size(obj) -> int:
+    """ Size of an object holding the same attributes as *obj* in a ``__dict__``. """
+    cls = _plain_classes.setdefault(type(obj), type(type(obj).__name__, (), {}))
+    plain = cls()
+    for name, value in _fields(obj).items():
+        setattr(plain, name, value)
+    return sys.getsizeof(plain) + sys.getsizeof(plain.__dict__)
+
+
+def object_size(obj) -> int:
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def measure(size: int, seed: int = 0) -> dict:
+    tracemalloc.start()
+    game = build_level(size, seed)
+    total = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    objects = defaultdict(list)
+    for room in _rooms(game):
+        objects[Room].append(room)
+        objects[Position].append(room.pos)
+        for enemy in getattr(room, 'enemies', ()):
+            objects[AIEntity].append(enemy)
+            objects[Command].extend(enemy.actions)
+
+    classes = {}
+    for cls, instances in objects.items():
+        sample = instances[:1000]
+        current = sum(object_size(obj) for obj in sample) / len(sample)
+        with_dict = sum(dict_size(obj) for obj in sample) / len(sample)
+        classes[cls.__name__] = {
+            'count': len(instances),
+            'bytes': current,
+            'dict_bytes': with_dict,
+            'saved': with_dict - current,
+        }
+    return {'size': size, 'rooms': size * size, 'total_bytes': total, 'classes': classes}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-s', '--size', type=int, default=256, help='Width and height of the level.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    result = measure(args.size, args.seed)
+    print(f'Level {result["size"]}x{result["size"]}: {result["total_bytes"] / 2 ** 20:.1f} MiB '
+          f'({result["total_bytes"] / result["rooms"]:.0f} bytes per room)')
+    print(f'{"class":<10} {"count":>9} {"bytes":>8} {"__dict__":>9} {"saved":>8}')
+    for name, stats in result['classes'].items():
+        print(f'{name:<10} {stats["count"]:>9} {stats["bytes"]:>8.0f} {stats["dict_bytes"]:>9.0f} '
+              f'{stats["saved"]:>8.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,374 @@
+"""
+Benchmarks of the core hot paths.
+
+Runs every benchmark (or the ones matching ``--filter``), prints the time per operation and writes the results
+as JSON. With ``--baseline`` the results are compared against a stored run, and the script exits with status 1
+when a benchmark got slower than the baseline by more than its threshold: ::
+
+    python benchmarks/run.py --output results.json --baseline benchmarks/baseline.json
+    python benchmarks/run.py --save-baseline benchmarks/baseline.json
+    python benchmarks/run.py --filter hooks --threshold 0.25 --threshold hooks.trigger[100]=0.5
+
+Thresholds can also be stored in the baseline, as a ``"thresholds"`` object of benchmark names and fractions.
+Timings are the best of ``--repeat`` runs of as many operations as fit in ``--min-time`` seconds, with the
+garbage collector disabled, as :py:mod:`timeit` does. Baselines only make sense on the machine they were
+saved on, so save a new one before comparing on a different machine.
+"""
+import gc
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Run as a script from anywhere, the package is imported from the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from turnable.chars import AIEntity, PlayableEntity
+from turnable.game import Game
+from turnable.hooks import HookType
+from turnable.map import Map
+from turnable.rooms import EmptyRoom, FightRoom
+from turnable.paths import DistanceField
+from turnable.spatial import SpatialIndex
+from turnable.state import States
+from turnable.streams import BaseInputStream, CommandRequest, CommandResponse
+
+
+DEFAULT_THRESHOLD = 0.2
+
+# Benchmark functions receive their parameter and return the operation to time.
+BENCHMARKS: Dict[str, Tuple[Callable[..., Callable[[], object]], tuple]] = {}
+
+
+def benchmark(name: str, params: tuple = (None,)):
+    """ Registers a benchmark as *name*, or as ``name[param]`` for every value in *params*. """
+    def decorator(setup):
+        for param in params:
+            BENCHMARKS[name if param is None else f'{name}[{param}]'] = (setup, param)
+        return setup
+    return decorator
+
+
+class ScriptedInputStream(BaseInputStream):
+    """ Answers requests cycling through *script*. """
+
+    def __init__(self, script: List[str]):
+        self.script = script
+        self.ix = 0
+
+    def request(self, request: CommandRequest) -> CommandResponse:
+        answer = self.script[self.ix % len(self.script)]
+        self.ix += 1
+        return CommandResponse(request, answer)
+
+
+def build_game(script: Optional[List[str]] = None, map_mode: str = 'lazy', seed: int = 0) -> Game:
+    """
+    Returns a headless game with the default distributions and a very healthy player. The grid flags of
+    :py:class:`turnable.map.Map` are set for *map_mode*, :py:func:`run` restores them after the benchmark.
+    """
+    FightRoom.set_enemy_dist(FightRoom.DEFAULT_DIST)
+    Map.set_room_dist(Map.DEFAULT_DIST)
+    Map.LAZY_ROOMS = map_mode != 'eager'
+    Map.COMPACT_GRID = map_mode == 'compact'
+    player = PlayableEntity('Bench', health=10 ** 9)
+    game = Game('Bench', player, Map(), ScriptedInputStream(script or ['ATK', '1']), None,
+                rng=random.Random(seed))
+    game.map.reset()
+    player.pos = game.map.get_start_pos()
+    return game
+
+
+def fight_room(game: Game, enemies: int) -> FightRoom:
+    """ Puts the player of *game* in a fight room with *enemies* enemies that never die. """
+    room = FightRoom(game.player.pos, game)
+    room.enemies = []
+    for ix in range(enemies):
+        room.add_enemy(AIEntity(f'Enemy{ix}', 1, game.player.pos, health=10 ** 9))
+    game.room = room
+    game.state = States.IN_FIGHT
+    room.start()
+    return room
+
+
+@benchmark('map.next_level', (16, 64, 256, 1024))
+def bench_next_level(size: int):
+    """ Generates a level of ``size`` x ``size`` rooms with the default lazy grid. """
+    game = build_game()
+
+    def run():
+        game.map.level = size - Map.BASE_MAP_SIZE - 1
+        game.map.next_level()
+    return run
+
+
+@benchmark('map.next_level.compact', (256, 1024))
+def bench_next_level_compact(size: int):
+    """ Generates a level with a :py:class:`turnable.map.CompactGrid`. """
+    game = build_game(map_mode='compact')
+
+    def run():
+        game.map.level = size - Map.BASE_MAP_SIZE - 1
+        game.map.next_level()
+    return run
+
+
+@benchmark('map.next_level.eager', (16, 64))
+def bench_next_level_eager(size: int):
+    """ Generates a level building every room and its enemies. """
+    game = build_game(map_mode='eager')
+
+    def run():
+        game.map.level = size - Map.BASE_MAP_SIZE - 1
+        game.map.next_level()
+    return run
+
+
+@benchmark('game.play_turns.move')
+def bench_play_turns_move(_):
+    """ Player walking around empty rooms. """
+    game = build_game(['MOVUP', 'MOVRIGHT', 'MOVDOWN', 'MOVLEFT'])
+    game.room = EmptyRoom(game.player.pos, game)
+    game.room.start()
+
+    def run():
+        game.play_turns()
+    return run
+
+
+@benchmark('game.play_turns.fight', (1, 10))
+def bench_play_turns_fight(enemies: int):
+    """ Full turns of a fight: the player attacks and the enemies hit back. """
+    game = build_game(['ATK', '1'])
+    fight_room(game, enemies)
+
+    def run():
+        game.play_turns()
+    return run
+
+
+@benchmark('command.get_command')
+def bench_get_command(_):
+    """ Matches a mix of valid and invalid inputs against the player's actions. """
+    game = build_game()
+    game.state = States.IN_FIGHT
+    request = CommandRequest('Enter action: ', game.player.actions)
+    inputs = ['ATK', 'MOVUP', 'MOVLEFT', ':HELP', 'NOPE']
+
+    def run():
+        for input_ in inputs:
+            request.get_command(input_)
+    return run
+
+
+@benchmark('hooks.trigger', (0, 10, 100))
+def bench_trigger_hook(hooks: int):
+    """ Dispatches a hook type with *hooks* callbacks. """
+    game = build_game()
+    calls = []
+
+    def callback(game, type_, handle):
+        calls.append(handle)
+
+    for priority in range(hooks):
+        game.add_hook(HookType.TURN_ROUND_START, callback, priority % 5)
+
+    def run():
+        game.trigger_hook(HookType.TURN_ROUND_START)
+        calls.clear()
+    return run
+
+
+@benchmark('fight_room.round', (100, 1000))
+def bench_fight_round(enemies: int):
+    """ A round of :py:meth:`FightRoom.turn_order` and :py:meth:`FightRoom.play_turn` with many enemies. """
+    game = build_game(['ATK', '1'])
+    room = fight_room(game, enemies)
+
+    def run():
+        game.turn += 1
+        for entity in room.turn_order():
+            entity.play_turn()
+        room.play_turn()
+    return run
+
+
+@benchmark('spatial.nearest', (1000, 100000))
+def bench_spatial_nearest(points: int):
+    """ Finds the nearest point and the points within 10 cells in an index of *points* points. """
+    rng = random.Random(0)
+    index = SpatialIndex()
+    for _ in range(points):
+        index.add(rng.randrange(2000), rng.randrange(2000))
+
+    def run():
+        next(index.nearest(1000, 1000))
+        list(index.in_radius(1000, 1000, 10))
+    return run
+
+
+@benchmark('paths.retarget', (1, 16))
+def bench_paths_retarget(targets: int):
+    """ Moves one of *targets* targets of a distance field over a 128 x 128 map back and forth. """
+    game = build_game()
+    game.map._generate_grid(128, 128)
+    side = int(targets ** 0.5)
+    cells = {(16 + 32 * x, 16 + 32 * y) for x in range(side) for y in range(side)}
+    moved = (cells - {(16, 16)}) | {(17, 16)}
+    field = DistanceField(game.map.passable, cells)
+    state = [False]
+
+    def run():
+        state[0] = not state[0]
+        field.retarget(moved if state[0] else cells)
+    return run
+
+
+def measure(operation: Callable[[], object], repeat: int, min_time: float) -> dict:
+    """ Returns the best and median seconds per call of *operation*, calibrating the calls per run. """
+    number = 1
+    while True:
+        elapsed = _time(operation, number)
+        if elapsed >= min_time or number >= 1 << 30:
+            break
+        number = max(number * 2, int(number * min_time / elapsed) if elapsed else number * 10)
+    runs = [elapsed / number] + [_time(operation, number) / number for _ in range(repeat - 1)]
+    return {'seconds': min(runs), 'median': statistics.median(runs), 'number': number, 'repeat': repeat}
+
+
+def _time(operation: Callable[[], object], number: int) -> float:
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for _ in range(number):
+            operation()
+        return time.perf_counter() - start
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def run(names: List[str], repeat: int = 5, min_time: float = 0.2) -> dict:
+    """ Runs the benchmarks in *names* and returns the results with the environment they ran in. """
+    results = {}
+    for name in names:
+        setup, param = BENCHMARKS[name]
+        # build_game sets the grid flags of Map, which the benchmark reads while it runs.
+        flags = Map.LAZY_ROOMS, Map.COMPACT_GRID
+        try:
+            results[name] = measure(setup(param), repeat, min_time)
+        finally:
+            Map.LAZY_ROOMS, Map.COMPACT_GRID = flags
+        print(f'{name:<32} {_format_time(results[name]["seconds"]):>10}', flush=True)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        },
+        'results': results,
+    }
+
+
+def compare(results: dict, baseline: dict, thresholds: Dict[str, float],
+            default: float = DEFAULT_THRESHOLD) -> Iterator[Tuple[str, float, float, bool]]:
+    """
+    Yields ``(name, baseline seconds, seconds, regressed)`` for the benchmarks in both runs. A benchmark
+    regressed when it's slower than the baseline by more than its threshold, a fraction of the baseline time.
+    Thresholds stored in the baseline are used unless overridden in *thresholds*.
+    """
+    limits = dict(baseline.get('thresholds', {}))
+    limits.update(thresholds)
+    for name, result in results['results'].items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            continue
+        limit = limits.get(name, default)
+        yield name, previous['seconds'], result['seconds'], result['seconds'] > previous['seconds'] * (1 + limit)
+
+
+def save_baseline(path: str, results: dict):
+    """ Writes *results* as the baseline in *path*, keeping the thresholds of the previous baseline. """
+    baseline = dict(results)
+    if os.path.exists(path):
+        with open(path) as fp:
+            baseline['thresholds'] = json.load(fp).get('thresholds', {})
+    with open(path, 'w') as fp:
+        json.dump(baseline, fp, indent=2)
+
+
+def _format_time(seconds: float) -> str:
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f'{seconds / scale:.2f}{unit}'
+    return f'{seconds / 1e-9:.0f}ns'
+
+
+def _parse_thresholds(values: List[str]) -> Tuple[float, Dict[str, float]]:
+    default = DEFAULT_THRESHOLD
+    thresholds = {}
+    for value in values:
+        name, sep, limit = value.rpartition('=')
+        if sep:
+            thresholds[name] = float(limit)
+        else:
+            default = float(limit)
+    return default, thresholds
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-f', '--filter', action='append', default=[],
+                        help='Only run benchmarks whose name contains this text. Can be repeated.')
+    parser.add_argument('-o', '--output', help='Write the results as JSON to this file.')
+    parser.add_argument('-b', '--baseline', help='Compare the results against this JSON file.')
+    parser.add_argument('--save-baseline', metavar='PATH', help='Write the results as the new baseline.')
+    parser.add_argument('-t', '--threshold', action='append', default=[], metavar='[NAME=]FRACTION',
+                        help=f'Allowed slowdown, as a fraction of the baseline time (default {DEFAULT_THRESHOLD}). '
+                             'With NAME= it only applies to that benchmark. Can be repeated.')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='Runs per benchmark.')
+    parser.add_argument('--min-time', type=float, default=0.2, help='Minimum seconds per run.')
+    parser.add_argument('-l', '--list', action='store_true', help='List the benchmarks and exit.')
+    args = parser.parse_args(argv)
+
+    names = [name for name in BENCHMARKS if not args.filter or any(text in name for text in args.filter)]
+    if args.list:
+        print('\n'.join(names))
+        return 0
+
+    results = run(names, args.repeat, args.min_time)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2)
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as fp:
+        baseline = json.load(fp)
+    default, thresholds = _parse_thresholds(args.threshold)
+    regressions = 0
+    print(f'\n{"benchmark":<32} {"baseline":>10} {"current":>10} {"change":>8}')
+    for name, before, after, regressed in compare(results, baseline, thresholds, default):
+        regressions += regressed
+        print(f'{name:<32} {_format_time(before):>10} {_format_time(after):>10} {after / before - 1:>+8.1%}'
+              f'{"  REGRESSION" if regressed else ""}')
+    if regressions:
+        print(f'\n{regressions} benchmark(s) regressed.')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
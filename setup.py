@@ -14,6 +14,9 @@ setup(name='Turnable',
             'turnable',
             'turnable.helpers'
       ],
+      extras_require={
+            'numpy': ['numpy'],
+      },
       classifiers=[
             "Programming Language :: Python :: 3",
             "License :: OSI Approved :: MIT License",
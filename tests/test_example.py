@@ -0,0 +1,32 @@
+import functools
+import unittest
+
+from turnable import build_game
+from turnable.effects import Poison
+from turnable.example import PoisonousCharacter
+from turnable.simulation import PolicyInputStream, _has_command, aggressive_policy, endgame_turn_limit
+
+
+class TestExample(unittest.TestCase):
+
+    def test_poison_enemies(self):
+        poisoned = []
+
+        def poison_policy(game, request):
+            if _has_command(request, 'POI'):
+                poisoned.extend(enemy for enemy in game.room.enemies
+                                if any(isinstance(effect, Poison) for effect in enemy.effects))
+                return 'POI'
+            return aggressive_policy(game, request)
+
+        instream = PolicyInputStream(poison_policy)
+        game = build_game('Example', 'Player', player_class=PoisonousCharacter,
+                          instream=lambda: instream, outstream=lambda: None, seed=1)
+        instream.game = game
+        game.endgame_condition = functools.partial(endgame_turn_limit, 30)
+        game.start()
+        self.assertTrue(poisoned)
+
+
+if __name__ == '__main__':
+    unittest.main()
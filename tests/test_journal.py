@@ -0,0 +1,53 @@
+import functools
+import os
+import tempfile
+import unittest
+
+from turnable import build_game
+from turnable.chars import MCTSEntity
+from turnable.journal import Journal, JournalReader, RecordKind, replay
+from turnable.simulation import endgame_turn_limit
+
+
+class Bot(MCTSEntity):
+    __slots__ = ()
+    SEARCH_BUDGET = 10
+    SEARCH_ROLLOUTS = 20
+    SEARCH_DEPTH = 2
+
+
+def bot_game():
+    game = build_game('Journal', 'Bot', player_class=Bot, instream=lambda: None, outstream=lambda: None, seed=4)
+    game.endgame_condition = functools.partial(endgame_turn_limit, 15)
+    return game
+
+
+def state(game) -> tuple:
+    player = game.player
+    rooms = sorted((room.pos.x, room.pos.y, room.is_done, [enemy.health for enemy in getattr(room, 'enemies', ())])
+                   for room in game.map.built_rooms())
+    return game.turn, player.health, player.armor, player.pos, rooms, game.rng.getstate()
+
+
+class TestJournal(unittest.TestCase):
+
+    def test_replay_bot_decisions(self):
+        path = os.path.join(tempfile.mkdtemp(), 'bot.trnj')
+        game = bot_game()
+        with Journal(path) as journal:
+            game.journal = journal
+            game.start()
+
+        with JournalReader(path) as reader:
+            inputs = [record for record in reader.records() if record.kind == RecordKind.INPUT]
+        self.assertGreaterEqual(len(inputs), game.turn - 1)
+
+        replayed = bot_game()
+        replay(replayed, path)
+        self.assertIsNone(getattr(replayed.player, '_policy', None))
+        # Snapshots differ in where rooms are kept, as the searches fork the recorded game, so compare the state.
+        self.assertEqual(state(replayed), state(game))
+
+
+if __name__ == '__main__':
+    unittest.main()
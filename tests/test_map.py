@@ -0,0 +1,52 @@
+import unittest
+
+from turnable import build_game
+from turnable.geometry import Position
+from turnable.map import ChunkedMap
+from turnable.rooms import FightRoom
+
+
+def chunked_game(seed: int = 1):
+    game = build_game('Map', 'Player', map_class=ChunkedMap, instream=lambda: None, outstream=lambda: None,
+                      seed=seed)
+    game.map.reset()
+    game.player.pos = game.map.get_start_pos()
+    game.map.get_player_room()
+    return game
+
+
+class TestChunkedMap(unittest.TestCase):
+
+    def test_fork_keeps_loading_chunks(self):
+        game = chunked_game()
+        fork = game.fork()
+        unforked = chunked_game()
+        for map_ in (game.map, unforked.map):
+            map_.game.player.pos = Position(200, 200)
+            map_.get_player_room()
+
+        self.assertIn((12, 12), game.map.chunks)
+        self.assertEqual(list(game.map.chunks), list(unforked.map.chunks))
+        self.assertNotIn((12, 12), fork.map.chunks)
+        rooms = game.map.find_rooms(FightRoom)
+        self.assertTrue(rooms)
+        self.assertEqual(rooms, unforked.map.find_rooms(FightRoom))
+        self.assertEqual(game.map.paths.to_rooms(FightRoom).targets,
+                         unforked.map.paths.to_rooms(FightRoom).targets)
+
+    def test_fork_evicts_chunks(self):
+        game = chunked_game()
+        game.fork()
+        start = game.map.get_room(Position(0, 0))
+        start.is_done = True
+        for x in range(ChunkedMap.MAX_CHUNKS + 1):
+            game.player.pos = Position(ChunkedMap.CHUNK_SIZE * 3 * x, 0)
+            game.map.get_player_room()
+
+        self.assertLessEqual(len(game.map.chunks), ChunkedMap.MAX_CHUNKS)
+        self.assertNotIn((0, 0), game.map.chunks)
+        self.assertIs(game.map.get_room(Position(0, 0)), start)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+
+from turnable import build_game
+from turnable.map import ChunkedMap
+from turnable.rooms import FightRoom
+
+
+class TestPathFinder(unittest.TestCase):
+
+    def test_to_rooms_follows_loaded_chunks(self):
+        game = build_game('Paths', 'Player', map_class=ChunkedMap, instream=lambda: None, outstream=lambda: None,
+                          seed=2)
+        game.map.reset()
+        game.player.pos = game.map.get_start_pos()
+        game.map.get_player_room()
+
+        def targets():
+            return {(pos.x, pos.y) for pos in game.map.find_rooms(FightRoom)}
+
+        loaded = targets()
+        self.assertEqual(game.map.paths.to_rooms(FightRoom).targets, loaded)
+
+        game.map.get_chunk(10, 10)
+        self.assertGreater(targets(), loaded)
+        self.assertEqual(game.map.paths.to_rooms(FightRoom).targets, targets())
+
+        for cx in range(ChunkedMap.MAX_CHUNKS):
+            game.map.get_chunk(20 + cx, 20)
+        self.assertFalse(targets() & loaded)
+        self.assertEqual(game.map.paths.to_rooms(FightRoom).targets, targets())
+
+
+if __name__ == '__main__':
+    unittest.main()
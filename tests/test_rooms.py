@@ -0,0 +1,44 @@
+import random
+import unittest
+
+from turnable.chars import AIEntity, PlayableEntity
+from turnable.game import Game
+from turnable.hooks import HookType
+from turnable.map import Map
+from turnable.rooms import FightRoom
+from turnable.simulation import PolicyInputStream, aggressive_policy
+from turnable.state import States
+
+
+class TestFightRoom(unittest.TestCase):
+
+    def setUp(self):
+        FightRoom.set_enemy_dist(FightRoom.DEFAULT_DIST)
+        Map.set_room_dist(Map.DEFAULT_DIST)
+        instream = PolicyInputStream(aggressive_policy)
+        self.game = Game('Rooms', PlayableEntity('Player', health=10 ** 6), Map(), instream, None,
+                         rng=random.Random(0))
+        instream.game = self.game
+        self.game.map.reset()
+        self.game.player.pos = self.game.map.get_start_pos()
+
+    def test_enemy_turn_hooks_every_round(self):
+        game = self.game
+        room = FightRoom(game.player.pos, game)
+        room.enemies = []
+        room.add_enemy(AIEntity('Slow', 1, health=10 ** 6, speed=0.5))
+        game.room = room
+        game.state = States.IN_FIGHT
+        room.start()
+
+        fired = []
+        game.add_hook(HookType.ENEMY_TURN_START, lambda game, hook_type, hook_id: fired.append(('start', game.turn)))
+        game.add_hook(HookType.ENEMY_TURN_END, lambda game, hook_type, hook_id: fired.append(('end', game.turn)))
+        for _ in range(4):
+            game.play_turns()
+
+        self.assertEqual(fired, [(hook, turn) for turn in range(1, 5) for hook in ('start', 'end')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import random
+import unittest
+
+from turnable.chars import AIEntity, PlayableEntity
+from turnable.game import Game
+from turnable.map import Map
+from turnable.rooms import FightRoom
+from turnable.search import MCTSPolicy, MCTSSearch, default_reward
+from turnable.simulation import PolicyInputStream
+from turnable.state import States
+
+
+class Arena(FightRoom):
+    """ Fight room with fixed enemies: the second one dies with a single hit. """
+    __slots__ = ()
+
+    def create_enemies(self):
+        for name, health in (('Tank1', 100), ('Weak', 5), ('Tank2', 100)):
+            enemy = AIEntity(name, 1, self.pos, health=health, armor=0)
+            enemy.game = self.game
+            self.enemies.append(enemy)
+        self.build_store()
+
+
+def build_fight(policy) -> Game:
+    FightRoom.set_enemy_dist(FightRoom.DEFAULT_DIST)
+    Map.set_room_dist([(Arena, 1)])
+    instream = PolicyInputStream(policy)
+    game = Game('Search', PlayableEntity('Player', health=100), Map(), instream, None, rng=random.Random(1))
+    instream.game = game
+    game.map.reset()
+    game.player.pos = game.map.get_start_pos()
+    game.room = game.map.get_room(game.player.pos)
+    game.state = States.IN_FIGHT
+    game.room.start()
+    return game
+
+
+class TestSearch(unittest.TestCase):
+
+    def tearDown(self):
+        Map.set_room_dist(Map.DEFAULT_DIST)
+
+    def test_picks_the_kill(self):
+        policy = MCTSPolicy(MCTSSearch(budget=10, max_rollouts=60, depth=1))
+        game = build_fight(policy)
+        game.play_turns()
+
+        result = policy.last_result
+        self.assertEqual(result.best, ('ATK', '2'))
+        means = {choice: result.mean(ix) for ix, choice in enumerate(result.choices)}
+        self.assertGreater(means[('ATK', '2')], max(mean for choice, mean in means.items() if choice != ('ATK', '2')))
+        self.assertEqual([enemy.name for enemy in game.room.enemies], ['Tank1', 'Tank2'])
+
+    def test_reward_counts_damage_dealt(self):
+        game = build_fight(None)
+        hit = game.fork()
+        hit.room.enemies[0].take_damage(10)
+        self.assertGreater(default_reward(hit, game), default_reward(game.fork(), game))
+
+    def test_reward_counts_armor_lost(self):
+        game = build_fight(None)
+        game.player.armor = 10
+        hit = game.fork()
+        hit.player.armor = 0
+        self.assertGreater(default_reward(game.fork(), game), default_reward(hit, game))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
-from typing import Callable
+import random
+from typing import Callable, Optional
 
 from turnable.map import Map
 from turnable.game import Game
@@ -14,12 +15,13 @@ def build_game(game_name: str,
                player_class: Callable = PlayableEntity,
                map_class: Callable = Map,
                instream: BaseInputStream = TextInputStream,
-               outstream: BaseOutputStream = TextOutputStream) -> Game:
+               outstream: BaseOutputStream = TextOutputStream,
+               seed: Optional[int] = None) -> Game:
 
-    FightRoom.ENEMY_DIST = FightRoom.DEFAULT_DIST
-    Map.ROOM_DIST = Map.DEFAULT_DIST
+    FightRoom.set_enemy_dist(FightRoom.DEFAULT_DIST)
+    Map.set_room_dist(Map.DEFAULT_DIST)
 
     player = player_class(player_name)
     map_ = map_class()
 
-    return Game(game_name, player, map_, instream(), outstream())
+    return Game(game_name, player, map_, instream(), outstream(), rng=random.Random(seed))
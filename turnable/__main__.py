@@ -1 +1,106 @@
 #!/usr/bin/python3
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+
+from turnable.simulation import POLICIES, simulate
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='python -m turnable')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    sim = subparsers.add_parser('simulate', help='Run headless games and aggregate their results.')
+    sim.add_argument('-n', '--games', type=int, default=1000, help='Amount of games to play.')
+    sim.add_argument('-w', '--workers', type=int, default=None, help='Worker processes. Defaults to all cores.')
+    sim.add_argument('-s', '--seed', type=int, default=0, help='Seed of the first game.')
+    sim.add_argument('-p', '--policy', choices=sorted(POLICIES), default='aggressive', help='Player policy.')
+    sim.add_argument('-t', '--max-turns', type=int, default=1000, help='Turn limit per game.')
+    sim.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    serve = subparsers.add_parser('serve', help='Host games over TCP, one per connection.')
+    serve.add_argument('--host', default='127.0.0.1', help='Address to listen on.')
+    serve.add_argument('--port', type=int, default=8023, help='Port to listen on.')
+    serve.add_argument('--max-sessions', type=int, default=1000, help='Maximum concurrent sessions.')
+    serve.add_argument('--idle-timeout', type=float, default=300, help='Seconds before idle sessions are closed.')
+    serve.add_argument('--journal-dir', default=None, help='Directory to record every session in.')
+
+    load = subparsers.add_parser('loadtest', help='Play many concurrent sessions against a server.')
+    load.add_argument('--host', default='127.0.0.1', help='Server address.')
+    load.add_argument('--port', type=int, default=8023, help='Server port.')
+    load.add_argument('-c', '--clients', type=int, default=100, help='Concurrent sessions.')
+    load.add_argument('-r', '--requests', type=int, default=100, help='Prompts answered per session.')
+
+    replay = subparsers.add_parser('replay', help='Replay a session journal recorded by the server.')
+    replay.add_argument('journal', help='Path of the journal.')
+    replay.add_argument('--turn', type=int, default=None, help='Start from the last checkpoint before this turn.')
+    return parser
+
+
+def run_simulate(args) -> int:
+    start = time.perf_counter()
+    result = simulate(args.games, workers=args.workers, seed=args.seed,
+                      policy=POLICIES[args.policy], max_turns=args.max_turns)
+    elapsed = time.perf_counter() - start
+
+    if args.json:
+        data = result.as_dict()
+        data['elapsed'] = elapsed
+        print(json.dumps(data, indent=2))
+    else:
+        print(result)
+        print(f'Elapsed: {elapsed:.2f}s ({result.games / elapsed:.0f} games/s)')
+    return 0
+
+
+def run_serve(args) -> int:
+    from turnable.server import GameServer
+
+    logging.basicConfig(level=logging.INFO)
+    server = GameServer(args.host, args.port, max_sessions=args.max_sessions, idle_timeout=args.idle_timeout,
+                        journal_dir=args.journal_dir)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def run_loadtest(args) -> int:
+    from turnable.server import load_test
+
+    print(json.dumps(asyncio.run(load_test(args.host, args.port, args.clients, args.requests)), indent=2))
+    return 0
+
+
+def run_replay(args) -> int:
+    from turnable import build_game
+    from turnable.journal import replay
+
+    game = build_game('Replay', 'Player', instream=lambda: None, outstream=lambda: None)
+    start = time.perf_counter()
+    replay(game, args.journal, args.turn)
+    elapsed = time.perf_counter() - start
+    print(f'Stopped at turn {game.turn} of level {game.map.level} in {elapsed:.3f}s: '
+          f'state={game.state} player={game.player}')
+    return 0
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.command == 'simulate':
+        return run_simulate(args)
+    if args.command == 'serve':
+        return run_serve(args)
+    if args.command == 'loadtest':
+        return run_loadtest(args)
+    if args.command == 'replay':
+        return run_replay(args)
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
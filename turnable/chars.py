@@ -1,22 +1,67 @@
+import inspect
 import logging
-import random
 
 from enum import Enum
+from typing import Optional
 
 from turnable.command import Command
+from turnable.events import COMBAT, ENTITIES, MOVEMENT
 from turnable.map import Position
 from turnable.geometry import parse_directions
+from turnable.spatial import game_index
 from turnable.state import States
 from turnable.streams import CommandRequest, CommandResponse
 
 
+COMBAT.define('damage', '{0} received {1} damage (hp={2}, ar={3})')
+COMBAT.define('attack', '{0} attacked {1}')
+COMBAT.define('target', '{0} targets {1}')
+ENTITIES.define('created', 'Created {0} at {1}')
+MOVEMENT.define('move', '{0} moved from {1} to {2}')
+MOVEMENT.define('blocked', '{0} couldn\'t move from {1} to {2}')
+
+
+def _xy(pos: Optional[Position]) -> Optional[tuple]:
+    """ Event arg for a position. """
+    return (pos.x, pos.y) if pos is not None else None
+
+
 class CharacterStatus(Enum):
     STUNNED = 0
     ONFIRE = 1
+    POISONED = 2
+
+
+_async_variants = {}
+
+
+def _resolve_async(cls: type, name: str):
+    """
+    Returns the ``<name>_async`` function of *cls* if it's defined in the same class as ``<name>`` or in a subclass
+    of it, so a synchronous override is never shadowed by an inherited asynchronous variant. Results are cached.
+    """
+    key = (cls, name)
+    if key not in _async_variants:
+        async_name = f'{name}_async'
+        async_owner = next((k for k in cls.__mro__ if async_name in k.__dict__), None)
+        sync_owner = next((k for k in cls.__mro__ if name in k.__dict__), None)
+        if async_owner is not None and (sync_owner is None or issubclass(async_owner, sync_owner)):
+            _async_variants[key] = async_owner.__dict__[async_name]
+        else:
+            _async_variants[key] = None
+    return _async_variants[key]
 
 
 class HealthyEntity:
-    """ Represents an Entity with health and armor"""
+    """
+    Represents an Entity with health and armor.
+
+    Stats are stored in the entity unless it's added to a :py:class:`turnable.store.EntityStore`,
+    in which case they are read from and written to its slot in the store.
+
+    Entities use ``__slots__``; subclasses that don't declare them get a ``__dict__`` as usual.
+    """
+    __slots__ = ('_health', 'max_health', '_armor', '_store', '_slot')
     _logger = logging.getLogger('HealthyEntity')
 
     BASE_HEALTH = 100
@@ -25,10 +70,34 @@ class HealthyEntity:
     def __init__(self,
                  health: int = BASE_HEALTH,
                  armor: int = BASE_ARMOR):
+        self._store = None
+        self._slot = 0
         self.health = health
         self.max_health = health
         self.armor = armor
 
+    @property
+    def health(self) -> int:
+        return self._health if self._store is None else self._store.get('health', self._slot)
+
+    @health.setter
+    def health(self, value: int):
+        if self._store is None:
+            self._health = value
+        else:
+            self._store.set('health', self._slot, value)
+
+    @property
+    def armor(self) -> int:
+        return self._armor if self._store is None else self._store.get('armor', self._slot)
+
+    @armor.setter
+    def armor(self, value: int):
+        if self._store is None:
+            self._armor = value
+        else:
+            self._store.set('armor', self._slot, value)
+
     def take_damage(self, damage: int):
         """ Handles health and armor reduction based on incomming damage. """
         leftdmg = damage
@@ -40,18 +109,41 @@ class HealthyEntity:
         if leftdmg > 0:
             self.health -= leftdmg
 
-        self._logger.debug(f'DMG - {self} received {damage}.')
+        if COMBAT.debug:
+            COMBAT.emit(logging.DEBUG, 'damage', getattr(self, 'name', type(self).__name__), damage,
+                        self.health, self.armor)
 
     def is_alive(self):
         """ Returns if entity has health left. """
         return self.health > 0
 
 
+def take_damage_many(entities, damage: int):
+    """
+    Deals *damage* to every entity in *entities*. Entities bound to a :py:class:`turnable.store.EntityStore`
+    take it in a single batched call per store, unless their class overrides :py:meth:`HealthyEntity.take_damage`.
+    """
+    batches = {}
+    for entity in entities:
+        store = entity._store
+        if store is None or type(entity).take_damage is not HealthyEntity.take_damage:
+            entity.take_damage(damage)
+        else:
+            batches.setdefault(store, []).append(entity._slot)
+    for store, slots in batches.items():
+        store.take_damage(slots, damage)
+
+
 class Entity(HealthyEntity):
     """
     Represents base entity for both AI (enemies) and not-AI characters Entities.
     Most of the time you shouldn't need to directly inherit from this class.
+
+    In fights, entities act every ``1 / speed`` turns, and :py:attr:`initiative` decides who goes first
+    (see :py:mod:`turnable.turns`).
     """
+    __slots__ = ('game', 'name', '_damage', 'pos', 'status_list', '_actions_cache', 'speed', 'initiative',
+                 '_next_action')
     _logger = logging.getLogger('Entity')
 
     COMMAND_CLASS = Command
@@ -60,12 +152,16 @@ class Entity(HealthyEntity):
 
     BASE_HEALTH = 100
     BASE_DAMAGE = 10
+    BASE_SPEED = 1
+    BASE_INITIATIVE = 0
 
     def __init__(self,
                  name: str = 'Entity',
                  damage: int = BASE_DAMAGE,
                  pos: Position = None,
                  *args,
+                 speed: Optional[float] = None,
+                 initiative: Optional[int] = None,
                  **kwargs):
         super().__init__(*args, **kwargs)
         self.game = None
@@ -73,18 +169,65 @@ class Entity(HealthyEntity):
         self.damage = damage
         self.pos = pos
         self.status_list = []
+        self._actions_cache = None
+        self.speed = speed if speed is not None else self.BASE_SPEED
+        self.initiative = initiative if initiative is not None else self.BASE_INITIATIVE
+        self._next_action = 0
 
-        self._logger.debug(f'Created {self} at {self.pos}.')
+        if ENTITIES.debug:
+            ENTITIES.emit(logging.DEBUG, 'created', name, _xy(pos))
+
+    @property
+    def damage(self) -> int:
+        return self._damage if self._store is None else self._store.get('damage', self._slot)
+
+    @damage.setter
+    def damage(self, value: int):
+        if self._store is None:
+            self._damage = value
+        else:
+            self._store.set('damage', self._slot, value)
 
     @property
     def actions(self):
-        return self.available_actions()
+        """
+        Cached result of :py:meth:`available_actions`. It's only rebuilt when :py:meth:`actions_key` changes
+        or after :py:meth:`invalidate_actions`. The returned list is shared, don't modify it.
+        """
+        key = self.actions_key()
+        cache = self._actions_cache
+        if cache is None or cache[0] != key:
+            cache = self._actions_cache = (key, self.available_actions())
+        return cache[1]
 
     @actions.setter
     def actions(self, action):
         raise AttributeError("Do not directly set value. If you are sure of what you're doing override "
                              "@actions.setter in subclass.")
 
+    def actions_key(self) -> tuple:
+        """
+        Returns what :py:meth:`available_actions` depends on: the game state, the entity class and its status list.
+        Override it adding to ``super().actions_key()`` if your actions depend on anything else.
+        """
+        return self.game.state if self.game else None, type(self), tuple(self.status_list)
+
+    def invalidate_actions(self):
+        """ Forces :py:attr:`actions` to be rebuilt on the next read. """
+        self._actions_cache = None
+
+    def apply_effect(self, effect):
+        """
+        Applies a :py:class:`turnable.effects.StatusEffect` to this entity through the game's
+        :py:attr:`turnable.game.Game.effects` and returns the active effect.
+        """
+        return self.game.effects.apply(self, effect)
+
+    @property
+    def effects(self) -> list:
+        """ Active :py:class:`turnable.effects.StatusEffect` on this entity. """
+        return self.game.effects.effects_of(self)
+
     def handle_attack(self, resp: CommandResponse):
         """
         Handles attack from :py:class:`turnable.streams.CommandResponse`.
@@ -97,17 +240,29 @@ class Entity(HealthyEntity):
         """
         self.attack()
 
+    async def handle_attack_async(self, resp: CommandResponse):
+        """ Asynchronous variant of :py:meth:`~handle_attack`, used by :py:meth:`~play_turn_async`. """
+        await self._call_async('attack')
+
     def attack(self):
         """ Deals damage equal to :py:attr:`~damage` to all enemies targetted by :py:meth:`~target_attack`. """
-        enemies = self.target_attack(self.game.room.enemies)
+        self._hit(self.target_attack(self.game.room.enemies))
+
+    async def attack_async(self):
+        """ Asynchronous variant of :py:meth:`~attack`. """
+        self._hit(await self._call_async('target_attack', self.game.room.enemies))
+
+    def _hit(self, enemies):
+        """ Deals damage to the targetted *enemies*. """
         if type(enemies) != list:
             enemies = [enemies]
 
         if CharacterStatus.STUNNED not in self.status_list \
                 and self.game.state == States.IN_FIGHT:
-            for enemy in enemies:
-                enemy.take_damage(self.damage)
-                self._logger.debug(f'ATT - {self} to {enemy}.')
+            take_damage_many(enemies, self.damage)
+            if COMBAT.debug:
+                for enemy in enemies:
+                    COMBAT.emit(logging.DEBUG, 'attack', self.name, enemy.name)
 
     def target_attack(self, enemies):
         """ This method is called first in :py:meth:`~attack` to target enemies. """
@@ -118,7 +273,7 @@ class Entity(HealthyEntity):
         This method defines what action is the Entity playing in it's turn.
 
         For a Playable character you might request the input to the user, whilst
-        for an AI character you'd run some algorithm (or random.randint() :D)
+        for an AI character you'd run some algorithm (or self.game.rng.randint() :D)
         """
         raise NotImplementedError('This should be implemented in subclasses.')
 
@@ -149,6 +304,40 @@ class Entity(HealthyEntity):
         action = resp.command
         getattr(self, action.method)(resp)
 
+    async def play_turn_async(self):
+        """
+        Asynchronous variant of :py:meth:`~play_turn`, used by :py:meth:`turnable.game.Game.start_async`.
+
+        Every step is resolved through its ``<name>_async`` variant when the class provides one (for example
+        :py:meth:`PlayableEntity.get_action_async`), otherwise the synchronous method is called and its
+        result awaited if it's awaitable. This way ``async def`` handlers can be used as actions.
+        """
+        if self.TURN_START_HOOK:
+            await self.game.trigger_hook_async(self.TURN_START_HOOK)
+
+        resp = await self._call_async('get_action')
+        while resp.is_special:
+            await self._act_on_response_async(resp)
+            resp = await self._call_async('get_action')
+
+        await self._act_on_response_async(resp)
+        if self.TURN_END_HOOK:
+            await self.game.trigger_hook_async(self.TURN_END_HOOK)
+
+    async def _act_on_response_async(self, resp):
+        """ Asynchronous variant of :py:meth:`~_act_on_response`. """
+        await self._call_async(resp.command.method, resp)
+
+    async def _call_async(self, name: str, *args):
+        """ Calls method *name* or its asynchronous variant and returns the awaited result. """
+        method = _resolve_async(type(self), name)
+        if method is not None:
+            return await method(self, *args)
+        result = getattr(self, name)(*args)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
     def available_actions(self):
         """
         Returns actions available to the player.
@@ -175,6 +364,10 @@ class PlayableEntity(Entity):
 
     Entity that represents a human player.
     """
+    __slots__ = ()
+
+    BASE_INITIATIVE = 10
+
     def available_actions(self):
         """ Adds move action as a Playable character should be able to move between rooms. """
         actions = super().available_actions()
@@ -187,12 +380,20 @@ class PlayableEntity(Entity):
 
     def get_action(self) -> CommandResponse:
         """ Sends out the request for the next move and retries if command is invalid. """
-        req = CommandRequest('Enter action: ', self.actions, self.game.inputstream)
+        req = CommandRequest('Enter action: ', self.actions, self.game.inputstream, self.game)
         resp = req.send()
         while not resp or not resp.command:
             resp = req.send(True)
         return resp
 
+    async def get_action_async(self) -> CommandResponse:
+        """ Asynchronous variant of :py:meth:`~get_action`. """
+        req = CommandRequest('Enter action: ', self.actions, self.game.inputstream, self.game)
+        resp = await req.send_async()
+        while not resp or not resp.command:
+            resp = await req.send_async(True)
+        return resp
+
     def handle_help(self, resp: CommandResponse):
         self._logger.debug('Actions:')
         for cmd in self.actions:
@@ -207,40 +408,74 @@ class PlayableEntity(Entity):
 
         For other example see :py:meth:`~handle_attack`.
         """
-        self._logger.debug('Handling move')
-        hasdir = len(resp.command.matched) == 1
-        delta = parse_directions(resp.command.matched[0]) if hasdir else None
+        hasdir = len(resp.matched) == 1
+        delta = parse_directions(resp.matched[0]) if hasdir else None
+        while not delta:
+            res = self._direction_request().send()
+            dir_ = res.matched[0] if res.matched else None
+            delta = parse_directions(dir_)
+        return self.move(delta, True)
+
+    async def handle_move_async(self, resp: CommandResponse) -> bool:
+        """ Asynchronous variant of :py:meth:`~handle_move`. """
+        hasdir = len(resp.matched) == 1
+        delta = parse_directions(resp.matched[0]) if hasdir else None
         while not delta:
-            dir_cmd = Command('(UP|DOWN|LEFT|RIGHT)', 'Direction')
-            req = CommandRequest('Enter direction: ', [dir_cmd], self.game.inputstream)
-            res = req.send()
-            dir_ = res.command.matched[0] if res.command.matched else None
+            res = await self._direction_request().send_async()
+            dir_ = res.matched[0] if res.matched else None
             delta = parse_directions(dir_)
         return self.move(delta, True)
 
+    def _direction_request(self) -> CommandRequest:
+        dir_cmd = Command('(UP|DOWN|LEFT|RIGHT)', 'Direction')
+        return CommandRequest('Enter direction: ', [dir_cmd], self.game.inputstream, self.game)
+
+    def _target_request(self, amount: int) -> CommandRequest:
+        target_cmd = Command('([0-9]+)', 'Target')
+        return CommandRequest(f'Select target (1-{amount}): ', [target_cmd], self.game.inputstream, self.game)
+
     def move(self, newpos: Position, delta: bool = True) -> bool:
         """ Tries to move character to new position. If delta is True the position
          will be added; otherwise it'll be replaced. """
         tmppos = self.pos + newpos if delta else newpos
         if self.game.map.is_valid(tmppos):
-            self._logger.debug(f'Moving {self} to {tmppos}.')
+            if MOVEMENT.debug:
+                MOVEMENT.emit(logging.DEBUG, 'move', self.name, _xy(self.pos), _xy(tmppos))
+            index = game_index(self.game)
+            if index is not None and self is self.game.player:
+                index.place('player', tmppos.x, tmppos.y)
             self.pos = tmppos
             return True
-        self._logger.debug(f'{self} couldn\'t move to {self.pos}')
+        if MOVEMENT.debug:
+            MOVEMENT.emit(logging.DEBUG, 'blocked', self.name, _xy(self.pos), _xy(tmppos))
         return False
 
     def target_attack(self, enemies):
-        """ Ask player for target. """
+        """ Ask player for target through the game :py:attr:`inputstream`. """
+        if len(enemies) == 1:
+            return enemies[0]
+        req = self._target_request(len(enemies))
         target = None
+        while target is None or target > len(enemies) or target <= 0:
+            res = req.send(target is not None)
+            target = int(res.matched[0]) if res.command else 0
+        return enemies[target - 1]
+
+    async def target_attack_async(self, enemies):
+        """ Asynchronous variant of :py:meth:`~target_attack`. """
         if len(enemies) == 1:
             return enemies[0]
+        req = self._target_request(len(enemies))
+        target = None
         while target is None or target > len(enemies) or target <= 0:
-            target = int(input(f'Select target (1-{len(enemies)}).'))
+            res = await req.send_async(target is not None)
+            target = int(res.matched[0]) if res.command else 0
         return enemies[target - 1]
 
 
 class AIEntity(Entity):
     """ For now it can only attack. """
+    __slots__ = ()
 
     def __init__(self, *args, **kwargs):
         kwargs.setdefault('health', 20)
@@ -252,25 +487,20 @@ class AIEntity(Entity):
         return CommandResponse(req, 'atk')
 
     def target_attack(self, enemies):
-        self._logger.debug('AIEntity ATTACKING')
+        if COMBAT.debug:
+            COMBAT.emit(logging.DEBUG, 'target', self.name, self.game.player.name)
         return self.game.player
 
 
 class Soldier(PlayableEntity):
-    """ Deals single target damage. """
-
-    def target_attack(self, enemies):
-        """ Ask player for target. """
-        target = None
-        if len(enemies) == 1:
-            return enemies[0]
-        while target is None or target > len(enemies) or target <= 0:
-            target = int(input(f'Select target (1-{len(enemies)}.'))
-        return enemies[target - 1]
+    """ Deals single target damage. Targets are requested as in :py:meth:`PlayableEntity.target_attack`. """
+    __slots__ = ()
 
 
 class Mage(PlayableEntity):
     """ Mage class. Deals damage in area. """
+    __slots__ = ('max_targets',)
+
     BASE_MAX_TARGETS = 2
     BASE_DAMAGE = 5
 
@@ -278,15 +508,78 @@ class Mage(PlayableEntity):
                  *args,
                  max_targets: int = BASE_MAX_TARGETS,
                  **kwargs):
-        super().__init__()
+        super().__init__(*args, **kwargs)
         self.max_targets = max_targets
 
     def target_attack(self, enemies):
-        """ Selects :py:attr:`max_targets` targets randomly. """
-        choices = []
-        while len(choices) < self.max_targets:
-            c = random.randint(0, len(enemies) - 1)
-            if c not in choices:
-                choices.append(c)
-
-        return [enemies[c] for c in choices]
+        """ Selects up to :py:attr:`max_targets` targets randomly. """
+        return self.game.rng.sample(enemies, min(self.max_targets, len(enemies)))
+
+
+class MCTSEntity(PlayableEntity):
+    """
+    Playable character that makes its own decisions with :py:class:`turnable.search.MCTSSearch` instead of
+    asking the input stream, for bots and computer controlled players.
+
+    The search is configured with :py:attr:`SEARCH_BUDGET` (seconds per decision), :py:attr:`SEARCH_ROLLOUTS`,
+    :py:attr:`SEARCH_DEPTH` and :py:attr:`SEARCH_WORKERS`. The last :py:class:`turnable.search.SearchResult`
+    is available as :py:attr:`last_search`.
+
+    Decisions are recorded in the :py:attr:`turnable.game.Game.journal` like the inputs of other players, and
+    replays of the journal read them back instead of searching again.
+    """
+    __slots__ = ('_policy',)
+
+    SEARCH_BUDGET = 0.05
+    SEARCH_ROLLOUTS = None
+    SEARCH_DEPTH = 8
+    SEARCH_WORKERS = 0
+
+    @property
+    def policy(self):
+        """ The :py:class:`turnable.search.MCTSPolicy` deciding for this entity, created on first use. """
+        policy = getattr(self, '_policy', None)
+        if policy is None:
+            from turnable.search import MCTSPolicy, MCTSSearch
+            policy = self._policy = MCTSPolicy(MCTSSearch(budget=self.SEARCH_BUDGET,
+                                                          max_rollouts=self.SEARCH_ROLLOUTS,
+                                                          depth=self.SEARCH_DEPTH,
+                                                          workers=self.SEARCH_WORKERS))
+        return policy
+
+    @property
+    def last_search(self):
+        return self.policy.last_result
+
+    def _in_rollout(self) -> bool:
+        """ Inside a rollout decisions come from the rollout input stream, like for any other player. """
+        from turnable.search import RolloutInputStream
+        return isinstance(self.game.inputstream, RolloutInputStream)
+
+    def _decide(self, req: CommandRequest) -> CommandResponse:
+        """
+        Answers *req* with :py:attr:`policy` and records the answer in the game journal, if any. When the game
+        is replaying a journal the answer is read from it instead, so the search doesn't run again.
+        """
+        from turnable.journal import ReplayInputStream
+        game = self.game
+        if isinstance(game.inputstream, ReplayInputStream):
+            return req.send()
+        journal = game.journal
+        rng_state = journal.rng_state(game) if journal is not None else None
+        resp = CommandResponse(req, self.policy(game, req))
+        if journal is not None:
+            journal.record_input(game, resp, rng_state)
+        return resp
+
+    def get_action(self) -> CommandResponse:
+        if self._in_rollout():
+            return super().get_action()
+        return self._decide(CommandRequest('Enter action: ', self.actions, self.game.inputstream, self.game))
+
+    def target_attack(self, enemies):
+        if self._in_rollout() or len(enemies) == 1:
+            return super().target_attack(enemies)
+        answer = self._decide(self._target_request(len(enemies))).rawdata
+        target = int(answer) if answer.isdigit() else 1
+        return enemies[min(max(target, 1), len(enemies)) - 1]
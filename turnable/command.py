@@ -1,23 +1,80 @@
-from typing import Optional, Any
+from functools import lru_cache
+from typing import Optional, Any, Sequence, Tuple
 import re
 
+# Numeric backreference (``\1``) not preceded by an escaped backslash.
+_BACKREFERENCE = re.compile(r'(?<!\\)(?:\\\\)*\\[1-9]')
+
 
 class Command:
+    __slots__ = ('tag', 'help', 'method', 'owner')
+
     def __init__(self, tag: str, help: str, method: Optional[str] = None, owner: Optional[object] = None):
         """
-        Tag can be a regex and matched groups will be saved into :py:attr:`self.matched`.
-        For example, the tag ``MOV(UP|DOWN|LEFT|RIGHT)`` will match
+        Tag can be a regex and matched groups will be available in :py:attr:`turnable.streams.CommandResponse.matched`.
+        For example, the tag ``MOV(UP|DOWN|LEFT|RIGHT)`` will match ``MOVUP`` with ``('UP',)`` as matched groups.
         """
         self.tag = tag
         self.help = help
         self.method = method
         self.owner = owner
-        self.matched = None
 
-    def is_valid_input(self, input_):
-        m = re.match(self.tag, input_.upper())
-        if m:
-            self.matched = m.groups()
-            return True
-        return False
+    def is_valid_input(self, input_: str) -> bool:
+        """
+        Returns whether *input_* matches the tag. Commands are shared, so the matched groups aren't kept;
+        use :py:meth:`turnable.streams.CommandRequest.match` to get them.
+        """
+        return get_dispatcher((self.tag,)).match(input_)[0] is not None
+
+
+class CommandDispatcher:
+    """
+    Resolves input against many command tags in a single pass.
+
+    All tags are merged into one precompiled alternation, tried in order just like matching every tag
+    one after the other. Dispatchers only depend on the tags, so they are shared between requests
+    through :py:func:`get_dispatcher` and hold no per-match state.
+    """
+
+    def __init__(self, tags: Sequence[str]):
+        self.tags = tuple(tags)
+        self.layout = {}
+        self.patterns = None
+        parts = []
+        group = 1
+        for ix, tag in enumerate(self.tags):
+            inner = re.compile(tag).groups
+            self.layout[group] = (ix, group + 1, group + 1 + inner)
+            parts.append(f'({tag})')
+            group += inner + 1
+        try:
+            if any(_BACKREFERENCE.search(tag) for tag in self.tags):
+                # Merging renumbers the groups, so numeric backreferences would point to other groups.
+                raise re.error('numeric backreference')
+            self.pattern = re.compile('|'.join(parts)) if parts else None
+        except re.error:
+            # Tags using repeated group names or backreferences can't be merged, match them one by one.
+            self.pattern = None
+            self.patterns = [re.compile(tag) for tag in self.tags]
+
+    def match(self, input_: str) -> Tuple[Optional[int], tuple]:
+        """ Returns the index of the first tag matching *input_* and its matched groups, or ``(None, ())``. """
+        input_ = input_.upper()
+        if self.patterns is not None:
+            for ix, pattern in enumerate(self.patterns):
+                m = pattern.match(input_)
+                if m:
+                    return ix, m.groups()
+            return None, ()
+
+        m = self.pattern.match(input_) if self.pattern else None
+        if not m:
+            return None, ()
+        ix, start, end = self.layout[m.lastindex]
+        return ix, m.groups()[start - 1:end - 1]
+
 
+@lru_cache(maxsize=256)
+def get_dispatcher(tags: Tuple[str, ...]) -> CommandDispatcher:
+    """ Returns a cached :py:class:`CommandDispatcher` for *tags*. """
+    return CommandDispatcher(tags)
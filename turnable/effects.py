@@ -0,0 +1,297 @@
+"""
+Status effects
+--------------
+
+Status effects are things that happen to an entity over several turns, such as poison. Subclass
+:py:class:`StatusEffect` (or :py:class:`DamageOverTime` for effects that deal damage) and apply it with
+:py:meth:`turnable.chars.Entity.apply_effect`: ::
+
+    class Bleeding(DamageOverTime):
+        DAMAGE = 2
+        DURATION = 4
+
+    enemy.apply_effect(Bleeding())
+
+An effect ticks every :py:attr:`StatusEffect.PERIOD` turns until its :py:attr:`StatusEffect.DURATION` runs out,
+and adds its :py:attr:`StatusEffect.STATUS` to the entity's ``status_list`` while it's active. Applying an
+effect to an entity that already has one of the same class follows :py:attr:`StatusEffect.STACKING`.
+
+Effects are kept by the game's :py:class:`EffectScheduler`, a timing wheel of turns: at the start of every turn
+the effects due that turn are processed in a single pass, so the cost only depends on the effects that tick.
+"""
+import copy
+import heapq
+import logging
+
+from collections import defaultdict
+from itertools import count
+from typing import Any, Dict, List, Optional, Tuple
+
+from turnable.chars import CharacterStatus, Entity, take_damage_many
+from turnable.events import EFFECTS
+
+
+EFFECTS.define('applied', '{0} applied to {1}')
+EFFECTS.define('expired', '{0} on {1} expired')
+
+
+class StatusEffect:
+    """
+    Base status effect. Override :py:meth:`on_apply`, :py:meth:`on_tick` and :py:meth:`on_expire`
+    to give it behaviour.
+
+    :py:attr:`STACKING` is one of:
+
+    * ``'refresh'``: the duration is reset.
+    * ``'extend'``: the new duration is added to the remaining one.
+    * ``'intensity'``: a stack is added, up to :py:attr:`MAX_STACKS`, and the duration is reset.
+    * ``'independent'``: both effects are kept and tick separately.
+    """
+    STATUS: Optional[CharacterStatus] = None
+    DURATION = 1
+    PERIOD = 1
+    STACKING = 'refresh'
+    MAX_STACKS = 1
+
+    def __init__(self, duration: Optional[int] = None):
+        self.duration = duration if duration is not None else self.DURATION
+        self.remaining = self.duration
+        self.stacks = 1
+        self.target = None
+        self.active = False
+        self.next_tick = None
+
+    def on_apply(self, game):
+        """ Called when the effect is first applied to :py:attr:`target`. """
+        pass
+
+    def on_tick(self, game):
+        """ Called every :py:attr:`PERIOD` turns while the effect is active. """
+        pass
+
+    def on_expire(self, game):
+        """ Called when the effect runs out, is removed or its target dies. """
+        pass
+
+    def tick_damage(self) -> int:
+        """ Damage dealt to :py:attr:`target` on every tick. Damage of all due effects is applied in batches. """
+        return 0
+
+    def stack(self, other: 'StatusEffect'):
+        """ Merges a newly applied effect of the same class into this one, following :py:attr:`STACKING`. """
+        if self.STACKING == 'extend':
+            self.remaining += other.duration
+        elif self.STACKING == 'intensity':
+            self.stacks = min(self.MAX_STACKS, self.stacks + other.stacks)
+            self.remaining = max(self.remaining, other.duration)
+        else:
+            self.remaining = max(self.remaining, other.duration)
+
+    def __str__(self):
+        return f'{type(self).__name__}(remaining={self.remaining}, stacks={self.stacks})'
+
+
+class DamageOverTime(StatusEffect):
+    """ Deals :py:attr:`damage` (defaults to :py:attr:`DAMAGE`) per stack on every tick. """
+    DAMAGE = 1
+
+    def __init__(self, duration: Optional[int] = None, damage: Optional[int] = None):
+        super().__init__(duration)
+        self.damage = damage if damage is not None else self.DAMAGE
+
+    def tick_damage(self) -> int:
+        return self.damage * self.stacks
+
+
+class Poison(DamageOverTime):
+    """ Poison stacks increasing its duration. """
+    STATUS = CharacterStatus.POISONED
+    DAMAGE = 3
+    DURATION = 2
+    STACKING = 'extend'
+
+
+class Burning(DamageOverTime):
+    """ Burns for a few turns, stacking intensity. """
+    STATUS = CharacterStatus.ONFIRE
+    DAMAGE = 2
+    DURATION = 3
+    STACKING = 'intensity'
+    MAX_STACKS = 3
+
+
+class Stun(StatusEffect):
+    """ Stunned entities can't deal damage. """
+    STATUS = CharacterStatus.STUNNED
+
+
+class EffectScheduler:
+    """
+    Keeps the active :py:class:`StatusEffect` of a game in a timing wheel of :py:attr:`WHEEL_SIZE` turns.
+    Effects due further away wait in a heap until they get into the wheel's range.
+    """
+    WHEEL_SIZE = 64
+
+    def __init__(self, game):
+        self.game = game
+        self.clear()
+
+    def clear(self):
+        """ Drops every effect without calling :py:meth:`StatusEffect.on_expire`. """
+        self.turn = self.game.turn if self.game is not None else 0
+        self.wheel = [[] for _ in range(self.WHEEL_SIZE)]
+        self.overflow = []
+        self._seq = count()
+        self._by_target: Dict[Entity, List[StatusEffect]] = defaultdict(list)
+
+    def apply(self, target: Entity, effect: StatusEffect) -> StatusEffect:
+        """
+        Applies *effect* to *target* and returns the active effect, which is an existing effect of the same class
+        when they stack.
+        """
+        if effect.STACKING != 'independent':
+            for active in self._by_target.get(target, ()):
+                if type(active) is type(effect):
+                    active.stack(effect)
+                    return active
+
+        effect.target = target
+        effect.active = True
+        self._by_target[target].append(effect)
+        if effect.STATUS is not None and effect.STATUS not in target.status_list:
+            target.status_list.append(effect.STATUS)
+        effect.on_apply(self.game)
+        self._schedule(effect, self.turn + effect.PERIOD)
+        if EFFECTS.debug:
+            EFFECTS.emit(logging.DEBUG, 'applied', type(effect).__name__, getattr(target, 'name', None))
+        return effect
+
+    def remove(self, effect: StatusEffect):
+        """ Ends *effect* before it runs out. """
+        if effect.active:
+            self._expire(effect)
+
+    def effects_of(self, target: Entity) -> List[StatusEffect]:
+        return list(self._by_target.get(target, ()))
+
+    def active(self) -> List[StatusEffect]:
+        """ Returns every active effect. """
+        return [effect for effects in self._by_target.values() for effect in effects]
+
+    def _schedule(self, effect: StatusEffect, due: int):
+        effect.next_tick = due
+        if due - self.turn < self.WHEEL_SIZE:
+            self.wheel[due % self.WHEEL_SIZE].append(effect)
+        else:
+            heapq.heappush(self.overflow, (due, next(self._seq), effect))
+
+    def advance(self, turn: int):
+        """ Processes the effects due in every turn up to *turn*. """
+        while self.turn < turn:
+            self.turn += 1
+            self._process(self.turn)
+
+    def _process(self, turn: int):
+        overflow = self.overflow
+        while overflow and overflow[0][0] - turn < self.WHEEL_SIZE:
+            due, _, effect = heapq.heappop(overflow)
+            self.wheel[due % self.WHEEL_SIZE].append(effect)
+
+        slot = turn % self.WHEEL_SIZE
+        bucket = self.wheel[slot]
+        if not bucket:
+            return
+        self.wheel[slot] = []
+
+        due = []
+        damage = defaultdict(dict)
+        for effect in bucket:
+            if not effect.active or effect.next_tick != turn:
+                continue
+            if not effect.target.is_alive():
+                self._expire(effect)
+                continue
+            due.append(effect)
+            amount = effect.tick_damage()
+            if amount:
+                # Batches can't hit the same target twice, split repeated targets in further batches.
+                batch = 0
+                while effect.target in damage[amount, batch]:
+                    batch += 1
+                damage[amount, batch][effect.target] = None
+
+        for (amount, _), targets in damage.items():
+            take_damage_many(list(targets), amount)
+
+        for effect in due:
+            effect.on_tick(self.game)
+            effect.remaining -= effect.PERIOD
+            if effect.remaining > 0 and effect.active:
+                self._schedule(effect, turn + effect.PERIOD)
+            elif effect.active:
+                self._expire(effect)
+
+    def _expire(self, effect: StatusEffect):
+        effect.active = False
+        target = effect.target
+        effects = self._by_target.get(target)
+        if effects is not None:
+            effects.remove(effect)
+            if not effects:
+                del self._by_target[target]
+        status = effect.STATUS
+        if status is not None and status in target.status_list \
+                and not any(other.STATUS == status for other in self._by_target.get(target, ())):
+            target.status_list.remove(status)
+        effect.on_expire(self.game)
+        if EFFECTS.debug:
+            EFFECTS.emit(logging.DEBUG, 'expired', type(effect).__name__, getattr(target, 'name', None))
+
+    def locate(self) -> List[Tuple[StatusEffect, Any]]:
+        """
+        Returns every active effect with the location of its target: ``None`` for the player, or the position of
+        its room and its index among the room's enemies. Effects whose target is in no room are left out.
+        """
+        located = []
+        for target, effects in self._by_target.items():
+            location = _locate(self.game, target)
+            if location is not False:
+                located.extend((effect, location) for effect in effects)
+        return located
+
+    def relocate(self, located: List[Tuple[StatusEffect, Any]], game=None) -> 'EffectScheduler':
+        """
+        Rebuilds the scheduler of *game* (defaults to this one's) from effects returned by :py:meth:`locate`,
+        pointing them to the entities now found at their locations. Effects are copied for other games.
+        """
+        game = game if game is not None else self.game
+        scheduler = self if game is self.game else EffectScheduler(game)
+        turn = self.turn
+        pending = [(effect.next_tick, effect, location) for effect, location in located]
+        scheduler.clear()
+        scheduler.turn = turn
+        for next_tick, effect, location in pending:
+            if scheduler is not self:
+                effect = copy.copy(effect)
+            effect.target = _resolve(game, location)
+            effect.active = True
+            scheduler._by_target[effect.target].append(effect)
+            scheduler._schedule(effect, next_tick)
+        return scheduler
+
+
+def _locate(game, entity: Entity):
+    if entity is game.player:
+        return None
+    room = game.map.get_room(entity.pos) if entity.pos is not None else None
+    for ix, enemy in enumerate(getattr(room, 'enemies', ())):
+        if enemy is entity:
+            return entity.pos, ix
+    return False
+
+
+def _resolve(game, location) -> Entity:
+    if location is None:
+        return game.player
+    pos, ix = location
+    return game.map.get_room(pos).enemies[ix]
@@ -0,0 +1,160 @@
+"""
+Structured events
+-----------------
+
+The hot paths of the game (damage, attacks, movement, status effects) report what happens as events instead
+of log messages. An event is a ``(time_ns, level, category, name, args)`` tuple holding the raw values
+(names, amounts, coordinates), recorded into the ring buffer of :py:data:`EVENTS`. Events are only formatted
+when they are read, and call sites check a flag of their :py:class:`Category` first, so nothing at all is built
+for disabled categories or levels, which is the default: ::
+
+    if COMBAT.debug:
+        COMBAT.emit(logging.DEBUG, 'damage', self.name, damage)
+
+Enable categories (``combat``, ``movement``, ``entities`` and ``effects``) and read the events back: ::
+
+    from turnable.events import EVENTS
+
+    EVENTS.enable('combat', 'movement')
+    game.start()
+    print('\\n'.join(EVENTS.format()))
+    EVENTS.export_jsonl('events.jsonl')
+
+Set :py:attr:`EventLog.jsonl` to a text file to also write every event as a JSON line as it's recorded, and
+:py:attr:`EventLog.logger` to a :py:class:`logging.Logger` to forward events to :py:mod:`logging`, where they
+are formatted only if a handler emits them.
+"""
+import json
+import time
+import logging
+
+from typing import IO, Dict, Iterable, List, Optional, Tuple, Union
+
+from turnable.tracing import RingBuffer
+
+DISABLED = logging.CRITICAL + 10
+
+Event = Tuple[int, int, str, str, tuple]
+
+
+class Category:
+    """
+    Events of one kind, enabled from a minimum level. :py:attr:`debug`, :py:attr:`info` and :py:attr:`warning`
+    tell whether events of that level are recorded.
+    """
+    __slots__ = ('log', 'name', 'level', 'debug', 'info', 'warning')
+
+    def __init__(self, log: 'EventLog', name: str):
+        self.log = log
+        self.name = name
+        self.set_level(DISABLED)
+
+    def set_level(self, level: int):
+        self.level = level
+        self.debug = level <= logging.DEBUG
+        self.info = level <= logging.INFO
+        self.warning = level <= logging.WARNING
+
+    def emit(self, level: int, name: str, *args):
+        """ Records the event *name* with *args*. Callers check that *level* is enabled first. """
+        self.log.record(level, self.name, name, args)
+
+    def define(self, name: str, template: str):
+        """ Sets the :py:meth:`str.format` template of the event *name*, which receives its args. """
+        self.log.formats[self.name, name] = template
+
+
+class EventLog:
+    """ Keeps the last *capacity* events and the :py:class:`Category` objects that record into it. """
+
+    def __init__(self, capacity: int = 65536, clock=time.perf_counter_ns):
+        self.clock = clock
+        self.events = RingBuffer(capacity)
+        self.categories: Dict[str, Category] = {}
+        self.formats: Dict[Tuple[str, str], str] = {}
+        self.jsonl: Optional[IO[str]] = None
+        self.logger: Optional[logging.Logger] = None
+
+    def category(self, name: str) -> Category:
+        """ Returns the category *name*, creating it disabled if needed. """
+        category = self.categories.get(name)
+        if category is None:
+            category = self.categories[name] = Category(self, name)
+        return category
+
+    def enable(self, *names: str, level: int = logging.DEBUG):
+        """ Records events of *level* or above of the categories *names*, by default of every category. """
+        for name in names or tuple(self.categories):
+            self.category(name).set_level(level)
+
+    def disable(self, *names: str):
+        """ Stops recording the categories *names*, by default every category. """
+        self.enable(*names, level=DISABLED)
+
+    def record(self, level: int, category: str, name: str, args: tuple):
+        event = (self.clock(), level, category, name, args)
+        self.events.append(event)
+        if self.jsonl is not None:
+            self.jsonl.write(json.dumps(self.as_dict(event), default=str) + '\n')
+        if self.logger is not None:
+            self.logger.log(level, '%s', _Formatted(self, event))
+
+    @property
+    def dropped(self) -> int:
+        """ Events dropped from the buffer to make room for newer ones. """
+        return self.events.dropped
+
+    def clear(self):
+        self.events.clear()
+
+    def message(self, event: Event) -> str:
+        """ Returns the message of *event*, with the template of its :py:meth:`Category.define`, if any. """
+        _, _, category, name, args = event
+        template = self.formats.get((category, name))
+        if template is not None:
+            return template.format(*args)
+        return ' '.join(map(str, (name,) + args))
+
+    def format_event(self, event: Event) -> str:
+        """ Returns the level, category and message of *event*. """
+        return f'{logging.getLevelName(event[1])} {event[2]}: {self.message(event)}'
+
+    def format(self, events: Optional[Iterable[Event]] = None) -> List[str]:
+        """ Formats *events*, by default the recorded ones. """
+        return [self.format_event(event) for event in (self.events if events is None else events)]
+
+    @staticmethod
+    def as_dict(event: Event) -> dict:
+        time_ns, level, category, name, args = event
+        return {
+            'time_ns': time_ns,
+            'level': logging.getLevelName(level),
+            'category': category,
+            'name': name,
+            'args': list(args),
+        }
+
+    def export_jsonl(self, file: Union[str, IO[str]]):
+        """ Writes the recorded events as JSON lines to *file*, a path or a writable text file. """
+        self.events.export(file, lambda events: (json.dumps(self.as_dict(event), default=str) + '\n'
+                                                 for event in events))
+
+
+class _Formatted:
+    """ Formats an event when :py:mod:`logging` converts it to a string. """
+    __slots__ = ('log', 'event')
+
+    def __init__(self, log: EventLog, event: Event):
+        self.log = log
+        self.event = event
+
+    def __str__(self):
+        return self.log.message(self.event)
+
+
+EVENTS = EventLog()
+
+COMBAT = EVENTS.category('combat')
+MOVEMENT = EVENTS.category('movement')
+ENTITIES = EVENTS.category('entities')
+EFFECTS = EVENTS.category('effects')
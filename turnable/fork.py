@@ -0,0 +1,127 @@
+"""
+Copy-on-access forking of games, for lookahead search and other what-if simulations.
+
+:py:meth:`turnable.game.Game.fork` returns a child game that shares the map grid and the rooms of its parent.
+Rooms are never modified while shared: after a fork both games read rooms through a :py:class:`RoomOverlay`,
+which copies a room (and its enemies) into the game's own layer the first time the game reaches it.
+Forking is O(1) in the size of the map, and a branch pays only for the rooms it actually visits. ::
+
+    branch = game.fork(inputstream=my_bot_stream)
+    branch.play_turns()
+
+.. note::
+    Rooms are copied when accessed through :py:meth:`turnable.map.Map.get_room`; keep using it (or
+    ``game.room``) rather than holding room or enemy references across forks. Hooks are copied to the child
+    as they are, so hooks that captured entities of the parent will still act on the parent's entities.
+    Status effects are moved to the copies of their entities in both games. The parent keeps its current
+    room (and enemies) as they are, so a game can be forked in the middle of a turn.
+"""
+import copy
+import random
+
+from typing import Any, Dict, Tuple
+
+
+def copy_entity(entity, game):
+    """ Returns a shallow copy of *entity* attached to *game*. """
+    new = copy.copy(entity)
+    new.game = game
+    new.status_list = list(entity.status_list)
+    new.invalidate_actions()
+    return new
+
+
+def copy_room(room, game):
+    """ Returns a shallow copy of *room* attached to *game*, with copies of its enemies. """
+    new = copy.copy(room)
+    new.game = game
+    if hasattr(room, 'enemies'):
+        new.enemies = [copy_entity(enemy, game) for enemy in room.enemies]
+    if getattr(room, 'scheduler', None) is not None:
+        # The turn order is rebuilt for the copied entities, from the time of their next action.
+        new.scheduler = None
+    store = getattr(room, 'store', None)
+    if store is not None:
+        new.store = store.copy()
+        for enemy in new.enemies:
+            if enemy._store is store:
+                enemy._store = new.store
+    return new
+
+
+class RoomOverlay:
+    """
+    Layers of rooms on top of a map grid that is no longer modified.
+
+    :py:attr:`local` holds the rooms owned by one map. :py:attr:`frozen` is a tuple of layers shared with
+    other forks, newest first, whose rooms are only read and copied. Rooms in none of them are taken from the
+    grid with :py:meth:`turnable.map.Map.peek_room`.
+    """
+    MAX_LAYERS = 16
+
+    def __init__(self, frozen: Tuple[Dict[Tuple[int, int], Any], ...] = ()):
+        self.frozen = frozen
+        self.local = {}
+
+    def get(self, map_, pos):
+        """ Returns the room of *map_* at *pos*, copying it into :py:attr:`local` on first access. """
+        key = (pos.x, pos.y)
+        room = self.local.get(key)
+        if room is not None:
+            return room
+
+        for layer in self.frozen:
+            room = layer.get(key)
+            if room is not None:
+                room = copy_room(room, map_.game)
+                break
+        else:
+            room, shared = map_.peek_room(pos, map_.game)
+            if shared:
+                room = copy_room(room, map_.game)
+        self.local[key] = room
+        return room
+
+    def fork(self) -> 'RoomOverlay':
+        """ Freezes :py:attr:`local` into a shared layer and returns an overlay for a new fork. """
+        if self.local:
+            self.frozen = (self.local,) + self.frozen
+            self.local = {}
+            if len(self.frozen) > self.MAX_LAYERS:
+                merged = {}
+                for layer in reversed(self.frozen):
+                    merged.update(layer)
+                self.frozen = (merged,)
+        return RoomOverlay(self.frozen)
+
+    def keep(self, room):
+        """ Puts *room* back into :py:attr:`local`, so it's used as it is after a fork instead of copied. """
+        self.local[(room.pos.x, room.pos.y)] = room
+
+
+def fork_game(game, inputstream=None, outputstream=None):
+    """ Returns a child of *game*. See :py:meth:`turnable.game.Game.fork`. """
+    child = copy.copy(game)
+    child.inputstream = inputstream if inputstream is not None else game.inputstream
+    child.outputstream = outputstream
+    child.tracer = None
+    child.journal = None
+    child._pending_hooks = None
+    child.hooks = game.hooks.copy()
+    if type(game.rng) is random.Random:
+        child.rng = random.Random()
+        child.rng.setstate(game.rng.getstate())
+    else:
+        child.rng = copy.deepcopy(game.rng)
+
+    child.player = copy_entity(game.player, child)
+    located = game.effects.locate()
+    child.map = game.map.fork(child)
+    if game.room is not None:
+        # The parent keeps its current room, which may be in the middle of a turn, and the child copies it
+        # right away since the parent goes on changing it.
+        game.map.overlay.keep(game.room)
+        child.room = child.map.get_room(game.room.pos)
+    game.effects.relocate(located)
+    child.effects = game.effects.relocate(located, child)
+    return child
@@ -3,16 +3,19 @@ The Game module contains the :py:class:`Game`, which is the core of any Turnable
 
 
 """
-import uuid
+import random
+import inspect
 import logging
 import hashlib
 
-from turnable.hooks import HookType
+from turnable.hooks import HookType, HookRegistry
 from turnable.map import Position, Map
 from turnable.rooms import BaseDangerRoom, FightRoom
 from turnable.chars import Entity, PlayableEntity
+from turnable.effects import EffectScheduler
 from turnable.state import States
 from turnable.streams import BaseInputStream, BaseOutputStream
+from turnable.tracing import NULL_SPAN, Tracer
 
 from typing import Any, Callable, Optional
 
@@ -36,6 +39,21 @@ class Game:
     *map_* receives an instance of :py:class:turnable.map.Map:
 
     *name* is not used meaningfully yet.
+
+    *rng* is the random generator used by the map, rooms and entities of this game. It defaults to
+    a new :py:class:`random.Random`, but any object with the same interface can be plugged in.
+    Every game owns its generator so games can run side by side and be reproduced from a seed.
+
+    Status effects applied to entities (see :py:mod:`turnable.effects`) are kept in :py:attr:`effects` and
+    processed at the start of every turn.
+
+    Set :py:attr:`tracer` to a :py:class:`turnable.tracing.Tracer` to record the time spent in every phase
+    of the game loop and in every hook, and :py:attr:`journal` to a :py:class:`turnable.journal.Journal` to
+    record the session so it can be replayed.
+
+    Games can also be played on an asyncio event loop with :py:meth:`start_async`, using
+    :py:class:`turnable.streams.AsyncBaseInputStream` and :py:class:`turnable.streams.AsyncBaseOutputStream`
+    (synchronous streams work too) and ``async def`` hooks.
     """
     logger = logging.getLogger('turnable.Game')
 
@@ -45,8 +63,10 @@ class Game:
                  map_: Map,
                  inputstream: BaseInputStream,
                  outputstream: Optional[BaseOutputStream],
-                 endgame_condition: Callable = endgame_player_dead):
+                 endgame_condition: Callable = endgame_player_dead,
+                 rng: Optional[random.Random] = None):
         self.name = name
+        self.rng = rng if rng is not None else random.Random()
         self.player = player
         self.map = map_
         self.map.game = self
@@ -54,12 +74,16 @@ class Game:
         self.outputstream = outputstream
         self.endgame_condition = endgame_condition
 
-        self.hooks = {}
+        self.hooks = HookRegistry()
         self.is_done = False
         self.state = None
         self.room = None
         self.advance_level = False
         self.turn = 0
+        self.effects = EffectScheduler(self)
+        self.tracer: Optional[Tracer] = None
+        self.journal = None
+        self._pending_hooks = None
 
     @property
     def player(self) -> PlayableEntity:
@@ -81,47 +105,122 @@ class Game:
         self.__map = map_
         self.__map.game = self
 
-    def add_hook(self, type_: HookType, callback: Callable[['Game'], Any]):
-        """ Adds a hook callback. The callback must accept a single :py:class:`Game` argument. """
-        typelist = self.hooks.setdefault(type_, {})
-        id = str(uuid.uuid4())
-        while id in typelist.keys():
-            id = str(uuid.uuid4())
-        self.hooks[type_][id] = callback
-
-    def remove_hook(self, type_: HookType, id: str):
-        if type_ in self.hooks.keys():
-            if self.hooks[type_].get(id):
-                self.hooks[type_][id] = None
-            else:
-                raise RuntimeError(f'No such hook {id}')
+    def add_hook(self, type_: HookType, callback: Callable[['Game', HookType, int], Any], priority: int = 0) -> int:
+        """
+        Adds a hook callback and returns its handle. The callback receives the :py:class:`Game`, the
+        :py:class:`HookType` and the hook handle. Hooks with lower *priority* run first.
+        """
+        return self.hooks.add(type_, callback, priority)
+
+    def remove_hook(self, type_: HookType, id: int):
+        """ Removes the hook with handle *id*. It's safe to call while hooks are being triggered. """
+        try:
+            self.hooks.remove(type_, id)
+        except KeyError:
+            raise RuntimeError(f'No such hook {id}')
 
     def trigger_hook(self, type_: HookType):
-        """ Executes hook passing a refence to the :py:class:`Game` object. """
-        hooks = self.hooks.get(type_) or {}
-        for id, hook in hooks.items():
-            if hook is not None:
-                hook(self, type_, id)
+        """
+        Executes hook passing a refence to the :py:class:`Game` object.
+
+        Asynchronous hooks triggered this way, from synchronous code such as :py:meth:`turnable.rooms.Room.start`,
+        are awaited by the async game loop right after the synchronous step returns.
+        """
+        if self.journal is not None:
+            self.journal.record_hook(self, type_)
+        pending = self.hooks.trigger(type_, self)
+        if pending:
+            if self._pending_hooks is None:
+                for awaitable in pending:
+                    if inspect.iscoroutine(awaitable):
+                        awaitable.close()
+                raise RuntimeError('Asynchronous hooks require the game to be started with Game.start_async')
+            self._pending_hooks.extend(pending)
+
+    async def trigger_hook_async(self, type_: HookType):
+        """ Executes hooks awaiting asynchronous ones. """
+        await self._run_pending_hooks()
+        if self.journal is not None:
+            self.journal.record_hook(self, type_)
+        await self.hooks.trigger_async(type_, self)
+
+    async def _run_pending_hooks(self):
+        """ Awaits asynchronous hooks triggered from synchronous code. """
+        while self._pending_hooks:
+            await self._pending_hooks.pop(0)
+
+    def span(self, name: str, category: str = 'phase'):
+        """ Returns a tracing span for *name*, or a no-op context manager if :py:attr:`tracer` is not set. """
+        if self.tracer is None:
+            return NULL_SPAN
+        return self.tracer.span(name, category)
+
+    def snapshot(self) -> bytes:
+        """ Returns a compact binary snapshot of the game state. See :py:mod:`turnable.snapshot`. """
+        from turnable.snapshot import dump_game
+        return dump_game(self)
+
+    def restore(self, data: bytes):
+        """
+        Restores a snapshot taken with :py:meth:`snapshot`, replacing the player, map, rooms and game state.
+        Hooks and streams of this game are kept.
+        """
+        from turnable.snapshot import load_game
+        load_game(self, data)
+
+    def fork(self, inputstream: Optional[BaseInputStream] = None, outputstream: Optional[BaseOutputStream] = None):
+        """
+        Returns a copy of the game that can be played independently, for example to look ahead in a search.
+
+        The map grid and rooms are shared with this game and only copied when a game reaches them (see
+        :py:mod:`turnable.fork`), so forking doesn't depend on the size of the map. The player, random generator
+        and hooks are copied. The child uses *inputstream* (defaults to this game's) and *outputstream*
+        (defaults to none).
+        """
+        from turnable.fork import fork_game
+        return fork_game(self, inputstream, outputstream)
 
     def start(self):
         """ Start game. """
         self.state = States.START
         self.is_done = False
         self.turn = 0
+        self.effects.clear()
+        if self.journal is not None:
+            self.journal.record_start(self)
         self.map.reset()
         self.main_loop()
 
+    def resume(self):
+        """
+        Continues a game restored with :py:meth:`restore` from the turn its snapshot was taken at, instead of
+        starting a new one.
+        """
+        with self.span('level_loop', 'loop'):
+            self._play_level()
+        if not self.is_done:
+            with self.span('map.next_level'):
+                self.map.next_level()
+            self._play_levels()
+        self.trigger_hook(HookType.GAME_END)
+
     def main_loop(self):
         """
         Handles the main loop of the game.
         While the game is not done it will keep advancing levels and calling :py:meth:`~level_loop`.
         """
         self.trigger_hook(HookType.GAME_START)
+        self._play_levels()
+        self.trigger_hook(HookType.GAME_END)
+
+    def _play_levels(self):
         while not self.is_done:
             self.player.move(Position(0, 0), False)
-            self.level_loop()
-            self.map.next_level()
-        self.trigger_hook(HookType.GAME_END)
+            with self.span('level_loop', 'loop'):
+                self.level_loop()
+            if not self.is_done:
+                with self.span('map.next_level'):
+                    self.map.next_level()
 
     def level_loop(self):
         """
@@ -131,10 +230,15 @@ class Game:
         # self.advance_level will be set to True on AdvanceLevelRoom.start()
         self.trigger_hook(HookType.LEVEL_START)
         self.advance_level = False
-        while not self.advance_level:
-            self.room = self.map.get_player_room()
+        self._play_level()
+
+    def _play_level(self):
+        while not self.advance_level and not self.is_done:
+            with self.span('map.get_player_room'):
+                self.room = self.map.get_player_room()
             self.notify_state()
-            self.play_turns()
+            with self.span('play_turns', 'loop'):
+                self.play_turns()
 
     def update_state(self):
         """ Automatically updates game state. """
@@ -146,15 +250,25 @@ class Game:
     def play_turns(self):
         """
         Handles game turn.
-        Player moves first, then enemies (if any). Game state gets updated accordingly.
+        Entities act in the order of :py:meth:`turnable.rooms.Room.turn_order` (the player first, unless
+        faster or with more initiative enemies), then the room plays. Game state gets updated accordingly.
         """
+        if self.journal is not None:
+            self.journal.record_turn(self)
+        self.turn += 1
         self.update_state()
         self.trigger_hook(HookType.TURN_ROUND_START)
+        with self.span('effects.advance'):
+            self.effects.advance(self.turn)
         if not self.room.has_started:
-            self.room.start()
+            with self.span('room.start'):
+                self.room.start()
 
-        self.player.play_turn()
-        self.room.play_turn()
+        for entity in self.room.turn_order():
+            with self.span('player.play_turn' if entity is self.player else 'enemy.play_turn'):
+                entity.play_turn()
+        with self.span('room.play_turn'):
+            self.room.play_turn()
 
         self.trigger_hook(HookType.TURN_ROUND_END)
         if self.room.is_done:
@@ -166,7 +280,89 @@ class Game:
         self.notify_state()
 
     def notify_state(self):
-        self.outputstream.send(self)
+        """ Sends the game to the :py:attr:`outputstream`. Does nothing on headless games (no outputstream). """
+        if self.outputstream is not None:
+            with self.span('notify_state'):
+                self.outputstream.send(self)
+
+    async def start_async(self):
+        """ Start game on the running event loop. Asynchronous variant of :py:meth:`start`. """
+        self.state = States.START
+        self.is_done = False
+        self.turn = 0
+        self.effects.clear()
+        if self.journal is not None:
+            self.journal.record_start(self)
+        self._pending_hooks = []
+        try:
+            self.map.reset()
+            await self.main_loop_async()
+        finally:
+            self._pending_hooks = None
+
+    async def main_loop_async(self):
+        """ Asynchronous variant of :py:meth:`main_loop`. """
+        await self.trigger_hook_async(HookType.GAME_START)
+        while not self.is_done:
+            self.player.move(Position(0, 0), False)
+            with self.span('level_loop', 'loop'):
+                await self.level_loop_async()
+            if not self.is_done:
+                with self.span('map.next_level'):
+                    self.map.next_level()
+        await self.trigger_hook_async(HookType.GAME_END)
+
+    async def level_loop_async(self):
+        """ Asynchronous variant of :py:meth:`level_loop`. """
+        await self.trigger_hook_async(HookType.LEVEL_START)
+        self.advance_level = False
+        while not self.advance_level and not self.is_done:
+            with self.span('map.get_player_room'):
+                self.room = self.map.get_player_room()
+            await self.notify_state_async()
+            with self.span('play_turns', 'loop'):
+                await self.play_turns_async()
+
+    async def play_turns_async(self):
+        """ Asynchronous variant of :py:meth:`play_turns`. Rooms play synchronously. """
+        if self.journal is not None:
+            self.journal.record_turn(self)
+        self.turn += 1
+        self.update_state()
+        await self.trigger_hook_async(HookType.TURN_ROUND_START)
+        with self.span('effects.advance'):
+            self.effects.advance(self.turn)
+        await self._run_pending_hooks()
+        if not self.room.has_started:
+            with self.span('room.start'):
+                self.room.start()
+            await self._run_pending_hooks()
+
+        for entity in self.room.turn_order():
+            with self.span('player.play_turn' if entity is self.player else 'enemy.play_turn'):
+                await entity.play_turn_async()
+            await self._run_pending_hooks()
+        with self.span('room.play_turn'):
+            self.room.play_turn()
+        await self._run_pending_hooks()
+
+        await self.trigger_hook_async(HookType.TURN_ROUND_END)
+        if self.room.is_done:
+            self.room.end()
+        endgame = self.check_endgame_conditions()
+        if endgame:
+            self.endgame(endgame)
+        await self._run_pending_hooks()
+        self.update_state()
+        await self.notify_state_async()
+
+    async def notify_state_async(self):
+        """ Asynchronous variant of :py:meth:`notify_state`. """
+        if self.outputstream is not None:
+            with self.span('notify_state'):
+                result = self.outputstream.send(self)
+                if inspect.isawaitable(result):
+                    await result
 
     def check_endgame_conditions(self):
         return self.endgame_condition(self)
@@ -1,33 +1,80 @@
+"""
+Geometry
+--------
+
+:py:class:`Position` is an immutable ``(x, y)`` pair, so positions can be used as dict keys and shared between
+entities, rooms and forked games. Adding a delta returns a new position: ::
+
+    entity.pos = entity.pos + parse_directions('UP')
+"""
+
+
 class Position:
-    """ Represents an (X, Y) position. """
+    """
+    Represents an (X, Y) position.
+
+    Positions are immutable and hashable, so they can be used as dict keys and shared freely:
+    adding a delta returns a new position.
+    """
+    __slots__ = ('x', 'y')
+
     def __init__(self, x, y):
-        self.x = x
-        self.y = y
+        _set_x(self, x)
+        _set_y(self, y)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} is immutable')
 
     def copy(self) -> 'Position':
-        return Position(self.x, self.y)
+        return self
 
-    def __add__(self, other):
-        return Position(self.x + other.x, self.y + other.y)
+    def __copy__(self):
+        return self
 
-    def __iadd__(self, other):
-        self.x += other.x
-        self.y += other.y
+    def __deepcopy__(self, memo):
         return self
 
+    def __reduce__(self):
+        return Position, (self.x, self.y)
+
+    def __add__(self, other):
+        return Position(self.x + other.x, self.y + other.y)
+
     def __radd__(self, other):
         return Position(self.x + other.x, self.y + other.y)
 
     def __str__(self):
         return f'(x={self.x}, y={self.y})'
 
+    def __repr__(self):
+        return f'Position({self.x}, {self.y})'
+
     def __eq__(self, other):
+        if not isinstance(other, Position):
+            return NotImplemented
         return other.x == self.x and other.y == self.y
 
+    def __hash__(self):
+        return hash((self.x, self.y))
+
+
+_set_x = Position.x.__set__
+_set_y = Position.y.__set__
+
+UP = Position(0, 1)
+DOWN = Position(0, -1)
+LEFT = Position(-1, 0)
+RIGHT = Position(1, 0)
+
+DIRECTION_DELTAS = {'UP': UP, 'DOWN': DOWN, 'LEFT': LEFT, 'RIGHT': RIGHT}
+
 
 def parse_directions(dir_: str):
     """
-    Returns delta position based on string representation.
+    Returns the shared delta position for a string representation, or ``None``.
 
     Valid Inputs:
     * up
@@ -35,13 +82,5 @@ def parse_directions(dir_: str):
     * left
     * right
     """
-    if dir_ == 'UP':
-        return Position(0, 1)
-    if dir_ == 'DOWN':
-        return Position(0, -1)
-    if dir_ == 'LEFT':
-        return Position(-1, 0)
-    if dir_ == 'RIGHT':
-        return Position(1, 0)
-    return None
+    return DIRECTION_DELTAS.get(dir_)
 
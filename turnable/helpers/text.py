@@ -5,6 +5,7 @@ These classes are used by default when constructing your game object with :py:fu
 
 import os
 import sys
+import shutil
 
 from turnable import BaseInputStream, Game
 from turnable.streams import CommandRequest, CommandResponse, BaseOutputStream
@@ -15,35 +16,74 @@ def clear_terminal():
     os.system('cls' if os.name == 'nt' else 'clear')
 
 
-class TextInputStream(BaseInputStream):
+class AnsiRenderer:
     """
-    Input stream for CLI gameplay.
+    Draws text frames on a terminal using ANSI escape sequences.
 
-    Performs :py:func:`input` calls for user input.
+    Frames are drawn from the top left corner of the screen. The previous frame is kept and only the lines
+    that changed are rewritten, then the cursor is left below the frame with the rest of the screen cleared for
+    the next prompt. Lines are addressed by row, so that only works while the terminal doesn't scroll: when the
+    frame plus :py:attr:`PROMPT_LINES` lines of input don't fit on the screen, frames are redrawn in full.
+    Each frame is written with a single buffered write. When *stream* is not a TTY frames are written in full
+    with no escape sequences.
     """
-    def __init__(self, stdout=sys.stdout):
-        self.stdout = stdout
+    HOME_CLEAR = '\x1b[H\x1b[2J'
+    CLEAR_LINE = '\x1b[K'
+    CLEAR_BELOW = '\x1b[J'
+    # Lines left below a frame for the input prompt, an "Invalid command." notice and the echoed input.
+    PROMPT_LINES = 3
 
-    def request(self, request: CommandRequest) -> CommandResponse:
-        input_ = input(request.label)
-        return CommandResponse(request, input_)
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        isatty = getattr(self.stream, 'isatty', None)
+        self.is_tty = bool(isatty and isatty())
+        self.previous = None
 
+    def render(self, frame: str):
+        lines = frame.split('\n')
+        if not self.is_tty:
+            self.stream.write(frame + '\n')
+        elif self.previous is None or max(len(lines), len(self.previous)) + self.PROMPT_LINES > self.height():
+            self.stream.write(self.HOME_CLEAR + frame + '\n')
+        else:
+            self.stream.write(self._diff(self.previous, lines))
+        self.stream.flush()
+        self.previous = lines
 
-class TextOutputStream(BaseOutputStream):
-    """ Output stream for CLI gameplay. """
+    def reset(self):
+        """ Forgets the previous frame so the next one is drawn on a cleared screen. """
+        self.previous = None
 
-    def __init__(self, *args, clear: bool = True, **kwargs):
-        """ *clear* indicates if the terminal should be clerared before each send. """
-        super().__init__(*args, **kwargs)
-        self.clear = clear
+    def clear(self):
+        """ Clears the screen now, and draws the next frame in full. """
+        if self.is_tty:
+            self.stream.write(self.HOME_CLEAR)
+            self.stream.flush()
+        self.previous = None
+
+    def height(self) -> int:
+        """ Returns the amount of lines of the terminal. """
+        try:
+            return os.get_terminal_size(self.stream.fileno()).lines
+        except (AttributeError, OSError, ValueError):
+            return shutil.get_terminal_size().lines
+
+    def _diff(self, old: list, new: list) -> str:
+        out = []
+        for row, line in enumerate(new):
+            if row >= len(old) or old[row] != line:
+                out.append(f'\x1b[{row + 1};1H{line}{self.CLEAR_LINE}')
+        for row in range(len(new), len(old)):
+            out.append(f'\x1b[{row + 1};1H{self.CLEAR_LINE}')
+        out.append(f'\x1b[{len(new) + 1};1H{self.CLEAR_BELOW}')
+        return ''.join(out)
 
-    def send(self, game: Game):
-        if self.clear:
-            clear_terminal()
 
-        player = game.player
-        room = game.room
-        template = f"""{player.name}
+def render_game(game: Game) -> str:
+    """ Returns a text representation of the player and the room it's in. """
+    player = game.player
+    room = game.room
+    template = f"""{player.name}
 {'=' * len(player.name)}
 Health: {player.health}
 Armor: {player.armor}
@@ -54,16 +94,48 @@ Position: X={player.pos.x} Y={player.pos.y}
 {'=' * len(room.__class__.__name__)}
 Position: X={room.pos.x} Y={room.pos.y}
 """
-        if hasattr(room, 'enemies'):
-            template += f"""
+    if hasattr(room, 'enemies'):
+        template += f"""
 Enemies
 ======="""
-            for enemy in room.enemies:
-                template += f"""
+        for enemy in room.enemies:
+            template += f"""
 * {enemy.__class__.__name__}
 Health: {enemy.health}
 Armor: {enemy.armor}
 Damage: {enemy.damage}
 """
-        print(template)
+    return template
+
 
+class TextInputStream(BaseInputStream):
+    """
+    Input stream for CLI gameplay.
+
+    Performs :py:func:`input` calls for user input.
+    """
+    def __init__(self, stdout=sys.stdout):
+        self.stdout = stdout
+
+    def request(self, request: CommandRequest) -> CommandResponse:
+        input_ = input(request.label)
+        return CommandResponse(request, input_)
+
+
+class TextOutputStream(BaseOutputStream):
+    """ Output stream for CLI gameplay. """
+
+    def __init__(self, *args, clear: bool = True, stdout=None, **kwargs):
+        """
+        *clear* indicates if each frame should replace the previous one on the terminal, which is done
+        with an :py:class:`AnsiRenderer` writing to *stdout*.
+        """
+        super().__init__(*args, **kwargs)
+        self.clear = clear
+        self.renderer = AnsiRenderer(stdout)
+
+    def send(self, game: Game):
+        if self.clear:
+            self.renderer.render(render_game(game))
+        else:
+            print(render_game(game), file=self.renderer.stream)
@@ -26,6 +26,10 @@ For example, if you wanted to print a message to the screen at the start of the
     game.add_hook(HookType.GAME_START, my_welcome_hook)
     game.start()
 
+:py:meth:`turnable.game.Game.add_hook` returns an integer handle that can be passed to
+:py:meth:`turnable.game.Game.remove_hook`, even from within the hook itself. Hooks run in
+ascending *priority* order (``0`` by default) and, for the same priority, in the order they were added.
+
 
 When to use hooks
 -----------------
@@ -52,7 +56,10 @@ and show them how their turn played out. ::
     game.start()
 
 """
+import inspect
+
 from enum import Enum, auto
+from typing import Any, Callable, Dict, List, Tuple
 
 
 class HookType(Enum):
@@ -69,6 +76,9 @@ class HookType(Enum):
     * ``TURN_ROUND_END``: At the end of :py:meth:`Game.play_turn`.
     * ``PLAYER_TURN_START``: At the start of :py:meth:`Entity.play_turn`.
     * ``PLAYER_TURN_END``: At the start of :py:meth:`Entity.play_turn`.
+    * ``ENEMY_TURN_START``: Once every round of a fight, before the first enemy acts in
+      :py:meth:`FightRoom.turn_order` (at the end of the round if none does).
+    * ``ENEMY_TURN_END``: Once every round of a fight, after the last enemy acted.
 
     """
     GAME_START = auto()
@@ -83,3 +93,103 @@ class HookType(Enum):
     PLAYER_TURN_END = auto()
     ENEMY_TURN_START = auto()
     ENEMY_TURN_END = auto()
+
+
+class HookRegistry:
+    """
+    Stores the hooks of a :py:class:`turnable.game.Game`.
+
+    Hooks are identified by integer handles and removing one deletes it, so dispatch cost only depends
+    on the live hooks. Every hook type keeps a dispatch order sorted by priority that is only rebuilt
+    after hooks of that type are added or removed. Hooks removed while dispatching are skipped, and
+    hooks added while dispatching run from the next trigger on.
+    """
+
+    def __init__(self):
+        self._hooks: Dict[HookType, Dict[int, Tuple[int, int, Callable]]] = {}
+        self._order: Dict[HookType, Tuple[Tuple[int, Callable], ...]] = {}
+        self._last_handle = 0
+
+    def add(self, type_: HookType, callback: Callable, priority: int = 0) -> int:
+        """ Adds *callback* for *type_* and returns its handle. """
+        self._last_handle += 1
+        handle = self._last_handle
+        self._hooks.setdefault(type_, {})[handle] = (priority, handle, callback)
+        self._order.pop(type_, None)
+        return handle
+
+    def remove(self, type_: HookType, handle: int):
+        """ Removes the hook with *handle*. Raises :py:class:`KeyError` if there is no such hook. """
+        hooks = self._hooks.get(type_)
+        if not hooks or handle not in hooks:
+            raise KeyError(handle)
+        del hooks[handle]
+        self._order.pop(type_, None)
+        if not hooks:
+            del self._hooks[type_]
+
+    def _dispatch_order(self, type_: HookType) -> Tuple[Tuple[int, Callable], ...]:
+        order = self._order.get(type_)
+        if order is None:
+            entries = sorted(self._hooks[type_].values(), key=_sort_key)
+            order = self._order[type_] = tuple((handle, callback) for _, handle, callback in entries)
+        return order
+
+    def trigger(self, type_: HookType, game: Any) -> List[Any]:
+        """
+        Calls every live hook of *type_* with ``(game, type_, handle)``.
+        Returns the awaitables returned by asynchronous hooks, if any, for the caller to await.
+        """
+        hooks = self._hooks.get(type_)
+        if not hooks:
+            return []
+        tracer = getattr(game, 'tracer', None)
+        pending = []
+        for handle, callback in self._dispatch_order(type_):
+            if handle in hooks:
+                if tracer is None:
+                    result = callback(game, type_, handle)
+                else:
+                    name = getattr(callback, '__qualname__', repr(callback))
+                    with tracer.span(name, 'hook', {'type': type_.name, 'handle': handle}):
+                        result = callback(game, type_, handle)
+                if result is not None and inspect.isawaitable(result):
+                    pending.append(result)
+        return pending
+
+    async def trigger_async(self, type_: HookType, game: Any):
+        """ Like :py:meth:`trigger`, awaiting asynchronous hooks before calling the next one. """
+        hooks = self._hooks.get(type_)
+        if not hooks:
+            return
+        tracer = getattr(game, 'tracer', None)
+        for handle, callback in self._dispatch_order(type_):
+            if handle in hooks:
+                if tracer is None:
+                    result = callback(game, type_, handle)
+                    if result is not None and inspect.isawaitable(result):
+                        await result
+                else:
+                    name = getattr(callback, '__qualname__', repr(callback))
+                    with tracer.span(name, 'hook', {'type': type_.name, 'handle': handle}):
+                        result = callback(game, type_, handle)
+                        if result is not None and inspect.isawaitable(result):
+                            await result
+
+    def copy(self) -> 'HookRegistry':
+        """ Returns a registry with the same hooks and handles that can be changed independently. """
+        other = HookRegistry()
+        other._hooks = {type_: dict(hooks) for type_, hooks in self._hooks.items()}
+        other._order = dict(self._order)
+        other._last_handle = self._last_handle
+        return other
+
+    def __len__(self):
+        return sum(len(hooks) for hooks in self._hooks.values())
+
+    def __contains__(self, handle: int):
+        return any(handle in hooks for hooks in self._hooks.values())
+
+
+def _sort_key(entry):
+    return entry[0], entry[1]
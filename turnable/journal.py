@@ -0,0 +1,277 @@
+"""
+Session journal and replay
+--------------------------
+
+A :py:class:`Journal` records what is needed to play a game session again: the raw input of every
+:py:class:`turnable.streams.CommandResponse`, the hooks fired, and checkpoints (snapshots, see
+:py:mod:`turnable.snapshot`) every few turns. Set it on :py:attr:`turnable.game.Game.journal` before the game
+starts: ::
+
+    from turnable.journal import Journal, replay
+
+    with Journal('session.trnj') as journal:
+        game.journal = journal
+        game.start()
+
+    replay(other_game, 'session.trnj', turn=250)
+
+:py:func:`replay` plays a journal on a game built like the recorded one (same player and map classes, room
+and enemy distributions, endgame condition and hooks). It answers requests with a :py:class:`ReplayInputStream`,
+which reads the journal through a memory map, and has no output stream, so it runs as fast as the game logic
+allows. With *turn* the game is restored from the last checkpoint before that turn instead of played from
+the start. Replays stop when the game ends or the journal runs out of inputs, so a session that was cut short
+is left at the point where it stopped, and one that crashed raises the same error again.
+
+Input streams that draw from the game's random generator, such as the bots of :py:mod:`turnable.simulation`,
+get the generator state recorded after each of their answers, so replays don't depend on them. The same goes
+for characters that decide by themselves, such as :py:class:`turnable.chars.MCTSEntity`, whose time budgeted
+searches are not run again when replayed.
+
+A journal holds one game. Layout (all integers little endian): ::
+
+    b'TRNJ' | version u16 | record*
+    record: length u32 | kind u8 | turn i64 | payload (length bytes)
+
+Records are appended to a buffer of *buffer_size* bytes which is written when full, at the end of the game and
+on :py:meth:`Journal.close`. A journal cut short, for example by a crash, can be read up to its last complete
+record.
+"""
+import os
+import mmap
+import random
+import struct
+import logging
+
+from enum import IntEnum
+from typing import IO, Iterator, List, NamedTuple, Optional, Union
+
+from turnable.hooks import HookType
+from turnable.snapshot import dump_rng, load_rng
+from turnable.streams import BaseInputStream, CommandRequest, CommandResponse, StreamException
+
+
+MAGIC = b'TRNJ'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sH')
+_RECORD = struct.Struct('<IBq')
+
+
+class RecordKind(IntEnum):
+    START = 1
+    INPUT = 2
+    RNG = 3
+    HOOK = 4
+    CHECKPOINT = 5
+
+
+class JournalError(Exception):
+    pass
+
+
+class ReplayError(JournalError):
+    """ Raised when a replayed game asks for input at a different turn than the recorded one. """
+    pass
+
+
+class JournalExhausted(StreamException):
+    """ Raised by :py:class:`ReplayInputStream` when the journal has no more inputs. """
+    pass
+
+
+class Record(NamedTuple):
+    """ A record of a journal. Its payload is at ``[start, end)`` of the journal data. """
+    kind: RecordKind
+    turn: int
+    start: int
+    end: int
+
+
+class Journal:
+    """
+    Appends the records of a game session to *file*, a path or a binary file opened for writing.
+    A checkpoint is stored at the start of every *checkpoint_every* turns.
+    """
+    _logger = logging.getLogger('turnable.journal.Journal')
+
+    def __init__(self, file: Union[str, os.PathLike, IO[bytes]], checkpoint_every: int = 100,
+                 buffer_size: int = 1 << 16):
+        self._owns_file = isinstance(file, (str, os.PathLike))
+        self.file = open(file, 'wb') if self._owns_file else file
+        self.checkpoint_every = checkpoint_every
+        self.buffer_size = buffer_size
+        self.buffer = bytearray(_HEADER.pack(MAGIC, VERSION))
+
+    def write(self, kind: RecordKind, turn: int, payload: bytes = b''):
+        """ Appends a record. """
+        self.buffer += _RECORD.pack(len(payload), kind, turn)
+        self.buffer += payload
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """ Writes the buffered records to the file. """
+        if self.buffer:
+            self.file.write(self.buffer)
+            self.buffer.clear()
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        if self._owns_file:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def record_start(self, game):
+        """ Records the state of the random generator of *game* as it starts. """
+        self.write(RecordKind.START, game.turn, dump_rng(game.rng))
+
+    def record_turn(self, game):
+        """ Stores a checkpoint if one is due before the next turn of *game*. """
+        if game.turn % self.checkpoint_every == 0:
+            self.write(RecordKind.CHECKPOINT, game.turn, game.snapshot())
+
+    def record_hook(self, game, type_: HookType):
+        self.write(RecordKind.HOOK, game.turn, bytes((type_.value,)))
+        if type_ is HookType.GAME_END:
+            self.flush()
+
+    def rng_state(self, game):
+        """ Returns the state of the random generator of *game* to pass to :py:meth:`record_input`. """
+        return game.rng.getstate() if type(game.rng) is random.Random else None
+
+    def record_input(self, game, response: CommandResponse, rng_state=None):
+        """
+        Records the raw input of *response*, and the state of the random generator if it changed since
+        *rng_state* was taken with :py:meth:`rng_state`.
+        """
+        self.write(RecordKind.INPUT, game.turn, response.rawdata.encode())
+        if rng_state is not None and game.rng.getstate() != rng_state:
+            self.write(RecordKind.RNG, game.turn, dump_rng(game.rng))
+
+
+class JournalReader:
+    """ Reads a journal written by :py:class:`Journal` through a memory map. """
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        with open(path, 'rb') as fp:
+            if os.fstat(fp.fileno()).st_size < _HEADER.size:
+                raise JournalError('Not a Turnable journal')
+            self.data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = _HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise JournalError('Not a Turnable journal')
+        if version != VERSION:
+            raise JournalError(f'Unsupported journal version {version}')
+        self._checkpoints: Optional[List[Record]] = None
+
+    def read(self, offset: int) -> Optional[Record]:
+        """ Returns the record at *offset*, or ``None`` at the end of the journal or of its complete records. """
+        end = offset + _RECORD.size
+        if end > len(self.data):
+            return None
+        length, kind, turn = _RECORD.unpack_from(self.data, offset)
+        if end + length > len(self.data):
+            return None
+        return Record(RecordKind(kind), turn, end, end + length)
+
+    def records(self, offset: int = _HEADER.size) -> Iterator[Record]:
+        """ Yields the records from *offset*, by default from the first one. """
+        record = self.read(offset)
+        while record is not None:
+            yield record
+            record = self.read(record.end)
+
+    def payload(self, record: Record) -> bytes:
+        return self.data[record.start:record.end]
+
+    def checkpoints(self) -> List[Record]:
+        """ Returns the checkpoint records. Only record headers are read to find them. """
+        if self._checkpoints is None:
+            self._checkpoints = [record for record in self.records() if record.kind == RecordKind.CHECKPOINT]
+        return self._checkpoints
+
+    def checkpoint_before(self, turn: int) -> Optional[Record]:
+        """ Returns the last checkpoint taken before *turn* was played, if any. """
+        found = None
+        for record in self.checkpoints():
+            if record.turn >= turn:
+                break
+            found = record
+        return found
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class ReplayInputStream(BaseInputStream):
+    """
+    Answers requests with the inputs of a journal, from *offset* on. The *game* attribute must be set before
+    the game starts, to check that inputs are asked for at the recorded turns and to restore the random
+    generator state recorded after them.
+    """
+
+    def __init__(self, reader: JournalReader, game=None, offset: int = _HEADER.size):
+        self.reader = reader
+        self.game = game
+        self.offset = offset
+
+    def request(self, request: CommandRequest) -> CommandResponse:
+        reader = self.reader
+        record = reader.read(self.offset)
+        while record is not None and record.kind != RecordKind.INPUT:
+            record = reader.read(record.end)
+        if record is None:
+            raise JournalExhausted('No more inputs in the journal')
+        if self.game is not None and record.turn != self.game.turn:
+            raise ReplayError(f'Input recorded at turn {record.turn} was requested at turn {self.game.turn}')
+        self.offset = record.end
+
+        following = reader.read(record.end)
+        if following is not None and following.kind == RecordKind.RNG:
+            if self.game is not None:
+                load_rng(self.game, reader.payload(following))
+            self.offset = following.end
+        return CommandResponse(request, reader.payload(record).decode())
+
+
+def replay(game, journal: Union[str, os.PathLike, JournalReader], turn: Optional[int] = None):
+    """
+    Plays the *journal* on *game* until the game ends or the journal runs out of inputs and returns the game.
+    With *turn*, the game is restored from the last checkpoint before that turn and played from there.
+    """
+    reader = journal if isinstance(journal, JournalReader) else JournalReader(journal)
+    stream = ReplayInputStream(reader, game)
+    game.inputstream = stream
+    game.outputstream = None
+    game.journal = None
+
+    checkpoint = reader.checkpoint_before(turn) if turn is not None else None
+    try:
+        if checkpoint is not None:
+            game.restore(reader.payload(checkpoint))
+            stream.offset = checkpoint.end
+            game.resume()
+        else:
+            start = next((record for record in reader.records() if record.kind == RecordKind.START), None)
+            if start is None:
+                raise JournalError('The journal has no game start')
+            load_rng(game, reader.payload(start))
+            stream.offset = start.end
+            game.start()
+    except JournalExhausted:
+        pass
+    return game
@@ -1,20 +1,197 @@
 #!/bin/usr/python3
+import copy
 import logging
 import random
-from typing import Tuple
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional, Tuple
 from math import floor
 
 from turnable.geometry import Position
+from turnable.fork import RoomOverlay
+from turnable.paths import PathFinder
+from turnable.sampling import get_sampler
+from turnable.spatial import SpatialIndex, game_index
 from turnable.rooms import FightRoom, Room, EmptyRoom
 
 
+class LazyColumn:
+    """ Column view of a :py:class:`LazyGrid`, so rooms can still be reached as ``grid[x][y]``. """
+
+    def __init__(self, grid: 'LazyGrid', x: int):
+        self.grid = grid
+        self.x = x
+
+    def __len__(self):
+        return self.grid.height
+
+    def __getitem__(self, y: int) -> Room:
+        if y < 0:
+            y += self.grid.height
+        return self.grid.get(self.x, y)
+
+    def __iter__(self):
+        return (self.grid.get(self.x, y) for y in range(self.grid.height))
+
+
+class LazyGrid:
+    """
+    Grid that only stores the room class of each cell and builds the actual :py:class:`turnable.rooms.Room`
+    (and its enemies) the first time the cell is accessed.
+
+    Rooms are indexed as ``grid[x][y]`` like the eager list-of-lists grid, or directly with :py:meth:`get`.
+    Built rooms are positioned relative to :py:attr:`origin`.
+    """
+
+    def __init__(self, map_: 'Map', classes: list, origin: Position = None):
+        self.map = map_
+        self.classes = classes
+        self.width = len(classes)
+        self.height = len(classes[0]) if classes else 0
+        self.origin = origin or Position(0, 0)
+        self.rooms = {}
+
+    def get(self, x: int, y: int) -> Room:
+        """ Returns the room at (*x*, *y*), building it if it's the first time it's accessed. """
+        room = self.rooms.get((x, y))
+        if room is None:
+            room = self._build(x, y, self.map.game)
+            self.rooms[(x, y)] = room
+        return room
+
+    def peek(self, x: int, y: int, game) -> Tuple[Room, bool]:
+        """
+        Returns ``(room, shared)`` without modifying the grid: the built room at (*x*, *y*) with ``shared=True``,
+        or a new room for *game* that is not stored in the grid with ``shared=False``.
+        """
+        room = self.rooms.get((x, y))
+        if room is not None:
+            return room, True
+        return self._build(x, y, game), False
+
+    def _build(self, x: int, y: int, game) -> Room:
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            raise IndexError(f'({x}, {y}) is out of the grid')
+        return self.room_class(x, y)(Position(self.origin.x + x, self.origin.y + y), game)
+
+    def room_class(self, x: int, y: int) -> type:
+        """ Returns the class of the room at (*x*, *y*) without building it. """
+        return self.classes[x][y]
+
+    @property
+    def materialized(self) -> int:
+        """ Amount of rooms built so far. """
+        return len(self.rooms)
+
+    def __len__(self):
+        return self.width
+
+    def __getitem__(self, x: int) -> LazyColumn:
+        if x < 0:
+            x += self.width
+        if not 0 <= x < self.width:
+            raise IndexError(f'Column {x} is out of the grid')
+        return LazyColumn(self, x)
+
+    def __iter__(self):
+        return (LazyColumn(self, x) for x in range(self.width))
+
+
+class CompactGrid(LazyGrid):
+    """
+    Array backed :py:class:`LazyGrid`. Each cell is one byte in :py:attr:`codes` indexing into
+    :py:attr:`room_types`, plus one byte of flags (:py:attr:`FLAG_VISITED`, :py:attr:`FLAG_DONE`) in :py:attr:`flags`.
+
+    Rooms are views built on demand. They can be dropped with :py:meth:`release`, which folds their
+    state back into the flags so the room is rebuilt as cleared the next time it's reached.
+    """
+    FLAG_VISITED = 1
+    FLAG_DONE = 2
+
+    def __init__(self,
+                 map_: 'Map',
+                 room_types: list,
+                 width: int,
+                 height: int,
+                 codes: bytearray,
+                 flags: bytearray = None,
+                 origin: Position = None):
+        if len(codes) != width * height:
+            raise ValueError(f'Expected {width * height} room codes, got {len(codes)}')
+        self.map = map_
+        self.room_types = room_types
+        self.width = width
+        self.height = height
+        self.codes = codes
+        self.flags = flags if flags is not None else bytearray(width * height)
+        self.origin = origin or Position(0, 0)
+        self.rooms = {}
+
+    def room_class(self, x: int, y: int) -> type:
+        return self.room_types[self.codes[x * self.height + y]]
+
+    def get(self, x: int, y: int) -> Room:
+        room = self.rooms.get((x, y))
+        if room is None:
+            room = super().get(x, y)
+            self.flags[x * self.height + y] |= self.FLAG_VISITED
+        return room
+
+    def _build(self, x: int, y: int, game) -> Room:
+        room = super()._build(x, y, game)
+        if self.flags[x * self.height + y] & self.FLAG_DONE:
+            room.is_done = room.has_started = room.has_ended = True
+            if hasattr(room, 'enemies'):
+                index = game_index(game)
+                if index is not None:
+                    index.remove(room.pos.x, room.pos.y, len(room.enemies))
+                room.enemies = []
+        return room
+
+    def release(self, x: int, y: int):
+        """ Drops the room at (*x*, *y*) keeping only whether it was visited and cleared. """
+        room = self.rooms.pop((x, y), None)
+        if room is None:
+            return
+        if room.is_done:
+            self.flags[x * self.height + y] |= self.FLAG_DONE
+        if self.map.index is not None and getattr(room, 'enemies', None):
+            self.map.index.remove(room.pos.x, room.pos.y, len(room.enemies))
+
+    def release_all(self):
+        """ Releases every built room. """
+        for x, y in list(self.rooms):
+            self.release(x, y)
+
+    def flag(self, x: int, y: int) -> int:
+        """ Returns the flags of the cell at (*x*, *y*). """
+        return self.flags[x * self.height + y]
+
+
 class Map:
     """
     Contains the map grid and logic.
     As is, generates a 2d grid of (:py:attr:`Map.BASE_MAP_SIZE` + :py:attr:`self.level`.
+
+    Maps can be forked with :py:meth:`fork`; see :py:meth:`turnable.game.Game.fork`.
+
+    If :py:attr:`LAZY_ROOMS` is set (the default) the grid is a :py:class:`LazyGrid` and rooms are only
+    built when they are first reached. Set it to ``False`` to build every room up front.
+
+    For big maps set :py:attr:`COMPACT_GRID` to use a :py:class:`CompactGrid`, which stores one byte per
+    cell and draws the room types of the whole level in a single call (vectorized with numpy if installed,
+    with the same results).
+
+    The entities of the built rooms and the player are kept in a :py:class:`turnable.spatial.SpatialIndex`,
+    :py:attr:`index`, which answers :py:meth:`entities_in_rect`, :py:meth:`entities_in_radius` and
+    :py:meth:`nearest_entities`.
+
+    :py:attr:`paths` is the :py:class:`turnable.paths.PathFinder` of the level, with distance fields to the player
+    and other targets for pathfinding.
     """
     _logger = logging.getLogger('turnable.map.Map')
     BASE_MAP_SIZE = 6
+    LAZY_ROOMS = True
+    COMPACT_GRID = False
     ROOM_DIST = []
     DEFAULT_DIST = [
         (FightRoom, 0.3),
@@ -24,11 +201,21 @@ class Map:
     def __init__(self):
         self.game = None
         self.grid = None
+        self.width = self.height = 0
         self.player_pos = None
         self.level = 0
+        self.overlay = None
+        self.index = None
+        self.paths = PathFinder(self)
+
+    @classmethod
+    def set_room_dist(cls, dist: Tuple[Room, float]):
+        """ Sets :py:attr:`ROOM_DIST` and prepares its sampler. """
+        get_sampler(dist)
+        cls.ROOM_DIST = dist
 
     def is_valid(self, pos: Position):
-        return 0 <= pos.x < len(self.grid[0]) and 0 <= pos.y < len(self.grid)
+        return 0 <= pos.x < self.width and 0 <= pos.y < self.height
 
     def reset(self) -> Tuple[int, int]:
         """ Returns :py:attr:`self.level` to 1 and regenerates grid. """
@@ -41,9 +228,133 @@ class Map:
         size = (self.BASE_MAP_SIZE + self.level,) * 2
         return self._generate_grid(*size)
 
+    def get_room(self, pos: Position) -> Room:
+        """ Return room in *pos*. """
+        if self.overlay is not None:
+            return self.overlay.get(self, pos)
+        if isinstance(self.grid, LazyGrid):
+            return self.grid.get(pos.x, pos.y)
+        return self.grid[pos.x][pos.y]
+
+    def peek_room(self, pos: Position, game) -> Tuple[Room, bool]:
+        """ Returns the room in *pos* without modifying the grid. See :py:meth:`LazyGrid.peek`. """
+        if isinstance(self.grid, LazyGrid):
+            return self.grid.peek(pos.x, pos.y, game)
+        return self.grid[pos.x][pos.y], True
+
+    def fork(self, game) -> 'Map':
+        """
+        Returns a copy of the map for *game* that shares the grid and rooms with this one.
+
+        From then on both maps read the grid through a :py:class:`turnable.fork.RoomOverlay` and copy a room the
+        first time they reach it, so the shared rooms are never modified.
+        """
+        if self.overlay is None:
+            self.overlay = RoomOverlay()
+        child = copy.copy(self)
+        child.game = game
+        child.overlay = self.overlay.fork()
+        if self.index is not None:
+            child.index = self.index.fork()
+        child.paths = self.paths.fork(child)
+        return child
+
+    def passable(self, x: int, y: int) -> bool:
+        """
+        Whether entities can walk through the cell (*x*, *y*). By default every cell of the grid is. Called for
+        every cell a distance field reaches, so subclasses that override :py:meth:`is_valid` should override it
+        too without building positions.
+        """
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def find_rooms(self, room_class: type) -> List[Position]:
+        """ Returns the positions of the rooms of *room_class* (or a subclass), without building them. """
+        if isinstance(self.grid, LazyGrid):
+            grid = self.grid
+            return [Position(grid.origin.x + x, grid.origin.y + y)
+                    for x in range(grid.width) for y in range(grid.height)
+                    if issubclass(grid.room_class(x, y), room_class)]
+        return [room.pos for column in self.grid or () for room in column if isinstance(room, room_class)]
+
+    def built_rooms(self) -> List[Room]:
+        """ Returns the rooms built so far, as this map sees them. Doesn't build any room. """
+        rooms = {(room.pos.x, room.pos.y): room for room in self._grid_rooms()}
+        if self.overlay is not None:
+            for layer in reversed(self.overlay.frozen):
+                rooms.update(layer)
+            rooms.update(self.overlay.local)
+        return list(rooms.values())
+
+    def _grid_rooms(self) -> Iterable[Room]:
+        if isinstance(self.grid, LazyGrid):
+            return self.grid.rooms.values()
+        return [room for column in self.grid or () for room in column]
+
+    def rebuild_index(self):
+        """ Rebuilds :py:attr:`index` from the built rooms and the player, for example after a restore. """
+        self.index = index = SpatialIndex()
+        for room in self.built_rooms():
+            index.add(room.pos.x, room.pos.y, len(getattr(room, 'enemies', ())))
+        player = self.game.player if self.game is not None else None
+        if player is not None and player.pos is not None:
+            index.place('player', player.pos.x, player.pos.y)
+
+    def entities_at(self, pos: Position, predicate: Callable = None) -> list:
+        """ Returns the alive entities in *pos* for which *predicate* (if given) is true, the player first. """
+        return self._entities_at(pos.x, pos.y, predicate)
+
+    def entities_in_rect(self, corner: Position, other: Position, predicate: Callable = None) -> list:
+        """ Returns the alive entities in the rectangle with opposite corners *corner* and *other*. """
+        x0, x1 = sorted((corner.x, other.x))
+        y0, y1 = sorted((corner.y, other.y))
+        return self._resolve(self.index.in_rect(x0, y0, x1, y1), predicate)
+
+    def entities_in_radius(self, center: Position, radius: float, predicate: Callable = None) -> list:
+        """ Returns the alive entities at most *radius* rooms away from *center*. """
+        return self._resolve(self.index.in_radius(center.x, center.y, radius), predicate)
+
+    def nearest_entities(self, pos: Position, k: int = 1, max_distance: Optional[float] = None,
+                         predicate: Callable = None) -> list:
+        """
+        Returns up to *k* alive entities for which *predicate* (if given) is true, the closest to *pos* first,
+        optionally only up to *max_distance* rooms away.
+        """
+        found = []
+        for _, (x, y) in self.index.nearest(pos.x, pos.y, max_distance):
+            found.extend(self._entities_at(x, y, predicate))
+            if len(found) >= k:
+                break
+        return found[:k]
+
+    def nearest_entity(self, pos: Position, max_distance: Optional[float] = None, predicate: Callable = None):
+        """ Returns the closest alive entity to *pos* for which *predicate* (if given) is true, or ``None``. """
+        found = self.nearest_entities(pos, 1, max_distance, predicate)
+        return found[0] if found else None
+
+    def _resolve(self, cells: Iterable[Tuple[int, int]], predicate: Callable) -> list:
+        entities = []
+        for x, y in cells:
+            entities.extend(self._entities_at(x, y, predicate))
+        return entities
+
+    def _entities_at(self, x: int, y: int, predicate: Callable) -> list:
+        """ Takes the entities of an occupied cell from the player and the room, which is only built if needed. """
+        entities = []
+        remaining = self.index.count(x, y)
+        player = self.game.player
+        if self.index.placed.get('player') == (x, y):
+            remaining -= 1
+            if player.is_alive() and (predicate is None or predicate(player)):
+                entities.append(player)
+        if remaining > 0:
+            for enemy in getattr(self.get_room(Position(x, y)), 'enemies', ()):
+                if enemy.is_alive() and (predicate is None or predicate(enemy)):
+                    entities.append(enemy)
+        return entities
+
     def get_player_room(self):
         """ Return room in player position. """
-        return self.grid[self.game.player.pos.x][self.game.player.pos.y]
+        return self.get_room(self.game.player.pos)
 
     def get_start_pos(self):
         """ Returns starting room. Starting room will always be an :py:class:`room.EmptyRoom`. """
@@ -57,9 +368,42 @@ class Map:
         # Create grid
         # Position enemies
         """
-        self.grid = self._generate_grid_skeleton(x, y)
+        self.overlay = None
+        self.index = SpatialIndex()
+        self.paths = PathFinder(self)
+        self.width, self.height = x, y
+        if self.COMPACT_GRID:
+            self.grid = self._generate_compact_grid(x, y)
+        elif self.LAZY_ROOMS:
+            self.grid = self._generate_lazy_grid(x, y)
+        else:
+            self.grid = self._generate_grid_skeleton(x, y)
         return x, y
 
+    def _generate_lazy_grid(self, x: int, y: int) -> LazyGrid:
+        """
+        Creates and returns a :py:class:`LazyGrid` that only holds the room classes.
+        """
+        flat = get_sampler(self.ROOM_DIST).sample_many(x * y, self.game.rng)
+        classes = [flat[x_ * y:(x_ + 1) * y] for x_ in range(x)]
+        return LazyGrid(self, classes)
+
+    def _generate_compact_grid(self, x: int, y: int) -> CompactGrid:
+        """
+        Creates and returns a :py:class:`CompactGrid` with the room types of every cell drawn at once.
+        """
+        room_types = [class_ for class_, weight in self.ROOM_DIST]
+        if len(room_types) > 256:
+            raise ValueError('CompactGrid supports up to 256 room types in ROOM_DIST')
+        return CompactGrid(self, room_types, x, y, self._draw_room_codes(x * y))
+
+    def _draw_room_codes(self, amount: int, rng: random.Random = None) -> bytearray:
+        """
+        Draws *amount* indexes into :py:attr:`~ROOM_DIST` in a single call from *rng*, which defaults to
+        the game :py:attr:`rng`. The codes are the same whether numpy is installed or not.
+        """
+        return get_sampler(self.ROOM_DIST).sample_codes(amount, rng or self.game.rng)
+
     def _generate_grid_skeleton(self, x: int, y: int) -> list:
         """
         Creates and returns grid skeleton.
@@ -74,9 +418,147 @@ class Map:
 
     def _get_next_room(self):
         """
-        Generates next room based on weights defined in :py:attr:`~ROOM_DIST`
+        Generates next room based on weights defined in :py:attr:`~ROOM_DIST` using the game :py:attr:`rng`.
+        """
+        return get_sampler(self.ROOM_DIST).sample(self.game.rng)
+
+
+class ChunkedMap(Map):
+    """
+    Unbounded map split in square chunks of :py:attr:`CHUNK_SIZE` cells that are generated on demand
+    around the player.
+
+    Every chunk is a :py:class:`CompactGrid` whose room types are drawn from a generator seeded with the level
+    seed and the chunk coordinates, so any chunk can be regenerated identically at any time. At most
+    :py:attr:`MAX_CHUNKS` chunks are kept loaded; the least recently used one is evicted when a new chunk
+    is needed and only its flags (visited and cleared rooms) are kept, for up to :py:attr:`MAX_STORED_CHUNKS`
+    chunks. Chunks whose flags were also dropped are regenerated as never visited.
+
+    Set :py:attr:`WORLD_SIZE` to limit the world to a square around the start position.
+    """
+    _logger = logging.getLogger('turnable.map.ChunkedMap')
+    CHUNK_SIZE = 16
+    MAX_CHUNKS = 64
+    MAX_STORED_CHUNKS = 4096
+    PRELOAD_RADIUS = 1
+    WORLD_SIZE = None
+
+    def __init__(self):
+        super().__init__()
+        self.level_seed = None
+        self.chunks = OrderedDict()
+        self.stored_flags = OrderedDict()
+        self.evictions = 0
+
+    def is_valid(self, pos: Position):
+        if self.WORLD_SIZE is None:
+            return True
+        half = self.WORLD_SIZE // 2
+        return -half <= pos.x < self.WORLD_SIZE - half and -half <= pos.y < self.WORLD_SIZE - half
+
+    def passable(self, x: int, y: int) -> bool:
+        if self.WORLD_SIZE is None:
+            return True
+        half = self.WORLD_SIZE // 2
+        return -half <= x < self.WORLD_SIZE - half and -half <= y < self.WORLD_SIZE - half
+
+    def get_room(self, pos: Position) -> Room:
+        size = self.CHUNK_SIZE
+        chunk = self.get_chunk(pos.x // size, pos.y // size)
+        if self.overlay is not None:
+            return self.overlay.get(self, pos)
+        return chunk.get(pos.x % size, pos.y % size)
+
+    def peek_room(self, pos: Position, game) -> Tuple[Room, bool]:
+        size = self.CHUNK_SIZE
+        key = (pos.x // size, pos.y // size)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self._generate_chunk(*key)
+        return chunk.peek(pos.x % size, pos.y % size, game)
+
+    def get_player_room(self):
+        """ Return room in player position, loading the chunks within :py:attr:`PRELOAD_RADIUS` around it. """
+        pos = self.game.player.pos
+        cx, cy = pos.x // self.CHUNK_SIZE, pos.y // self.CHUNK_SIZE
+        radius = self.PRELOAD_RADIUS
+        for dx in range(-radius, radius + 1):
+            for dy in range(-radius, radius + 1):
+                if dx or dy:
+                    self.get_chunk(cx + dx, cy + dy)
+        return self.get_room(pos)
+
+    def get_start_pos(self):
+        return Position(0, 0)
+
+    def get_chunk(self, cx: int, cy: int) -> CompactGrid:
+        """ Returns chunk (*cx*, *cy*), generating it and evicting the least recently used one if needed. """
+        key = (cx, cy)
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            self.chunks.move_to_end(key)
+            return chunk
+
+        chunk = self._generate_chunk(cx, cy)
+        self.stored_flags.pop(key, None)
+        self.chunks[key] = chunk
+        while len(self.chunks) > self.MAX_CHUNKS:
+            self._evict(*self.chunks.popitem(last=False))
+        self.paths.rooms_changed()
+        return chunk
+
+    def _generate_chunk(self, cx: int, cy: int) -> CompactGrid:
+        size = self.CHUNK_SIZE
+        rng = random.Random(f'{self.level_seed}:{cx}:{cy}')
+        room_types = [class_ for class_, weight in self.ROOM_DIST]
+        flags = self.stored_flags.get((cx, cy))
+        flags = bytearray(flags) if flags is not None else None
+        return CompactGrid(self, room_types, size, size, self._draw_room_codes(size * size, rng),
+                           flags=flags, origin=Position(cx * size, cy * size))
+
+    def find_rooms(self, room_class: type) -> List[Position]:
+        """
+        Returns the positions of the rooms of *room_class* in the loaded chunks. Loading or evicting a chunk
+        calls :py:meth:`turnable.paths.PathFinder.rooms_changed`, so :py:attr:`paths` looks them up again.
+        """
+        found = []
+        for chunk in self.chunks.values():
+            for x in range(chunk.width):
+                for y in range(chunk.height):
+                    if issubclass(chunk.room_class(x, y), room_class):
+                        found.append(Position(chunk.origin.x + x, chunk.origin.y + y))
+        return found
+
+    def _grid_rooms(self) -> Iterable[Room]:
+        return [room for chunk in self.chunks.values() for room in chunk.rooms.values()]
+
+    def fork(self, game) -> 'ChunkedMap':
+        """
+        Returns a copy of the map for *game*, see :py:meth:`Map.fork`. Both maps share the chunks loaded so far
+        but keep loading and evicting chunks on their own.
         """
-        return random.choices(
-            [class_ for class_, weight in self.ROOM_DIST],
-            [weight for class_, weight in self.ROOM_DIST]
-        )[0]
+        child = super().fork(game)
+        child.chunks = OrderedDict(self.chunks)
+        child.stored_flags = OrderedDict(self.stored_flags)
+        return child
+
+    def _evict(self, key: Tuple[int, int], chunk: CompactGrid):
+        if self.overlay is None:
+            chunk.release_all()
+        # Otherwise the chunk may be shared with forks and is left as is: the rooms this map reached are kept
+        # in the overlay.
+        self.evictions += 1
+        if any(chunk.flags):
+            self.stored_flags[key] = chunk.flags
+            while len(self.stored_flags) > self.MAX_STORED_CHUNKS:
+                self.stored_flags.popitem(last=False)
+
+    def _generate_grid(self, x: int = Map.BASE_MAP_SIZE, y: int = Map.BASE_MAP_SIZE) -> Tuple[int, int]:
+        """ Starts a new level: draws the level seed from the game :py:attr:`rng` and drops every chunk. """
+        self.level_seed = self.game.rng.getrandbits(64)
+        self.overlay = None
+        self.index = SpatialIndex()
+        self.paths = PathFinder(self)
+        self.chunks = OrderedDict()
+        self.stored_flags = OrderedDict()
+        return x, y
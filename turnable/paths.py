@@ -0,0 +1,290 @@
+"""
+Pathfinding
+-----------
+
+Distance fields over the map grid, so any number of entities chasing (or fleeing from) the same targets share
+one breadth first search instead of each running its own. A :py:class:`DistanceField` stores the amount of
+steps from every cell to the closest of its targets, moving up, down, left and right through the cells where
+:py:meth:`turnable.map.Map.passable` is true, and gives the next step towards them (or away from them) in
+constant time.
+
+Maps keep their fields in a :py:class:`PathFinder`, :py:attr:`turnable.map.Map.paths`, which is replaced on
+every level: ::
+
+    field = game.map.paths.to_player()
+    step = field.next_step(enemy_pos)       # None if already there or out of reach
+    away = field.flee_step(enemy_pos)
+    exits = game.map.paths.to_rooms(AdvanceLevelRoom)
+
+Fields are cached and only change when their targets do. When a target moves one cell the field is updated
+visiting only the cells whose distance changed, or searched again if that's most of them, as happens with a
+single target. Fields only reach :py:attr:`PathFinder.MAX_DISTANCE` steps, which keeps them finite on unbounded
+maps like :py:class:`turnable.map.ChunkedMap`.
+"""
+from collections import deque
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from turnable.geometry import DIRECTION_DELTAS, Position
+
+Cell = Tuple[int, int]
+
+NEIGHBORS = tuple((delta.x, delta.y) for delta in DIRECTION_DELTAS.values())
+
+
+class DistanceField:
+    """
+    Steps from every reachable cell to the closest of *targets*, up to *max_distance*. *passable* tells whether a
+    cell can be walked through; cells it rejects, and cells farther than *max_distance*, have no distance.
+    """
+    # Fraction of the field an update can change before searching it again is cheaper. With several targets only
+    # the area around the one that moved changes.
+    INCREMENTAL_LIMIT = 0.25
+
+    def __init__(self, passable: Callable[[int, int], bool], targets: Iterable[Cell] = (),
+                 max_distance: Optional[int] = None):
+        self.passable = passable
+        self.max_distance = max_distance
+        self.targets = frozenset(targets)
+        self.distances: Dict[Cell, int] = {}
+        self.rebuild()
+
+    def rebuild(self):
+        """ Searches the whole field again. """
+        self.distances = {}
+        self._lower(self.targets)
+
+    def retarget(self, targets: Iterable[Cell]):
+        """
+        Changes the targets of the field. When every new target is next to (or is) a previous one, as when a
+        target moves one cell, only the cells whose distance changes are updated, unless they turn out to be more
+        than :py:attr:`INCREMENTAL_LIMIT` of the field. Otherwise the field is rebuilt, which is always the case
+        with a single target: moving it changes the distance of about every cell.
+        """
+        targets = frozenset(targets)
+        added = targets - self.targets
+        removed = self.targets - targets
+        if not added and not removed:
+            return
+        incremental = len(targets) > 1 and bool(self.targets) and all(
+            any(abs(x - ox) + abs(y - oy) <= 1 for ox, oy in self.targets) for x, y in added)
+        self.targets = targets
+        if incremental:
+            budget = max(int(len(self.distances) * self.INCREMENTAL_LIMIT), 16)
+            if self._lower(added, budget) and self._raise(removed, budget):
+                return
+        self.rebuild()
+
+    def _lower(self, sources: Iterable[Cell], budget: Optional[int] = None) -> bool:
+        """
+        Makes *sources* targets and spreads the distances that got shorter. Returns ``False`` if it gave up after
+        changing *budget* cells.
+        """
+        distances = self.distances
+        passable = self.passable
+        limit = self.max_distance
+        queue = deque()
+        for cell in sources:
+            if distances.get(cell) != 0 and passable(*cell):
+                distances[cell] = 0
+                queue.append(cell)
+        while queue:
+            x, y = cell = queue.popleft()
+            step = distances[cell] + 1
+            if limit is not None and step > limit:
+                continue
+            for dx, dy in NEIGHBORS:
+                neighbor = (x + dx, y + dy)
+                current = distances.get(neighbor)
+                if current is None:
+                    if not passable(*neighbor):
+                        continue
+                elif current <= step:
+                    continue
+                distances[neighbor] = step
+                queue.append(neighbor)
+                if budget is not None:
+                    budget -= 1
+                    if budget < 0:
+                        return False
+        return True
+
+    def _raise(self, sources: Iterable[Cell], budget: Optional[int] = None) -> bool:
+        """
+        Stops *sources* being targets. The cells left without a neighbor one step closer to a target lose their
+        distance, and are searched again from the cells around them. Returns ``False`` if it gave up after losing
+        *budget* cells.
+        """
+        distances = self.distances
+        targets = self.targets
+        lost: Set[Cell] = set()
+        queue = deque(cell for cell in sources if cell in distances)
+        while queue:
+            x, y = cell = queue.popleft()
+            if cell in lost or cell in targets:
+                continue
+            distance = distances[cell]
+            supported = False
+            for dx, dy in NEIGHBORS:
+                neighbor = (x + dx, y + dy)
+                if distances.get(neighbor) == distance - 1 and neighbor not in lost:
+                    supported = True
+                    break
+            if supported:
+                continue
+            lost.add(cell)
+            if budget is not None and len(lost) > budget:
+                return False
+            for dx, dy in NEIGHBORS:
+                neighbor = (x + dx, y + dy)
+                if distances.get(neighbor) == distance + 1:
+                    queue.append(neighbor)
+        if not lost:
+            return True
+
+        for cell in lost:
+            del distances[cell]
+        # Distances are searched again from the cells around the lost ones, in buckets by distance.
+        limit = self.max_distance
+        buckets: Dict[int, List[Cell]] = {}
+        for x, y in lost:
+            best = None
+            for dx, dy in NEIGHBORS:
+                distance = distances.get((x + dx, y + dy))
+                if distance is not None and (best is None or distance < best):
+                    best = distance
+            if best is not None:
+                buckets.setdefault(best + 1, []).append((x, y))
+        distance = min(buckets, default=None)
+        while buckets and (limit is None or distance <= limit):
+            for cell in buckets.pop(distance, ()):
+                if cell in distances:
+                    continue
+                distances[cell] = distance
+                x, y = cell
+                for dx, dy in NEIGHBORS:
+                    neighbor = (x + dx, y + dy)
+                    if neighbor in lost and neighbor not in distances:
+                        buckets.setdefault(distance + 1, []).append(neighbor)
+            distance += 1
+        return True
+
+    def distance(self, pos: Position) -> Optional[int]:
+        """ Returns the steps from *pos* to the closest target, or ``None`` if it's out of reach. """
+        return self.distances.get((pos.x, pos.y))
+
+    def next_step(self, pos: Position) -> Optional[Position]:
+        """ Returns the neighbor of *pos* one step closer to a target, or ``None`` if there's none. """
+        x, y = pos.x, pos.y
+        distance = self.distances.get((x, y))
+        if not distance:
+            return None
+        for dx, dy in NEIGHBORS:
+            if self.distances.get((x + dx, y + dy)) == distance - 1:
+                return Position(x + dx, y + dy)
+        return None
+
+    def flee_step(self, pos: Position) -> Optional[Position]:
+        """
+        Returns the neighbor of *pos* farthest from the targets, if it's farther than *pos*, or ``None``.
+        Passable cells out of reach of the field count as the farthest.
+        """
+        x, y = pos.x, pos.y
+        best = self.distances.get((x, y))
+        if best is None:
+            return None
+        found = None
+        for dx, dy in NEIGHBORS:
+            neighbor = (x + dx, y + dy)
+            distance = self.distances.get(neighbor)
+            if distance is None:
+                if self.passable(*neighbor):
+                    return Position(*neighbor)
+            elif distance > best:
+                best = distance
+                found = neighbor
+        return Position(*found) if found is not None else None
+
+    def path(self, pos: Position) -> List[Position]:
+        """ Returns the steps from *pos* to the closest target, excluding *pos*. Empty if it's out of reach. """
+        steps = []
+        step = self.next_step(pos)
+        while step is not None:
+            steps.append(step)
+            step = self.next_step(step)
+        return steps
+
+    def copy(self) -> 'DistanceField':
+        other = DistanceField.__new__(DistanceField)
+        other.passable = self.passable
+        other.max_distance = self.max_distance
+        other.targets = self.targets
+        other.distances = dict(self.distances)
+        return other
+
+    def __len__(self):
+        return len(self.distances)
+
+
+class PathFinder:
+    """
+    Distance fields of one level of *map_*, cached by name. Fields are shared with the paths of forked maps
+    (see :py:meth:`fork`) and copied by the first one that changes their targets.
+    """
+    MAX_DISTANCE = 64
+
+    def __init__(self, map_):
+        self.map = map_
+        self.fields: Dict[Hashable, DistanceField] = {}
+        self.room_targets: Dict[type, List[Cell]] = {}
+        self._shared: Set[Hashable] = set()
+
+    def field(self, key: Hashable, targets: Iterable[Position]) -> DistanceField:
+        """ Returns the field *key* towards *targets*, building it or updating its targets if needed. """
+        cells = frozenset((pos.x, pos.y) for pos in targets)
+        return self._field(key, cells)
+
+    def _field(self, key: Hashable, cells: frozenset) -> DistanceField:
+        field = self.fields.get(key)
+        if field is None:
+            field = self.fields[key] = DistanceField(self.map.passable, cells, self.MAX_DISTANCE)
+        elif field.targets != cells:
+            if key in self._shared:
+                field = self.fields[key] = field.copy()
+                self._shared.discard(key)
+            field.retarget(cells)
+        return field
+
+    def to_player(self) -> DistanceField:
+        """ Returns the field towards the player of the game. """
+        pos = self.map.game.player.pos
+        return self._field('player', frozenset(((pos.x, pos.y),)))
+
+    def to_rooms(self, room_class: type) -> DistanceField:
+        """
+        Returns the field towards the rooms of *room_class*, such as :py:class:`turnable.rooms.AdvanceLevelRoom`.
+        The rooms are looked up with :py:meth:`turnable.map.Map.find_rooms` once per level, and again after
+        :py:meth:`rooms_changed`.
+        """
+        cells = self.room_targets.get(room_class)
+        if cells is None:
+            cells = self.room_targets[room_class] = [(pos.x, pos.y) for pos in self.map.find_rooms(room_class)]
+        return self._field(room_class, frozenset(cells))
+
+    def rooms_changed(self):
+        """
+        Forgets the rooms found by :py:meth:`to_rooms` and their fields. Maps that load or drop rooms during a
+        level call it, as :py:class:`turnable.map.ChunkedMap` does with its chunks.
+        """
+        for room_class in self.room_targets:
+            self.fields.pop(room_class, None)
+            self._shared.discard(room_class)
+        self.room_targets = {}
+
+    def fork(self, map_) -> 'PathFinder':
+        """ Returns the paths of the fork *map_*, sharing the fields with this one. """
+        other = PathFinder(map_)
+        other.fields = dict(self.fields)
+        other.room_targets = self.room_targets
+        other._shared = set(self.fields)
+        self._shared = set(self.fields)
+        return other
@@ -1,11 +1,16 @@
-import random
 from typing import Tuple
 
 from turnable.chars import Entity, AIEntity
 from turnable.hooks import HookType
+from turnable.sampling import get_sampler
+from turnable.spatial import game_index
+from turnable.store import EntityStore
+from turnable.turns import TurnScheduler
 
 
 class Room:
+    """ Base room. Rooms use ``__slots__``; subclasses that don't declare them get a ``__dict__`` as usual. """
+    __slots__ = ('pos', 'game', 'is_done', 'has_ended', 'has_started', 'description')
     TYPES = []
 
     def __init__(self, pos, game):
@@ -22,7 +27,12 @@ class Room:
             self.has_started = True
             self.game.trigger_hook(HookType.ROOM_START)
 
+    def turn_order(self):
+        """ Yields the entities that act this turn, in order. By default only the player. """
+        yield self.game.player
+
     def play_turn(self):
+        """ Plays the room's part of the turn, after the entities in :py:meth:`turn_order` acted. """
         raise NotImplementedError()
 
     def end(self):
@@ -34,10 +44,15 @@ class Room:
 
 class BaseDangerRoom(Room):
     """ A dangerous room. """
+    __slots__ = ('enemies',)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.enemies = []
         self.create_enemies()
+        index = game_index(self.game)
+        if index is not None:
+            index.add(self.pos.x, self.pos.y, len(self.enemies))
 
     def play_turn(self):
         self.is_done = all(not e.is_alive() for e in self.enemies)
@@ -48,40 +63,117 @@ class BaseDangerRoom(Room):
 
 class BaseRewardRoom(Room):
     """ This will do something good for the player. """
+    __slots__ = ()
+
     def play_turn(self):
         pass
 
 
 class EmptyRoom(Room):
+    __slots__ = ()
+
     def play_turn(self):
         pass
 
 
 class FightRoom(BaseDangerRoom):
-    """ Room with enemies that require KILLIN'. """
+    """
+    Room with enemies that require KILLIN'.
+
+    The player and the enemies act in the order of a :py:class:`turnable.turns.TurnScheduler`,
+    available as :py:attr:`scheduler`. Add enemies during a fight with :py:meth:`add_enemy`.
+
+    With :py:attr:`ENTITY_STORE` enemies keep their stats in a :py:class:`turnable.store.EntityStore`,
+    available as :py:attr:`store`, so area damage is applied in batches.
+    """
+    __slots__ = ('store', 'scheduler')
     ENEMY_DIST = None
+    ENTITY_STORE = False
     DEFAULT_DIST = [
         (AIEntity, 1),
     ]
 
     @classmethod
     def set_enemy_dist(cls, dist: Tuple[Entity, float]):
+        """ Sets :py:attr:`ENEMY_DIST` and prepares its sampler. """
+        get_sampler(dist)
         cls.ENEMY_DIST = dist
 
-    def play_turn(self):
-        self.game.trigger_hook(HookType.ENEMY_TURN_START)
-        dead = []
-        for ix, enemy in enumerate(self.enemies):
-            if not enemy.is_alive():
-                dead.append(ix)
-                continue
+    def __init__(self, *args, **kwargs):
+        self.store = None
+        self.scheduler = None
+        super().__init__(*args, **kwargs)
 
-            enemy.play_turn()
+    def turn_order(self):
+        """
+        Yields the player and the alive enemies as they act during this turn, some of them maybe more than once.
+        Stops if the player dies.
+
+        :py:attr:`HookType.ENEMY_TURN_START` and :py:attr:`HookType.ENEMY_TURN_END` are triggered once every
+        turn: the start before the first enemy acts, or at the end of the turn if none does, and the end after
+        the last one.
+        """
+        scheduler = self._get_scheduler()
+        player = self.game.player
+        start = self.game.turn
+        scheduler.catch_up(start)
+        enemies_started = False
+        while player.is_alive():
+            entity = scheduler.pop(start + 1)
+            if entity is None:
+                break
+            if not entity.is_alive():
+                continue
+            if entity is not player and not enemies_started:
+                enemies_started = True
+                self.game.trigger_hook(HookType.ENEMY_TURN_START)
+            yield entity
+            scheduler.reschedule(entity)
+        if not enemies_started:
+            self.game.trigger_hook(HookType.ENEMY_TURN_START)
+        self.game.trigger_hook(HookType.ENEMY_TURN_END)
 
-        for ix in dead:
-            self.enemies.pop(ix)
+    def _get_scheduler(self) -> TurnScheduler:
+        """ Returns :py:attr:`scheduler`, building it for the current player and enemies when needed. """
+        scheduler = self.scheduler
+        player = self.game.player
+        if scheduler is None:
+            scheduler = self.scheduler = TurnScheduler(time=self.game.turn)
+            scheduler.add(player)
+            for enemy in self.enemies:
+                if enemy.is_alive():
+                    scheduler.add(enemy)
+        elif player not in scheduler:
+            scheduler.add(player)
+        return scheduler
+
+    def add_enemy(self, enemy: Entity):
+        """ Adds *enemy* to the room, to act from this turn on. """
+        enemy.game = self.game
+        enemy.pos = self.pos
+        self.enemies.append(enemy)
+        index = game_index(self.game)
+        if index is not None:
+            index.add(self.pos.x, self.pos.y)
+        if self.store is not None:
+            self.store.add(enemy)
+        if self.scheduler is not None:
+            self.scheduler.add(enemy)
 
-        self.game.trigger_hook(HookType.ENEMY_TURN_END)
+    def play_turn(self):
+        """ Removes dead enemies and checks if the room is done. """
+        if not all(enemy.is_alive() for enemy in self.enemies):
+            scheduler = self.scheduler
+            alive = []
+            for enemy in self.enemies:
+                if enemy.is_alive():
+                    alive.append(enemy)
+                elif scheduler is not None:
+                    scheduler.remove(enemy)
+            index = game_index(self.game)
+            if index is not None:
+                index.remove(self.pos.x, self.pos.y, len(self.enemies) - len(alive))
+            self.enemies = alive
         super().play_turn()
 
     def create_enemies(self):
@@ -90,21 +182,24 @@ class FightRoom(BaseDangerRoom):
             raise ValueError('You must initialize ENEMY_DIST. Import turnable.rooms.FightRoom and '
                              'call FightRoom.set_enemy_dist(your_dist).')
 
-        amount = random.randint(1, 3)
+        amount = self.game.rng.randint(1, 3)
         for c in range(amount):
             en = self._get_enemy()(pos=self.pos)
             en.game = self.game
             self.enemies.append(en)
+        self.build_store()
+
+    def build_store(self):
+        """ Adds the enemies to a new :py:attr:`store` if :py:attr:`ENTITY_STORE` is enabled. """
+        self.store = EntityStore(self.enemies) if self.ENTITY_STORE and self.enemies else None
 
     def _get_enemy(self):
-        return random.choices(
-            [class_ for class_, weight in self.ENEMY_DIST],
-            [weight for class_, weight in self.ENEMY_DIST]
-        )[0]
+        return get_sampler(self.ENEMY_DIST).sample(self.game.rng)
 
 
 class BossRoom(BaseDangerRoom):
     """ Room with a BIG enemy. """
+    __slots__ = ()
 
     def create_enemies(self):
         pass
@@ -112,6 +207,7 @@ class BossRoom(BaseDangerRoom):
 
 class AdvanceLevelRoom(Room):
     """ Allows player to advance to the next level. """
+    __slots__ = ()
 
     def play_turn(self):
         pass
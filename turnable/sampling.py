@@ -0,0 +1,119 @@
+"""
+Weighted sampling for the distributions used in generation, such as :py:attr:`turnable.map.Map.ROOM_DIST`
+and :py:attr:`turnable.rooms.FightRoom.ENEMY_DIST`.
+
+A distribution is a list of ``(item, weight)`` tuples. :py:class:`WeightedSampler` preprocesses it once
+with the alias method so every draw costs O(1) regardless of the amount of items. Use :py:func:`get_sampler`
+to get the cached sampler of a distribution: ::
+
+    sampler = get_sampler(FightRoom.ENEMY_DIST)
+    enemies = sampler.sample_many(10, game.rng)
+
+.. note::
+    Samplers are cached by distribution object. Replace a distribution (for example with
+    :py:meth:`turnable.rooms.FightRoom.set_enemy_dist`) instead of modifying it in place.
+"""
+import random
+
+from collections import OrderedDict
+from typing import Any, List, Sequence, Tuple
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+class WeightedSampler:
+    """ Draws items from a ``(item, weight)`` distribution in constant time using the alias method. """
+
+    def __init__(self, dist: Sequence[Tuple[Any, float]]):
+        if not dist:
+            raise ValueError('Cannot sample from an empty distribution')
+        self.items = [item for item, weight in dist]
+        weights = [float(weight) for item, weight in dist]
+        if any(weight < 0 for weight in weights):
+            raise ValueError('Weights must not be negative')
+        total = sum(weights)
+        if total <= 0:
+            raise ValueError('Weights must add up to more than 0')
+
+        size = len(weights)
+        scaled = [weight * size / total for weight in weights]
+        self.prob = [1.0] * size
+        self.alias = list(range(size))
+        small = [ix for ix, p in enumerate(scaled) if p < 1]
+        large = [ix for ix, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1 - scaled[less]
+            if scaled[more] < 1:
+                small.append(more)
+            else:
+                large.append(more)
+
+    def sample_index(self, rng: random.Random) -> int:
+        """ Draws the index of an item using a single number from *rng*. """
+        u = rng.random() * len(self.prob)
+        ix = int(u)
+        return ix if u - ix < self.prob[ix] else self.alias[ix]
+
+    def sample_indexes(self, amount: int, rng: random.Random) -> List[int]:
+        """ Draws *amount* item indexes. """
+        size = len(self.prob)
+        prob, alias, rand = self.prob, self.alias, rng.random
+        indexes = []
+        for _ in range(amount):
+            u = rand() * size
+            ix = int(u)
+            indexes.append(ix if u - ix < prob[ix] else alias[ix])
+        return indexes
+
+    def sample_codes(self, amount: int, rng: random.Random) -> bytearray:
+        """
+        Draws *amount* item indexes as bytes, for distributions of up to 256 items. The draws are the same as
+        :py:meth:`sample_indexes`: with numpy installed and a :py:class:`random.Random` *rng*, numpy continues
+        from the state of *rng* (both use MT19937 and build floats the same way), which is advanced as if the
+        numbers were drawn from it.
+        """
+        if numpy is None or type(rng) is not random.Random:
+            return bytearray(self.sample_indexes(amount, rng))
+        version, internal, gauss = rng.getstate()
+        generator = numpy.random.RandomState()
+        generator.set_state(('MT19937', numpy.asarray(internal[:-1], dtype=numpy.uint32), internal[-1]))
+        u = generator.random_sample(amount) * len(self.prob)
+        ix = u.astype(numpy.intp)
+        codes = numpy.where(u - ix < numpy.asarray(self.prob)[ix], ix, numpy.asarray(self.alias)[ix])
+        _, key, pos = generator.get_state()[:3]
+        rng.setstate((version, tuple(int(word) for word in key) + (int(pos),), gauss))
+        return bytearray(codes.astype(numpy.uint8).tobytes())
+
+    def sample(self, rng: random.Random) -> Any:
+        """ Draws a single item. """
+        return self.items[self.sample_index(rng)]
+
+    def sample_many(self, amount: int, rng: random.Random) -> List[Any]:
+        """ Draws *amount* items. """
+        items = self.items
+        return [items[ix] for ix in self.sample_indexes(amount, rng)]
+
+
+_CACHE_SIZE = 32
+_samplers = OrderedDict()
+
+
+def get_sampler(dist: Sequence[Tuple[Any, float]]) -> WeightedSampler:
+    """ Returns the :py:class:`WeightedSampler` for *dist*, building it only the first time. """
+    key = id(dist)
+    cached = _samplers.get(key)
+    if cached is not None and cached[0] is dist:
+        _samplers.move_to_end(key)
+        return cached[1]
+
+    sampler = WeightedSampler(dist)
+    _samplers[key] = (dist, sampler)
+    while len(_samplers) > _CACHE_SIZE:
+        _samplers.popitem(last=False)
+    return sampler
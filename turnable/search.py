@@ -0,0 +1,327 @@
+"""
+Monte Carlo tree search
+-----------------------
+
+Picks the player's next move by playing many short random continuations (*rollouts*) of the game with the
+real turn rules, and choosing the move whose rollouts went best. Every rollout runs on a
+:py:meth:`turnable.game.Game.fork`, so the searched game is never modified.
+
+The search is available as a bot policy for :py:class:`turnable.simulation.PolicyInputStream`: ::
+
+    from turnable.search import MCTSPolicy, MCTSSearch
+
+    instream = PolicyInputStream(MCTSPolicy(MCTSSearch(budget=0.02)))
+
+and as the :py:class:`turnable.chars.MCTSEntity` character, which makes its own decisions without an
+input stream.
+
+Every decision takes at most *budget* seconds (and at most *max_rollouts* rollouts), so the time spent per turn
+stays predictable, for example on a :py:mod:`turnable.server`. With *workers* the rollouts are also spread
+over a process pool: every worker searches a :py:meth:`~turnable.game.Game.snapshot` of the game until the
+deadline and the results are merged. Workers don't run hooks, as hooks aren't part of snapshots.
+
+The search is flat: the tree is the player's options for the current turn, chosen with UCB1, and every rollout
+continues with *rollout_policy* for up to *depth* turns. Its score is given by *reward*, a function
+that receives the game at the end of the rollout and the game it started from, and returns a number between
+0 and 1.
+"""
+import math
+import time
+import random
+import logging
+
+from concurrent.futures import ProcessPoolExecutor, wait
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from turnable.game import Game
+from turnable.geometry import parse_directions
+from turnable.simulation import DIRECTIONS, PolicyInputStream, aggressive_policy
+from turnable.streams import CommandRequest, CommandResponse
+
+
+Choice = Tuple[str, ...]
+
+
+def _fight_state(room) -> Tuple[int, int]:
+    """ Returns the amount of alive enemies in *room* and their total health and armor. """
+    alive = [enemy for enemy in getattr(room, 'enemies', ()) if enemy.is_alive()]
+    return len(alive), sum(enemy.health + enemy.armor for enemy in alive)
+
+
+def default_reward(game: Game, root: Game) -> float:
+    """
+    Scores 0 for a dead player. Otherwise adds up the health left (0.4) and the armor kept since *root* (0.1),
+    the health and armor taken from the enemies of the room the rollout started in (0.2), the share of them
+    killed (0.2) and a bonus for reaching the next level (0.1).
+    """
+    player = game.player
+    if not player.is_alive():
+        return 0.0
+    reward = 0.4 * max(0.0, min(1.0, player.health / player.max_health))
+    armor = root.player.armor
+    reward += 0.1 * (min(1.0, player.armor / armor) if armor > 0 else 1.0)
+
+    enemies, health = _fight_state(root.room)
+    if enemies:
+        left, left_health = _fight_state(game.map.get_room(root.room.pos))
+        reward += 0.2 * (health - left_health) / health if health > 0 else 0.0
+        reward += 0.2 * (enemies - left) / enemies
+    if game.advance_level:
+        reward += 0.1
+    return reward
+
+
+class RolloutInputStream(PolicyInputStream):
+    """ Answers with the inputs of a :py:data:`Choice` first, then with *policy*. """
+
+    def __init__(self, choice: Choice, policy: Callable[[Game, CommandRequest], str], game: Optional[Game] = None):
+        super().__init__(policy, game)
+        self.script = list(reversed(choice))
+
+    def request(self, request):
+        if self.script:
+            return CommandResponse(request, self.script.pop())
+        return super().request(request)
+
+
+def player_choices(game: Game) -> List[Choice]:
+    """
+    Returns the options of the player for its next action, as the inputs it would send: every alive
+    target for ``ATK``, every valid direction for ``MOV`` and any other action whose tag matches itself.
+    Special commands are left out.
+    """
+    player = game.player
+    choices = []
+    request = CommandRequest('', player.actions)
+    for cmd in player.actions:
+        tag = cmd.tag
+        if tag.startswith(':'):
+            continue
+        if tag == 'ATK':
+            enemies = getattr(game.room, 'enemies', [])
+            if len(enemies) > 1:
+                choices.extend(('ATK', str(ix)) for ix, enemy in enumerate(enemies, 1) if enemy.is_alive())
+            else:
+                choices.append(('ATK',))
+        elif tag.startswith('MOV'):
+            choices.extend((f'MOV{dir_}',) for dir_ in DIRECTIONS
+                           if game.map.is_valid(player.pos + parse_directions(dir_)))
+        elif request.match(tag)[0] is cmd:
+            choices.append((tag,))
+    return choices
+
+
+def rollout(root: Game,
+            choice: Choice,
+            seed: int,
+            depth: int = 8,
+            policy: Callable = aggressive_policy,
+            reward: Callable[[Game, Game], float] = default_reward) -> float:
+    """
+    Plays *choice* and up to *depth* - 1 more turns with *policy* on a fork of *root*, and returns the *reward*
+    of the fork compared to *root*.
+    *root* must be waiting for the player's action: its current turn is replayed from the start.
+    """
+    child = root.fork(inputstream=RolloutInputStream(choice, policy))
+    child.inputstream.game = child
+    child.rng.seed(seed)
+    child.turn -= 1
+    child.play_turns()
+    for _ in range(depth - 1):
+        if child.is_done or child.advance_level:
+            break
+        child.room = child.map.get_player_room()
+        child.play_turns()
+    return reward(child, root)
+
+
+def _ucb(root: Game,
+         choices: Sequence[Choice],
+         deadline: float,
+         max_rollouts: Optional[int],
+         depth: int,
+         exploration: float,
+         policy: Callable,
+         reward: Callable,
+         seed: int) -> Tuple[List[int], List[float]]:
+    """ Runs rollouts picking choices with UCB1 until *deadline* (:py:func:`time.monotonic`) or *max_rollouts*. """
+    rng = random.Random(seed)
+    visits = [0] * len(choices)
+    totals = [0.0] * len(choices)
+    done = 0
+    slowest = 0.0
+    while max_rollouts is None or done < max_rollouts:
+        start = time.monotonic()
+        if start + slowest > deadline:
+            break
+        if done < len(choices):
+            ix = done
+        else:
+            log_done = math.log(done)
+            ix = max(range(len(choices)),
+                     key=lambda i: totals[i] / visits[i] + exploration * math.sqrt(log_done / visits[i]))
+        totals[ix] += rollout(root, choices[ix], rng.getrandbits(64), depth, policy, reward)
+        visits[ix] += 1
+        done += 1
+        slowest = max(slowest, time.monotonic() - start)
+    return visits, totals
+
+
+def _search_worker(data: bytes, endgame_condition: Callable, dists: tuple, choices: Sequence[Choice],
+                   deadline: float, max_rollouts: Optional[int], depth: int, exploration: float,
+                   policy: Callable, reward: Callable, seed: int):
+    """ Process pool entry point: restores the game snapshot in *data* and runs :py:func:`_ucb` on it. """
+    from turnable.chars import PlayableEntity
+    from turnable.map import Map
+    from turnable.rooms import FightRoom
+
+    Map.set_room_dist(dists[0])
+    FightRoom.set_enemy_dist(dists[1])
+    game = Game('Rollout', PlayableEntity('Rollout'), Map(), None, None, endgame_condition)
+    game.restore(data)
+    return _ucb(game, choices, deadline, max_rollouts, depth, exploration, policy, reward, seed)
+
+
+class SearchResult:
+    """ Outcome of a :py:meth:`MCTSSearch.search`: rollouts and mean reward per choice. """
+
+    def __init__(self, choices: List[Choice], visits: List[int], totals: List[float], elapsed: float):
+        self.choices = choices
+        self.visits = visits
+        self.totals = totals
+        self.elapsed = elapsed
+
+    @property
+    def rollouts(self) -> int:
+        return sum(self.visits)
+
+    @property
+    def rollouts_per_second(self) -> float:
+        return self.rollouts / self.elapsed if self.elapsed else 0.0
+
+    def mean(self, ix: int) -> float:
+        return self.totals[ix] / self.visits[ix] if self.visits[ix] else 0.0
+
+    @property
+    def best(self) -> Optional[Choice]:
+        """ The most visited choice, ties broken by mean reward. """
+        if not self.choices:
+            return None
+        ix = max(range(len(self.choices)), key=lambda i: (self.visits[i], self.mean(i)))
+        return self.choices[ix]
+
+    def as_dict(self) -> dict:
+        return {
+            'best': ' '.join(self.best) if self.best else None,
+            'rollouts': self.rollouts,
+            'elapsed': self.elapsed,
+            'rollouts_per_second': self.rollouts_per_second,
+            'choices': {' '.join(choice): {'visits': self.visits[ix], 'mean': self.mean(ix)}
+                        for ix, choice in enumerate(self.choices)},
+        }
+
+
+class MCTSSearch:
+    """
+    Searches the player's next move within *budget* seconds and at most *max_rollouts* rollouts.
+    See the module documentation for the other parameters.
+
+    With *workers* a process pool is started on the first search and kept until :py:meth:`close`. Policies,
+    rewards and the endgame condition of the game must be picklable (defined at module level) to use it.
+    """
+    _logger = logging.getLogger('turnable.search.MCTSSearch')
+
+    def __init__(self,
+                 budget: float = 0.05,
+                 max_rollouts: Optional[int] = None,
+                 depth: int = 8,
+                 exploration: float = 1.4,
+                 workers: int = 0,
+                 rollout_policy: Callable[[Game, CommandRequest], str] = aggressive_policy,
+                 reward: Callable[[Game, Game], float] = default_reward):
+        self.budget = budget
+        self.max_rollouts = max_rollouts
+        self.depth = depth
+        self.exploration = exploration
+        self.workers = workers
+        self.rollout_policy = rollout_policy
+        self.reward = reward
+        self._pool = None
+
+    def search(self, game: Game) -> SearchResult:
+        """ Searches the next move of the player of *game*, which must be waiting for the player's action. """
+        start = time.monotonic()
+        deadline = start + self.budget
+        choices = player_choices(game)
+        if len(choices) <= 1:
+            return SearchResult(choices, [0] * len(choices), [0.0] * len(choices), time.monotonic() - start)
+
+        seed = game.rng.getrandbits(64)
+        per_worker = None
+        if self.max_rollouts is not None:
+            per_worker = -(-self.max_rollouts // (self.workers + 1))
+
+        futures = []
+        if self.workers:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            from turnable.map import Map
+            from turnable.rooms import FightRoom
+            data = game.snapshot()
+            dists = (Map.ROOM_DIST, FightRoom.ENEMY_DIST)
+            futures = [self._pool.submit(_search_worker, data, game.endgame_condition, dists, choices, deadline,
+                                         per_worker, self.depth, self.exploration, self.rollout_policy,
+                                         self.reward, seed + worker + 1)
+                       for worker in range(self.workers)]
+
+        root = game.fork()
+        visits, totals = _ucb(root, choices, deadline, per_worker, self.depth, self.exploration,
+                              self.rollout_policy, self.reward, seed)
+
+        if futures:
+            finished, late = wait(futures, timeout=max(0.0, deadline - time.monotonic()) + self.budget * 0.1)
+            for future in late:
+                future.cancel()
+            for future in finished:
+                if future.exception() is not None:
+                    self._logger.warning(f'Rollout worker failed: {future.exception()!r}')
+                    continue
+                worker_visits, worker_totals = future.result()
+                visits = [a + b for a, b in zip(visits, worker_visits)]
+                totals = [a + b for a, b in zip(totals, worker_totals)]
+
+        result = SearchResult(choices, visits, totals, time.monotonic() - start)
+        self._logger.debug(f'Searched {result.rollouts} rollouts in {result.elapsed:.4f}s, best {result.best}.')
+        return result
+
+    def close(self):
+        """ Shuts down the process pool, if any. """
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+
+class MCTSPolicy:
+    """
+    Policy for :py:class:`turnable.simulation.PolicyInputStream` that answers action requests with the best
+    choice of *search* (defaults to :py:class:`MCTSSearch`) and follow up requests, such as the target,
+    with the rest of that choice. The last :py:class:`SearchResult` is kept in :py:attr:`last_result`.
+    """
+
+    def __init__(self, search: Optional[MCTSSearch] = None, fallback: Callable = aggressive_policy):
+        self.search = search or MCTSSearch()
+        self.fallback = fallback
+        self.pending = []
+        self.last_result = None
+
+    def __call__(self, game: Game, request: CommandRequest) -> str:
+        if any(cmd.tag == 'ATK' or cmd.tag.startswith('MOV') for cmd in request.commands):
+            self.last_result = self.search.search(game)
+            best = self.last_result.best
+            if best:
+                self.pending = list(reversed(best[1:]))
+                return best[0]
+            self.pending = []
+        elif self.pending:
+            return self.pending.pop()
+        return self.fallback(game, request)
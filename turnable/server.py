@@ -0,0 +1,231 @@
+"""
+Multi-session TCP server
+------------------------
+
+Hosts many text games on a single asyncio event loop, one :py:class:`turnable.game.Game` per connection,
+played with :py:meth:`turnable.game.Game.start_async` over :py:class:`SocketInputStream` and
+:py:class:`SocketOutputStream`. The protocol is plain text, so you can play with ``telnet`` or ``nc``:
+the server sends the game state and a prompt line ending in ``:``, and reads one line per command. ::
+
+    python -m turnable serve --port 8023 --max-sessions 500 --idle-timeout 60
+
+The module also includes a load test client that plays many sessions against a server: ::
+
+    python -m turnable loadtest --port 8023 --clients 200 --requests 100
+
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+
+from itertools import count
+from typing import Callable, Optional
+
+from turnable.game import Game
+from turnable.helpers.text import render_game
+from turnable.journal import Journal
+from turnable.streams import (AsyncBaseInputStream, AsyncBaseOutputStream, CommandRequest, CommandResponse,
+                              StreamException)
+
+
+class SessionClosed(StreamException):
+    """ Raised when the client disconnects or stays idle for too long. """
+    pass
+
+
+class SocketInputStream(AsyncBaseInputStream):
+    """ Sends the request label as a prompt line and reads the answer line from the connection. """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, idle_timeout: Optional[float] = None):
+        self.reader = reader
+        self.writer = writer
+        self.idle_timeout = idle_timeout
+
+    async def request(self, request: CommandRequest) -> CommandResponse:
+        self.writer.write(f'{request.label.rstrip()}\n'.encode())
+        await self.writer.drain()
+        try:
+            line = await asyncio.wait_for(self.reader.readline(), self.idle_timeout)
+        except asyncio.TimeoutError:
+            raise SessionClosed('Idle timeout')
+        if not line:
+            raise SessionClosed('Connection closed by client')
+        return CommandResponse(request, line.decode(errors='replace'))
+
+
+class SocketOutputStream(AsyncBaseOutputStream):
+    """ Writes the text render of the game to the connection. """
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+
+    async def send(self, game: Game):
+        self.writer.write(render_game(game).encode())
+        await self.writer.drain()
+
+
+def default_game_factory(session_id: int, instream: SocketInputStream, outstream: SocketOutputStream) -> Game:
+    from turnable import build_game
+    return build_game(f'Session {session_id}', f'Player{session_id}',
+                      instream=lambda: instream, outstream=lambda: outstream)
+
+
+class GameServer:
+    """
+    TCP server that plays a game per connection on the running event loop.
+
+    *game_factory* receives the session id and the socket streams and returns the :py:class:`turnable.game.Game`
+    to play. Connections beyond *max_sessions* are rejected, and sessions idle for more than *idle_timeout*
+    seconds are closed. With *journal_dir* every session is recorded to ``session-<id>.trnj`` in that
+    directory, to be replayed with :py:func:`turnable.journal.replay`.
+    """
+    _logger = logging.getLogger('turnable.server.GameServer')
+
+    def __init__(self,
+                 host: str = '127.0.0.1',
+                 port: int = 8023,
+                 game_factory: Callable = default_game_factory,
+                 max_sessions: int = 1000,
+                 idle_timeout: Optional[float] = 300,
+                 journal_dir: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.game_factory = game_factory
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.journal_dir = journal_dir
+        self.server = None
+        self.active = 0
+        self.peak = 0
+        self.started = 0
+        self.rejected = 0
+        self._ids = count(1)
+
+    async def start(self):
+        """ Starts listening. With port ``0`` a free port is picked and stored in :py:attr:`port`. """
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self._logger.info(f'Listening on {self.host}:{self.port}')
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if self.active >= self.max_sessions:
+            self.rejected += 1
+            writer.write(b'Server full.\n')
+            await self._close_writer(writer)
+            return
+
+        session_id = next(self._ids)
+        self.active += 1
+        self.started += 1
+        self.peak = max(self.peak, self.active)
+        journal = None
+        try:
+            instream = SocketInputStream(reader, writer, self.idle_timeout)
+            game = self.game_factory(session_id, instream, SocketOutputStream(writer))
+            if self.journal_dir is not None:
+                journal = game.journal = Journal(os.path.join(self.journal_dir, f'session-{session_id}.trnj'))
+            await game.start_async()
+            writer.write(b'Game over.\n')
+        except SessionClosed as e:
+            self._logger.debug(f'Session {session_id} closed: {e}')
+            if not reader.at_eof():
+                writer.write(f'{e}.\n'.encode())
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self._logger.debug(f'Session {session_id} lost connection.')
+        except Exception:
+            self._logger.exception(f'Session {session_id} crashed.')
+        finally:
+            self.active -= 1
+            if journal is not None:
+                journal.close()
+            await self._close_writer(writer)
+
+    @staticmethod
+    async def _close_writer(writer: asyncio.StreamWriter):
+        try:
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    def stats(self) -> dict:
+        return {'active': self.active, 'peak': self.peak, 'started': self.started, 'rejected': self.rejected}
+
+
+def answer_prompt(prompt: str, rng: random.Random) -> str:
+    """ Answers a server prompt the way :py:func:`turnable.simulation.aggressive_policy` would. """
+    prompt = prompt.upper()
+    if 'TARGET' in prompt:
+        return '1'
+    if 'DIRECTION' in prompt:
+        return rng.choice(('UP', 'DOWN', 'LEFT', 'RIGHT'))
+    return rng.choice(('ATK', 'MOVUP', 'MOVDOWN', 'MOVLEFT', 'MOVRIGHT'))
+
+
+async def run_client(host: str, port: int, max_requests: int = 100, seed: Optional[int] = None) -> list:
+    """
+    Plays a session answering up to *max_requests* prompts and returns the latency of each one in seconds,
+    measured from sending an answer until the next prompt arrives.
+    """
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    latencies = []
+    sent = None
+    try:
+        while len(latencies) < max_requests:
+            line = await reader.readline()
+            if not line:
+                break
+            text = line.decode(errors='replace').rstrip()
+            if not text.endswith(':'):
+                continue
+            if sent is not None:
+                latencies.append(time.perf_counter() - sent)
+            writer.write(f'{answer_prompt(text, rng)}\n'.encode())
+            await writer.drain()
+            sent = time.perf_counter()
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+    return latencies
+
+
+async def load_test(host: str = '127.0.0.1', port: int = 8023, clients: int = 100, max_requests: int = 100) -> dict:
+    """ Runs *clients* concurrent :py:func:`run_client` sessions and returns throughput and latency figures. """
+    start = time.perf_counter()
+    results = await asyncio.gather(*(run_client(host, port, max_requests, seed)
+                                     for seed in range(clients)), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(lat for result in results if isinstance(result, list) for lat in result)
+    errors = sum(1 for result in results if isinstance(result, BaseException))
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else 0.0
+
+    return {
+        'clients': clients,
+        'errors': errors,
+        'requests': len(latencies),
+        'elapsed': elapsed,
+        'requests_per_second': len(latencies) / elapsed if elapsed else 0.0,
+        'latency_p50': percentile(0.5),
+        'latency_p99': percentile(0.99),
+    }
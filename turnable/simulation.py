@@ -0,0 +1,208 @@
+"""
+Headless simulation
+-------------------
+
+The simulation module runs full games without any UI so you can playtest and balance your game by
+brute force. Games are played by a *policy*, a function that receives the :py:class:`turnable.game.Game`
+and the pending :py:class:`turnable.streams.CommandRequest` and returns the raw input the player would
+have typed.
+
+Games are spread over a process pool and their results are aggregated in a :py:class:`SimulationResult`: ::
+
+    from turnable.simulation import simulate, random_policy
+
+    result = simulate(10000, policy=random_policy, seed=42)
+    print(result)
+
+The same runner is available from the command line: ::
+
+    python -m turnable simulate --games 10000 --workers 8 --seed 42
+
+"""
+import os
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Iterable, Optional
+
+from turnable.chars import PlayableEntity
+from turnable.game import Game, endgame_player_dead
+from turnable.map import Map
+from turnable.streams import BaseInputStream, CommandRequest, CommandResponse
+
+
+DIRECTIONS = ('UP', 'DOWN', 'LEFT', 'RIGHT')
+
+
+def _has_command(request: CommandRequest, tag: str) -> bool:
+    return any(cmd.tag == tag for cmd in request.commands)
+
+
+def aggressive_policy(game: Game, request: CommandRequest) -> str:
+    """ Attacks whenever possible, picks the first target and wanders randomly otherwise. """
+    if _has_command(request, 'ATK'):
+        return 'ATK'
+    if _has_command(request, '([0-9]+)'):
+        return '1'
+    if _has_command(request, '(UP|DOWN|LEFT|RIGHT)'):
+        return game.rng.choice(DIRECTIONS)
+    return 'MOV' + game.rng.choice(DIRECTIONS)
+
+
+def random_policy(game: Game, request: CommandRequest) -> str:
+    """ Picks any non special command at random. """
+    if _has_command(request, '([0-9]+)'):
+        return str(game.rng.randint(1, len(game.room.enemies)))
+    if _has_command(request, '(UP|DOWN|LEFT|RIGHT)'):
+        return game.rng.choice(DIRECTIONS)
+    cmd = game.rng.choice([cmd for cmd in request.commands if not cmd.tag.startswith(':')])
+    if cmd.tag.startswith('MOV'):
+        return 'MOV' + game.rng.choice(DIRECTIONS)
+    return cmd.tag
+
+
+POLICIES = {
+    'aggressive': aggressive_policy,
+    'random': random_policy,
+}
+
+
+class PolicyInputStream(BaseInputStream):
+    """
+    Input stream that answers every :py:class:`turnable.streams.CommandRequest` with a *policy*.
+
+    The *game* attribute must be set before the game starts, as the policy receives it on every request.
+    """
+
+    def __init__(self, policy: Callable[[Game, CommandRequest], str], game: Optional[Game] = None):
+        self.policy = policy
+        self.game = game
+
+    def request(self, request: CommandRequest) -> CommandResponse:
+        return CommandResponse(request, self.policy(self.game, request))
+
+
+def endgame_turn_limit(max_turns: int, game: Game):
+    """ Endgame condition that also stops the game after *max_turns* turns. """
+    return endgame_player_dead(game) or game.turn >= max_turns
+
+
+class GameResult:
+    """ Outcome of a single simulated game. """
+
+    def __init__(self, seed: int, turns: int, level: int, died: bool, death_room: Optional[str] = None):
+        self.seed = seed
+        self.turns = turns
+        self.level = level
+        self.died = died
+        self.death_room = death_room
+
+
+class SimulationResult:
+    """ Aggregated results of many simulated games. Results from different workers can be merged. """
+
+    def __init__(self):
+        self.games = 0
+        self.total_turns = 0
+        self.max_turns = 0
+        self.levels = Counter()
+        self.deaths = Counter()
+        self.survived = 0
+
+    def add(self, result: GameResult):
+        self.games += 1
+        self.total_turns += result.turns
+        self.max_turns = max(self.max_turns, result.turns)
+        self.levels[result.level] += 1
+        if result.died:
+            self.deaths[result.death_room] += 1
+        else:
+            self.survived += 1
+
+    def merge(self, other: 'SimulationResult'):
+        self.games += other.games
+        self.total_turns += other.total_turns
+        self.max_turns = max(self.max_turns, other.max_turns)
+        self.levels.update(other.levels)
+        self.deaths.update(other.deaths)
+        self.survived += other.survived
+
+    @property
+    def mean_turns(self) -> float:
+        return self.total_turns / self.games if self.games else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'games': self.games,
+            'mean_turns': self.mean_turns,
+            'max_turns': self.max_turns,
+            'survived': self.survived,
+            'levels': {str(level): count for level, count in sorted(self.levels.items())},
+            'deaths': dict(self.deaths.most_common()),
+        }
+
+    def __str__(self):
+        lines = [
+            f'Games: {self.games}',
+            f'Turns survived: mean={self.mean_turns:.2f} max={self.max_turns}',
+            f'Survived turn limit: {self.survived}',
+            'Levels reached:',
+        ]
+        lines.extend(f'  {level}: {count}' for level, count in sorted(self.levels.items()))
+        lines.append('Deaths per room type:')
+        lines.extend(f'  {room}: {count}' for room, count in self.deaths.most_common())
+        return '\n'.join(lines)
+
+
+def run_game(seed: int,
+             policy: Callable[[Game, CommandRequest], str] = aggressive_policy,
+             player_class: Callable = PlayableEntity,
+             map_class: Callable = Map,
+             max_turns: int = 1000) -> GameResult:
+    """ Plays a full headless game and returns its :py:class:`GameResult`. """
+    from turnable import build_game
+
+    instream = PolicyInputStream(policy)
+    game = build_game('Simulation', 'Bot', player_class, map_class,
+                      instream=lambda: instream, outstream=lambda: None, seed=seed)
+    game.endgame_condition = partial(endgame_turn_limit, max_turns)
+    instream.game = game
+    game.start()
+
+    died = not game.player.is_alive()
+    death_room = game.room.__class__.__name__ if died else None
+    return GameResult(seed, game.turn, game.map.level, died, death_room)
+
+
+def run_batch(seeds: Iterable[int], **kwargs) -> SimulationResult:
+    """ Runs a game for every seed in *seeds* and aggregates the results. *kwargs* are passed to :py:func:`run_game`. """
+    result = SimulationResult()
+    for seed in seeds:
+        result.add(run_game(seed, **kwargs))
+    return result
+
+
+def simulate(games: int,
+             workers: Optional[int] = None,
+             seed: int = 0,
+             batch_size: Optional[int] = None,
+             **kwargs) -> SimulationResult:
+    """
+    Runs *games* headless games spread over *workers* processes (defaults to all cores).
+
+    Game ``i`` is played with seed ``seed + i`` so any single game can be replayed with :py:func:`run_game`.
+    *kwargs* are passed to :py:func:`run_game`; policies and classes must be picklable (defined at module level).
+    """
+    workers = workers or os.cpu_count() or 1
+    seeds = range(seed, seed + games)
+    if workers == 1:
+        return run_batch(seeds, **kwargs)
+
+    batch_size = batch_size or max(1, min(1000, games // (workers * 4) or 1))
+    batches = [seeds[ix:ix + batch_size] for ix in range(0, games, batch_size)]
+    result = SimulationResult()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for partial_result in pool.map(partial(run_batch, **kwargs), batches):
+            result.merge(partial_result)
+    return result
@@ -0,0 +1,597 @@
+"""
+Binary snapshots of a :py:class:`turnable.game.Game`.
+
+:py:meth:`turnable.game.Game.snapshot` packs the game state (player, map and its grid, built rooms, enemies,
+status effects, level, turn, state and random generator) into a compact versioned binary format, and
+:py:meth:`turnable.game.Game.restore` loads it back into a game, rebuilding every reference to the game. ::
+
+    data = game.snapshot()
+    ...
+    other_game.restore(data)
+
+Back references (``game``, ``map``) are not stored. Classes are stored by import path, so they must be
+importable where the snapshot is restored. Entity and room attributes are stored when they hold ``None``,
+``bool``, ``int``, ``float`` or ``str`` values; anything else (for example callables) is skipped.
+Hooks, streams and the endgame condition are not part of the snapshot: the restored game keeps its own.
+
+Layout (all integers little endian): ::
+
+    b'TRNB' | version u16 | strings: count u32, (length u32, utf-8)* | body
+
+Classes and attribute names are stored once in the string table and referenced by index from the body.
+"""
+import random
+import struct
+import importlib
+
+from array import array
+from typing import Any, Dict, Optional
+
+from turnable.chars import Entity
+from turnable.effects import EffectScheduler
+from turnable.fork import RoomOverlay
+from turnable.geometry import Position
+from turnable.map import ChunkedMap, CompactGrid, LazyGrid, Map
+from turnable.rooms import FightRoom, Room
+from turnable.state import States
+
+
+MAGIC = b'TRNB'
+VERSION = 1
+
+_U8 = struct.Struct('<B')
+_U16 = struct.Struct('<H')
+_U32 = struct.Struct('<I')
+_I32 = struct.Struct('<i')
+_I64 = struct.Struct('<q')
+_U64 = struct.Struct('<Q')
+_F64 = struct.Struct('<d')
+_POS = struct.Struct('<ii')
+
+_NONE, _FALSE, _TRUE, _INT, _FLOAT, _STR = range(6)
+_GRID_NONE, _GRID_LIST, _GRID_LAZY, _GRID_COMPACT, _GRID_CHUNKED = range(5)
+_STATE_NONE, _STATE_ENUM, _STATE_BOOL = range(3)
+
+# Attributes that are stored explicitly or rebuilt on restore.
+_ENTITY_SKIP = {'game', 'pos', 'status_list', '_actions_cache', '_store', '_slot'}
+_ROOM_SKIP = {'game', 'pos', 'enemies', 'store', 'scheduler'}
+_EFFECT_SKIP = {'target', 'active'}
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _class_path(cls: type) -> str:
+    return f'{cls.__module__}:{cls.__qualname__}'
+
+
+def _import_class(path: str) -> type:
+    module, qualname = path.split(':')
+    obj = importlib.import_module(module)
+    for part in qualname.split('.'):
+        obj = getattr(obj, part)
+    return obj
+
+
+class _Writer:
+    def __init__(self):
+        self.buf = bytearray()
+        self.strings = {}
+
+    def u8(self, value: int):
+        self.buf += _U8.pack(value)
+
+    def u16(self, value: int):
+        self.buf += _U16.pack(value)
+
+    def u32(self, value: int):
+        self.buf += _U32.pack(value)
+
+    def i32(self, value: int):
+        self.buf += _I32.pack(value)
+
+    def i64(self, value: int):
+        self.buf += _I64.pack(value)
+
+    def u64(self, value: int):
+        self.buf += _U64.pack(value)
+
+    def f64(self, value: float):
+        self.buf += _F64.pack(value)
+
+    def blob(self, value: bytes):
+        self.u32(len(value))
+        self.buf += value
+
+    def str(self, value: str):
+        self.blob(value.encode())
+
+    def ref(self, value: str):
+        """ Writes the index of *value* in the string table. """
+        ix = self.strings.get(value)
+        if ix is None:
+            ix = self.strings[value] = len(self.strings)
+        self.u32(ix)
+
+    def cls(self, cls: type):
+        self.ref(_class_path(cls))
+
+    def pos(self, pos: Position):
+        if pos is None:
+            self.u8(0)
+        else:
+            self.u8(1)
+            self.buf += _POS.pack(pos.x, pos.y)
+
+    def value(self, value: Any) -> bool:
+        if value is None:
+            self.u8(_NONE)
+        elif value is True:
+            self.u8(_TRUE)
+        elif value is False:
+            self.u8(_FALSE)
+        elif isinstance(value, int):
+            self.u8(_INT)
+            self.i64(value)
+        elif isinstance(value, float):
+            self.u8(_FLOAT)
+            self.f64(value)
+        elif isinstance(value, str):
+            self.u8(_STR)
+            self.str(value)
+        else:
+            return False
+        return True
+
+    def attrs(self, obj: Any, skip: set, override: Optional[dict] = None):
+        values = _fields(obj)
+        if override is not None:
+            values.update(override)
+        items = [(key, value) for key, value in values.items()
+                 if key not in skip and (value is None or isinstance(value, (bool, int, float, str)))]
+        self.u32(len(items))
+        for key, value in items:
+            self.ref(key)
+            self.value(value)
+
+    def getvalue(self) -> bytes:
+        header = bytearray(MAGIC)
+        header += _U16.pack(VERSION)
+        header += _U32.pack(len(self.strings))
+        for string in self.strings:
+            encoded = string.encode()
+            header += _U32.pack(len(encoded))
+            header += encoded
+        return bytes(header + self.buf)
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = memoryview(data)
+        self.offset = 0
+        self.classes = {}
+        if bytes(self.data[:4]) != MAGIC:
+            raise SnapshotError('Not a Turnable snapshot')
+        self.offset = 4
+        version = self.u16()
+        if version != VERSION:
+            raise SnapshotError(f'Unsupported snapshot version {version}')
+        self.strings = [self.str() for _ in range(self.u32())]
+
+    def _unpack(self, struct_: struct.Struct):
+        value = struct_.unpack_from(self.data, self.offset)
+        self.offset += struct_.size
+        return value
+
+    def u8(self) -> int:
+        return self._unpack(_U8)[0]
+
+    def u16(self) -> int:
+        return self._unpack(_U16)[0]
+
+    def u32(self) -> int:
+        return self._unpack(_U32)[0]
+
+    def i32(self) -> int:
+        return self._unpack(_I32)[0]
+
+    def i64(self) -> int:
+        return self._unpack(_I64)[0]
+
+    def u64(self) -> int:
+        return self._unpack(_U64)[0]
+
+    def f64(self) -> float:
+        return self._unpack(_F64)[0]
+
+    def blob(self) -> bytes:
+        size = self.u32()
+        value = bytes(self.data[self.offset:self.offset + size])
+        self.offset += size
+        return value
+
+    def str(self) -> str:
+        return self.blob().decode()
+
+    def ref(self) -> str:
+        return self.strings[self.u32()]
+
+    def cls(self) -> type:
+        path = self.ref()
+        cls = self.classes.get(path)
+        if cls is None:
+            cls = self.classes[path] = _import_class(path)
+        return cls
+
+    def pos(self):
+        if not self.u8():
+            return None
+        return Position(*self._unpack(_POS))
+
+    def value(self) -> Any:
+        tag = self.u8()
+        if tag == _NONE:
+            return None
+        if tag == _TRUE:
+            return True
+        if tag == _FALSE:
+            return False
+        if tag == _INT:
+            return self.i64()
+        if tag == _FLOAT:
+            return self.f64()
+        if tag == _STR:
+            return self.str()
+        raise SnapshotError(f'Unknown value tag {tag}')
+
+    def attrs(self) -> Dict[str, Any]:
+        return {self.ref(): self.value() for _ in range(self.u32())}
+
+
+_slot_names = {}
+
+
+def _fields(obj: Any) -> Dict[str, Any]:
+    """ Returns the attributes of *obj*, both in ``__slots__`` and in its ``__dict__``. """
+    cls = type(obj)
+    names = _slot_names.get(cls)
+    if names is None:
+        names = []
+        for klass in reversed(cls.__mro__):
+            slots = klass.__dict__.get('__slots__', ())
+            names.extend((slots,) if isinstance(slots, str) else slots)
+        names = _slot_names[cls] = tuple(name for name in names if name not in ('__dict__', '__weakref__'))
+    fields = {name: getattr(obj, name) for name in names if hasattr(obj, name)}
+    fields.update(getattr(obj, '__dict__', {}))
+    return fields
+
+
+def _set_fields(obj: Any, fields: Dict[str, Any]):
+    for name, value in fields.items():
+        setattr(obj, name, value)
+
+
+def _write_entity(w: _Writer, entity: Entity):
+    w.cls(type(entity))
+    w.pos(entity.pos)
+    w.u32(len(entity.status_list))
+    for status in entity.status_list:
+        w.cls(type(status))
+        w.value(status.value)
+    store = entity._store
+    stats = None if store is None else {f'_{field}': value for field, value in store.values(entity._slot).items()}
+    w.attrs(entity, _ENTITY_SKIP, stats)
+
+
+def _read_entity(r: _Reader, game) -> Entity:
+    cls = r.cls()
+    entity = cls.__new__(cls)
+    entity.pos = r.pos()
+    entity.status_list = []
+    for _ in range(r.u32()):
+        status_cls = r.cls()
+        entity.status_list.append(status_cls(r.value()))
+    entity._store = None
+    entity._slot = 0
+    _set_fields(entity, r.attrs())
+    entity._actions_cache = None
+    entity.game = game
+    return entity
+
+
+def _write_room(w: _Writer, room: Room):
+    w.cls(type(room))
+    w.pos(room.pos)
+    enemies = getattr(room, 'enemies', None)
+    if enemies is None:
+        w.u8(0)
+    else:
+        w.u8(1)
+        w.u32(len(enemies))
+        for enemy in enemies:
+            _write_entity(w, enemy)
+    w.attrs(room, _ROOM_SKIP)
+
+
+def _read_room(r: _Reader, game) -> Room:
+    cls = r.cls()
+    room = cls.__new__(cls)
+    room.pos = r.pos()
+    room.game = game
+    if r.u8():
+        room.enemies = [_read_entity(r, game) for _ in range(r.u32())]
+    _set_fields(room, r.attrs())
+    if isinstance(room, FightRoom):
+        room.scheduler = None
+        room.build_store()
+    return room
+
+
+def _write_built_rooms(w: _Writer, rooms: dict):
+    w.u32(len(rooms))
+    for (x, y), room in rooms.items():
+        w.i32(x)
+        w.i32(y)
+        _write_room(w, room)
+
+
+def _read_built_rooms(r: _Reader, game) -> dict:
+    rooms = {}
+    for _ in range(r.u32()):
+        key = (r.i32(), r.i32())
+        rooms[key] = _read_room(r, game)
+    return rooms
+
+
+def _write_compact(w: _Writer, grid: CompactGrid):
+    w.u32(grid.width)
+    w.u32(grid.height)
+    w.pos(grid.origin)
+    w.u32(len(grid.room_types))
+    for cls in grid.room_types:
+        w.cls(cls)
+    w.blob(bytes(grid.codes))
+    w.blob(bytes(grid.flags))
+    _write_built_rooms(w, grid.rooms)
+
+
+def _read_compact(r: _Reader, map_: Map) -> CompactGrid:
+    width, height = r.u32(), r.u32()
+    origin = r.pos()
+    room_types = [r.cls() for _ in range(r.u32())]
+    codes = bytearray(r.blob())
+    flags = bytearray(r.blob())
+    grid = CompactGrid(map_, room_types, width, height, codes, flags=flags, origin=origin)
+    grid.rooms = _read_built_rooms(r, map_.game)
+    return grid
+
+
+def _write_lazy(w: _Writer, grid: LazyGrid):
+    table = {}
+    codes = array('H', (table.setdefault(cls, len(table)) for column in grid.classes for cls in column))
+    w.u32(grid.width)
+    w.u32(grid.height)
+    w.pos(grid.origin)
+    w.u32(len(table))
+    for cls in table:
+        w.cls(cls)
+    w.blob(codes.tobytes())
+    _write_built_rooms(w, grid.rooms)
+
+
+def _read_lazy(r: _Reader, map_: Map) -> LazyGrid:
+    width, height = r.u32(), r.u32()
+    origin = r.pos()
+    table = [r.cls() for _ in range(r.u32())]
+    codes = array('H')
+    codes.frombytes(r.blob())
+    flat = [table[code] for code in codes]
+    grid = LazyGrid(map_, [flat[x * height:(x + 1) * height] for x in range(width)], origin=origin)
+    grid.rooms = _read_built_rooms(r, map_.game)
+    return grid
+
+
+def _write_map(w: _Writer, map_: Map):
+    w.cls(type(map_))
+    w.i64(map_.level)
+    if isinstance(map_, ChunkedMap):
+        w.u8(_GRID_CHUNKED)
+        w.u8(map_.level_seed is not None)
+        w.u64(map_.level_seed or 0)
+        w.u64(map_.evictions)
+        w.u32(len(map_.chunks))
+        for (cx, cy), chunk in map_.chunks.items():
+            w.i32(cx)
+            w.i32(cy)
+            _write_compact(w, chunk)
+        w.u32(len(map_.stored_flags))
+        for (cx, cy), flags in map_.stored_flags.items():
+            w.i32(cx)
+            w.i32(cy)
+            w.blob(bytes(flags))
+    elif map_.grid is None:
+        w.u8(_GRID_NONE)
+    elif isinstance(map_.grid, CompactGrid):
+        w.u8(_GRID_COMPACT)
+        _write_compact(w, map_.grid)
+    elif isinstance(map_.grid, LazyGrid):
+        w.u8(_GRID_LAZY)
+        _write_lazy(w, map_.grid)
+    else:
+        w.u8(_GRID_LIST)
+        w.u32(len(map_.grid))
+        w.u32(len(map_.grid[0]) if map_.grid else 0)
+        for column in map_.grid:
+            for room in column:
+                _write_room(w, room)
+    _write_overlay(w, map_.overlay)
+
+
+def _read_map(r: _Reader, game) -> Map:
+    map_ = r.cls()()
+    map_.game = game
+    map_.level = r.i64()
+    kind = r.u8()
+    if kind == _GRID_CHUNKED:
+        has_seed = r.u8()
+        seed = r.u64()
+        map_.level_seed = seed if has_seed else None
+        map_.evictions = r.u64()
+        for _ in range(r.u32()):
+            key = (r.i32(), r.i32())
+            map_.chunks[key] = _read_compact(r, map_)
+        for _ in range(r.u32()):
+            key = (r.i32(), r.i32())
+            map_.stored_flags[key] = bytearray(r.blob())
+    elif kind == _GRID_COMPACT:
+        map_.grid = _read_compact(r, map_)
+        map_.width, map_.height = map_.grid.width, map_.grid.height
+    elif kind == _GRID_LAZY:
+        map_.grid = _read_lazy(r, map_)
+        map_.width, map_.height = map_.grid.width, map_.grid.height
+    elif kind == _GRID_LIST:
+        map_.width, map_.height = width, height = r.u32(), r.u32()
+        map_.grid = [[_read_room(r, game) for _ in range(height)] for _ in range(width)]
+    map_.overlay = _read_overlay(r, game)
+    return map_
+
+
+def _write_overlay(w: _Writer, overlay: RoomOverlay):
+    if overlay is None:
+        w.u8(0)
+        return
+    rooms = {}
+    for layer in reversed(overlay.frozen):
+        rooms.update(layer)
+    rooms.update(overlay.local)
+    w.u8(1)
+    _write_built_rooms(w, rooms)
+
+
+def _read_overlay(r: _Reader, game):
+    if not r.u8():
+        return None
+    overlay = RoomOverlay()
+    overlay.local = _read_built_rooms(r, game)
+    return overlay
+
+
+def _write_rng(w: _Writer, rng: Any):
+    if type(rng) is not random.Random:
+        w.u8(0)
+        return
+    version, internal, gauss = rng.getstate()
+    w.u8(1)
+    w.u8(version)
+    w.blob(array('I', internal).tobytes())
+    w.u8(gauss is not None)
+    w.f64(gauss or 0.0)
+
+
+def _read_rng(r: _Reader, game):
+    if not r.u8():
+        return
+    version = r.u8()
+    internal = array('I')
+    internal.frombytes(r.blob())
+    has_gauss = r.u8()
+    gauss = r.f64()
+    if type(game.rng) is not random.Random:
+        game.rng = random.Random()
+    game.rng.setstate((version, tuple(internal), gauss if has_gauss else None))
+
+
+def _write_state(w: _Writer, state: Any):
+    if state is None:
+        w.u8(_STATE_NONE)
+    elif isinstance(state, States):
+        w.u8(_STATE_ENUM)
+        w.u8(state.value)
+    else:
+        w.u8(_STATE_BOOL)
+        w.u8(bool(state))
+
+
+def _read_state(r: _Reader):
+    kind = r.u8()
+    value = r.u8() if kind != _STATE_NONE else None
+    if kind == _STATE_ENUM:
+        return States(value)
+    if kind == _STATE_BOOL:
+        return bool(value)
+    return None
+
+
+def _write_effects(w: _Writer, effects: EffectScheduler):
+    w.i64(effects.turn)
+    located = effects.locate()
+    w.u32(len(located))
+    for effect, location in located:
+        w.cls(type(effect))
+        w.attrs(effect, _EFFECT_SKIP)
+        if location is None:
+            w.u8(0)
+        else:
+            w.u8(1)
+            w.pos(location[0])
+            w.u32(location[1])
+
+
+def _read_effects(r: _Reader, game) -> EffectScheduler:
+    effects = EffectScheduler(game)
+    effects.turn = r.i64()
+    located = []
+    for _ in range(r.u32()):
+        cls = r.cls()
+        effect = cls.__new__(cls)
+        _set_fields(effect, r.attrs())
+        location = (r.pos(), r.u32()) if r.u8() else None
+        located.append((effect, location))
+    effects.relocate(located)
+    return effects
+
+
+def dump_game(game) -> bytes:
+    """ Returns the binary snapshot of *game*. """
+    w = _Writer()
+    w.str(game.name)
+    w.i64(game.turn)
+    w.u8(game.is_done)
+    w.u8(game.advance_level)
+    _write_state(w, game.state)
+    _write_rng(w, game.rng)
+    _write_entity(w, game.player)
+    _write_map(w, game.map)
+    w.pos(game.room.pos if game.room is not None else None)
+    _write_effects(w, game.effects)
+    return w.getvalue()
+
+
+def load_game(game, data: bytes):
+    """ Restores the snapshot in *data* into *game*, replacing its player and map. """
+    r = _Reader(data)
+    game.name = r.str()
+    game.turn = r.i64()
+    game.is_done = bool(r.u8())
+    game.advance_level = bool(r.u8())
+    game.state = _read_state(r)
+    _read_rng(r, game)
+    game.player = _read_entity(r, game)
+    game.map = _read_map(r, game)
+    game.map.rebuild_index()
+    room_pos = r.pos()
+    game.room = game.map.get_room(room_pos) if room_pos is not None else None
+    game.effects = _read_effects(r, game)
+
+
+def dump_rng(rng) -> bytes:
+    """ Returns the state of *rng* in the snapshot format. Only :py:class:`random.Random` states are stored. """
+    w = _Writer()
+    _write_rng(w, rng)
+    return w.getvalue()
+
+
+def load_rng(game, data: bytes):
+    """ Restores a state returned by :py:func:`dump_rng` into the random generator of *game*. """
+    _read_rng(_Reader(data), game)
@@ -0,0 +1,191 @@
+"""
+Spatial index
+-------------
+
+A :py:class:`SpatialIndex` counts the entities in every cell of the map, grouped in square buckets of
+:py:attr:`SpatialIndex.BUCKET_SIZE` cells, so range and nearest neighbour queries only look at the buckets
+around the searched area instead of every room. :py:class:`turnable.map.Map` keeps one in
+:py:attr:`turnable.map.Map.index`, updated when rooms spawn or lose enemies and when the player moves, and
+answers queries with entities: ::
+
+    game.map.entities_in_radius(game.player.pos, 3)
+    game.map.entities_in_rect(Position(0, 0), Position(10, 10))
+    game.map.nearest_entity(game.player.pos, predicate=lambda entity: entity is not game.player)
+
+The index holds counts instead of entities, so it can be shared by forked maps until one of them changes a
+bucket (see :py:meth:`SpatialIndex.fork`), and entities are always taken from the rooms of the map asking.
+Distances are euclidean, in cells.
+"""
+import heapq
+
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+Cell = Tuple[int, int]
+
+
+class SpatialIndex:
+    """ Amount of entities per cell, in buckets of :py:attr:`BUCKET_SIZE` x :py:attr:`BUCKET_SIZE` cells. """
+    BUCKET_SIZE = 16
+
+    def __init__(self, bucket_size: Optional[int] = None):
+        self.bucket_size = bucket_size or self.BUCKET_SIZE
+        self.buckets: Dict[Cell, Dict[Cell, int]] = {}
+        self.size = 0
+        self.placed: Dict[str, Cell] = {}
+        self._shared: Set[Cell] = set()
+
+    def _bucket(self, x: int, y: int, create: bool = False) -> Optional[Dict[Cell, int]]:
+        """ Returns the bucket of (*x*, *y*) to modify, copying it first if it's shared with a fork. """
+        key = (x // self.bucket_size, y // self.bucket_size)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if create:
+                bucket = self.buckets[key] = {}
+            return bucket
+        if key in self._shared:
+            bucket = self.buckets[key] = dict(bucket)
+            self._shared.discard(key)
+        return bucket
+
+    def add(self, x: int, y: int, count: int = 1):
+        """ Adds *count* entities at (*x*, *y*). """
+        if count <= 0:
+            return
+        bucket = self._bucket(x, y, create=True)
+        bucket[x, y] = bucket.get((x, y), 0) + count
+        self.size += count
+
+    def remove(self, x: int, y: int, count: int = 1):
+        """ Removes up to *count* entities at (*x*, *y*). """
+        bucket = self._bucket(x, y)
+        current = bucket.get((x, y), 0) if bucket is not None else 0
+        if count <= 0 or not current:
+            return
+        count = min(count, current)
+        if current == count:
+            del bucket[x, y]
+            if not bucket:
+                del self.buckets[x // self.bucket_size, y // self.bucket_size]
+        else:
+            bucket[x, y] = current - count
+        self.size -= count
+
+    def place(self, key: str, x: int, y: int):
+        """
+        Moves the entity known as *key*, such as the player, to (*x*, *y*). The index remembers where it put it,
+        so the entity is added the first time and moved from its previous cell afterwards.
+        """
+        old = self.placed.get(key)
+        self.placed[key] = (x, y)
+        if old is not None:
+            size = self.bucket_size
+            bucket_key = (x // size, y // size)
+            bucket = self.buckets.get(bucket_key)
+            if bucket is not None and bucket_key == (old[0] // size, old[1] // size) \
+                    and bucket_key not in self._shared and old in bucket:
+                # Moves within a bucket only update it.
+                count = bucket[old]
+                if count == 1:
+                    del bucket[old]
+                else:
+                    bucket[old] = count - 1
+                bucket[x, y] = bucket.get((x, y), 0) + 1
+                return
+            self.remove(*old)
+        self.add(x, y)
+
+    def count(self, x: int, y: int) -> int:
+        bucket = self.buckets.get((x // self.bucket_size, y // self.bucket_size))
+        return bucket.get((x, y), 0) if bucket is not None else 0
+
+    def in_rect(self, x0: int, y0: int, x1: int, y1: int) -> Iterator[Cell]:
+        """ Yields the occupied cells with ``x0 <= x <= x1`` and ``y0 <= y <= y1``. """
+        size = self.bucket_size
+        buckets = self.buckets
+        for bx in range(x0 // size, x1 // size + 1):
+            for by in range(y0 // size, y1 // size + 1):
+                bucket = buckets.get((bx, by))
+                if bucket is None:
+                    continue
+                inside = x0 <= bx * size and (bx + 1) * size - 1 <= x1 \
+                    and y0 <= by * size and (by + 1) * size - 1 <= y1
+                for cell in bucket:
+                    if inside or (x0 <= cell[0] <= x1 and y0 <= cell[1] <= y1):
+                        yield cell
+
+    def in_radius(self, x: int, y: int, radius: float) -> Iterator[Cell]:
+        """ Yields the occupied cells at most *radius* cells away from (*x*, *y*). """
+        reach = int(radius)
+        limit = radius * radius
+        for cx, cy in self.in_rect(x - reach, y - reach, x + reach, y + reach):
+            if (cx - x) ** 2 + (cy - y) ** 2 <= limit:
+                yield cx, cy
+
+    def nearest(self, x: int, y: int, max_distance: Optional[float] = None) -> Iterator[Tuple[int, Cell]]:
+        """
+        Yields ``(squared distance, cell)`` for the occupied cells from the closest to (*x*, *y*) outwards, up to
+        *max_distance*. Buckets are visited in rings around the one of (*x*, *y*) as the search goes on.
+        """
+        size = self.bucket_size
+        buckets = self.buckets
+        bx, by = x // size, y // size
+        limit = max_distance * max_distance if max_distance is not None else None
+        heap = []
+        unvisited = len(buckets)
+        ring = 0
+        while unvisited or heap:
+            if unvisited:
+                for key in _ring(bx, by, ring):
+                    bucket = buckets.get(key)
+                    if bucket is not None:
+                        unvisited -= 1
+                        for cx, cy in bucket:
+                            heapq.heappush(heap, ((cx - x) ** 2 + (cy - y) ** 2, (cx, cy)))
+                # Cells in the buckets of later rings are at least this far away.
+                gap = min(x - (bx - ring) * size, (bx + ring + 1) * size - 1 - x,
+                          y - (by - ring) * size, (by + ring + 1) * size - 1 - y) + 1
+                bound = gap * gap if unvisited else None
+                ring += 1
+            else:
+                bound = None
+            while heap and (bound is None or heap[0][0] < bound):
+                distance, cell = heapq.heappop(heap)
+                if limit is not None and distance > limit:
+                    return
+                yield distance, cell
+            if limit is not None and bound is not None and bound > limit:
+                return
+
+    def fork(self) -> 'SpatialIndex':
+        """
+        Returns a copy of the index. The buckets are shared by both indexes and copied by the first one that
+        changes them, so forking only costs the copy of the bucket table.
+        """
+        other = SpatialIndex(self.bucket_size)
+        other.buckets = dict(self.buckets)
+        other.size = self.size
+        other.placed = dict(self.placed)
+        other._shared = set(self.buckets)
+        self._shared = set(self.buckets)
+        return other
+
+    def __len__(self):
+        return self.size
+
+
+def game_index(game) -> Optional[SpatialIndex]:
+    """ Returns the spatial index of the map of *game*, if it has one. """
+    return getattr(game.map, 'index', None)
+
+
+def _ring(bx: int, by: int, ring: int) -> Iterator[Cell]:
+    """ Yields the buckets at Chebyshev distance *ring* from (*bx*, *by*). """
+    if ring == 0:
+        yield bx, by
+        return
+    for x in range(bx - ring, bx + ring + 1):
+        yield x, by - ring
+        yield x, by + ring
+    for y in range(by - ring + 1, by + ring):
+        yield bx - ring, y
+        yield bx + ring, y
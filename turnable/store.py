@@ -0,0 +1,140 @@
+"""
+Structure of arrays storage for entity stats.
+
+An :py:class:`EntityStore` keeps the health, armor and damage of many entities in parallel arrays (NumPy arrays
+when NumPy is installed, lists otherwise) plus an alive mask. Entities added to a store become views over it:
+reading or setting ``entity.health`` goes to its slot in the store. This lets damage to many targets be
+applied in a single call with :py:meth:`EntityStore.take_damage`, which is what
+:py:meth:`turnable.chars.Entity.attack` does for area attacks such as :py:class:`turnable.chars.Mage`'s. ::
+
+    store = EntityStore(room.enemies)
+    store.take_damage([0, 1, 2], 10)
+
+Set :py:attr:`turnable.rooms.FightRoom.ENTITY_STORE` to ``True`` to give every fight room a store for its
+enemies. It's disabled by default: with a handful of enemies per room NumPy's per call overhead outweighs
+the gain, which pays off for rooms with many enemies.
+"""
+import copy
+import logging
+
+from typing import Dict, Iterable, Sequence, Union
+
+from turnable.events import COMBAT
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+COMBAT.define('store_damage', 'Slots {0} received {1} damage')
+
+
+class EntityStore:
+    """ Parallel arrays of entity stats. Entities are bound to a slot with :py:meth:`add`. """
+    FIELDS = ('health', 'armor', 'damage')
+    USE_NUMPY = True
+
+    def __init__(self, entities: Iterable = (), capacity: int = 4):
+        entities = list(entities)
+        self.use_numpy = self.USE_NUMPY and numpy is not None
+        self.size = 0
+        self._allocate(max(capacity, len(entities)))
+        for entity in entities:
+            self.add(entity)
+
+    def _allocate(self, capacity: int):
+        if self.use_numpy:
+            for field in self.FIELDS:
+                setattr(self, field, numpy.zeros(capacity, dtype=numpy.int64))
+            self.alive = numpy.zeros(capacity, dtype=bool)
+        else:
+            for field in self.FIELDS:
+                setattr(self, field, [0] * capacity)
+            self.alive = [False] * capacity
+        self.capacity = capacity
+
+    def _grow(self):
+        old = {field: getattr(self, field) for field in self.FIELDS + ('alive',)}
+        self._allocate(self.capacity * 2)
+        for field, values in old.items():
+            getattr(self, field)[:self.size] = values[:self.size]
+
+    def add(self, entity) -> int:
+        """ Moves the stats of *entity* into a new slot and binds the entity to it. Returns the slot. """
+        if entity._store is not None:
+            raise ValueError(f'{entity} already belongs to a store')
+        if self.size == self.capacity:
+            self._grow()
+        slot = self.size
+        self.size += 1
+        for field in self.FIELDS:
+            getattr(self, field)[slot] = getattr(entity, field)
+        self.alive[slot] = entity.health > 0
+        entity._store = self
+        entity._slot = slot
+        return slot
+
+    def detach(self, entity):
+        """ Copies the stats of *entity* back into it and unbinds it. Its slot is left unused. """
+        values = self.values(entity._slot)
+        entity._store = None
+        for field, value in values.items():
+            setattr(entity, field, value)
+
+    def get(self, field: str, slot: int) -> int:
+        return int(getattr(self, field)[slot])
+
+    def set(self, field: str, slot: int, value: int):
+        getattr(self, field)[slot] = value
+        if field == 'health':
+            self.alive[slot] = value > 0
+
+    def values(self, slot: int) -> Dict[str, int]:
+        """ Returns the stats in *slot* by field name. """
+        return {field: self.get(field, slot) for field in self.FIELDS}
+
+    def take_damage(self, slots: Sequence[int], damage: Union[int, Sequence[int]]):
+        """
+        Applies *damage* (one value, or one per slot) to the entities in *slots*, with the same armor then
+        health rule as :py:meth:`turnable.chars.HealthyEntity.take_damage`. Slots must not repeat.
+        """
+        if self.use_numpy:
+            slots = numpy.asarray(slots, dtype=numpy.intp)
+            damage = numpy.asarray(damage, dtype=numpy.int64)
+            armor = self.armor[slots]
+            has_armor = armor != 0
+            left = numpy.where(has_armor, damage - armor, damage)
+            self.armor[slots] = numpy.where(has_armor, numpy.maximum(0, armor - damage), armor)
+            health = self.health[slots] - numpy.maximum(left, 0)
+            self.health[slots] = health
+            self.alive[slots] = health > 0
+        else:
+            if isinstance(damage, int):
+                damage = [damage] * len(slots)
+            for slot, dmg in zip(slots, damage):
+                left = dmg
+                armor = self.armor[slot]
+                if armor:
+                    left = dmg - armor
+                    self.armor[slot] = max(0, armor - dmg)
+                if left > 0:
+                    self.health[slot] -= left
+                self.alive[slot] = self.health[slot] > 0
+
+        if COMBAT.debug:
+            COMBAT.emit(logging.DEBUG, 'store_damage', [int(slot) for slot in slots],
+                        damage.tolist() if self.use_numpy else damage)
+
+    def alive_count(self) -> int:
+        return int(sum(self.alive[:self.size]))
+
+    def copy(self) -> 'EntityStore':
+        """ Returns a store with copies of the arrays. Entities stay bound to this one. """
+        other = copy.copy(self)
+        for field in self.FIELDS + ('alive',):
+            setattr(other, field, copy.copy(getattr(self, field)))
+        return other
+
+    def __len__(self):
+        return self.size
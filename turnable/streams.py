@@ -1,11 +1,12 @@
 from __future__ import annotations
 
 import sys
+import inspect
 import logging
 
-from turnable.command import Command
+from turnable.command import Command, get_dispatcher
 
-from typing import Optional, TYPE_CHECKING
+from typing import Optional, Tuple, TYPE_CHECKING
 if TYPE_CHECKING:
     from turnable.game import Game
 
@@ -34,37 +35,91 @@ class BaseOutputStream:
         raise NotImplementedError()
 
 
+class AsyncBaseInputStream(BaseInputStream):
+    """
+    Input stream for games played with :py:meth:`turnable.game.Game.start_async`.
+    The game awaits :py:meth:`request` so a single event loop can host many sessions.
+    """
+
+    async def request(self, request: CommandRequest) -> CommandResponse:
+        raise NotImplementedError()
+
+
+class AsyncBaseOutputStream(BaseOutputStream):
+    """ Output stream for games played with :py:meth:`turnable.game.Game.start_async`. """
+
+    async def send(self, game: Game):
+        raise NotImplementedError()
+
+
 class CommandRequest:
-    """ Represents a request for user input. Part of the **Command Series** that allows for CLI gameplay. """
+    """
+    Represents a request for user input. Part of the **Command Series** that allows for CLI gameplay.
+
+    Responses to requests made for a *game* are recorded in its :py:attr:`turnable.game.Game.journal`, if any.
+    """
 
     _logger = logging.getLogger('turnable.streams.CommandRequest')
 
-    def __init__(self, label: str, commands: list = None, instream: BaseInputStream = None):
+    def __init__(self, label: str, commands: list = None, instream: BaseInputStream = None, game: Game = None):
         self.label = label
         self.commands = commands or []
         self.stream = instream
+        self.game = game
         self.retried = False
 
     def get_command(self, tag: str) -> Optional[Command]:
         """ Returns :py:class:`turnable.command.Command` based on tag. """
-        for cmd in self.commands:
-            if cmd.is_valid_input(tag):
-                return cmd
-        return None
+        return self.match(tag)[0]
+
+    def match(self, input_: str) -> Tuple[Optional[Command], tuple]:
+        """
+        Returns the first :py:class:`turnable.command.Command` matching *input_* and the groups matched by its tag.
+        Uses a compiled :py:class:`turnable.command.CommandDispatcher` and doesn't modify the commands.
+        """
+        dispatcher = get_dispatcher(tuple(cmd.tag for cmd in self.commands))
+        ix, matched = dispatcher.match(input_)
+        if ix is None:
+            return None, ()
+        return self.commands[ix], matched
 
     def send(self, retry: bool = False) -> CommandResponse:
         """ Sends request through :py:attr:`~stream`. """
         if retry and not self.retried:
             self.label = f"Invalid command.\n{self.label}"
             self.retried = True
-        return self.stream.request(self)
+        journal = self.game.journal if self.game is not None else None
+        if journal is None:
+            return self.stream.request(self)
+
+        rng_state = journal.rng_state(self.game)
+        resp = self.stream.request(self)
+        if inspect.isawaitable(resp):
+            return self._record_async(resp, journal, rng_state)
+        journal.record_input(self.game, resp, rng_state)
+        return resp
+
+    async def _record_async(self, awaitable, journal, rng_state) -> CommandResponse:
+        resp = await awaitable
+        journal.record_input(self.game, resp, rng_state)
+        return resp
+
+    async def send_async(self, retry: bool = False) -> CommandResponse:
+        """ Sends request through :py:attr:`~stream`, awaiting the response if the stream is asynchronous. """
+        resp = self.send(retry)
+        if inspect.isawaitable(resp):
+            resp = await resp
+        return resp
 
 
 class CommandResponse:
-    """ Represents the response built from a request and user input. """
+    """
+    Represents the response built from a request and user input.
+    The groups matched by the command tag are stored in :py:attr:`matched`.
+    """
 
     def __init__(self, request: CommandRequest, command: str):
         self.rawdata = command.strip()
         self.request = request
-        self.command = request.get_command(self.rawdata)
+        self.command, self.matched = request.match(self.rawdata)
         self.is_special = self.rawdata and self.rawdata[0] == ':'
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""
+Opt-in tracing of the game loop.
+
+Set a :py:class:`Tracer` on :py:attr:`turnable.game.Game.tracer` to record how long each phase of
+:py:meth:`turnable.game.Game.main_loop`, :py:meth:`~turnable.game.Game.level_loop` and
+:py:meth:`~turnable.game.Game.play_turns` takes, as well as every hook callback. Spans are kept in a bounded
+ring buffer and can be exported to the Chrome trace format, which can be opened in ``chrome://tracing``
+or `Perfetto <https://ui.perfetto.dev>`_: ::
+
+    from turnable.tracing import Tracer
+
+    game.tracer = Tracer()
+    game.start()
+    game.tracer.export_chrome('trace.json')
+
+When :py:attr:`turnable.game.Game.tracer` is ``None`` (the default) the game loop only pays for entering
+a shared no-op context manager per phase.
+"""
+import os
+import json
+import time
+import threading
+
+from collections import deque
+from typing import IO, Any, Callable, Iterable, Iterator, Optional, Union
+
+
+class RingBuffer:
+    """
+    Keeps the last *capacity* items appended to it and counts the older ones it dropped in :py:attr:`dropped`.
+    Used for the spans of a :py:class:`Tracer` and the events of a :py:class:`turnable.events.EventLog`.
+    """
+    __slots__ = ('capacity', 'items', 'dropped')
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.items = deque(maxlen=capacity)
+        self.dropped = 0
+
+    def append(self, item: Any):
+        if len(self.items) == self.capacity:
+            self.dropped += 1
+        self.items.append(item)
+
+    def clear(self):
+        self.items.clear()
+        self.dropped = 0
+
+    def export(self, file: Union[str, IO[str]], serialize: Callable[[Iterable[Any]], Iterable[str]]):
+        """ Writes the text *serialize* returns for the items to *file*, a path or a writable text file. """
+        if isinstance(file, str):
+            with open(file, 'w') as fp:
+                self.export(fp, serialize)
+            return
+        for chunk in serialize(self.items):
+            file.write(chunk)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class _NullSpan:
+    """ No-op context manager used when tracing is disabled. """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """ Context manager that records a span in a :py:class:`Tracer` when it exits. """
+    __slots__ = ('tracer', 'name', 'category', 'args', 'start')
+
+    def __init__(self, tracer: 'Tracer', name: str, category: str, args: Optional[dict]):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = self.tracer.clock()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.category, self.start, self.tracer.clock(), self.args)
+        return False
+
+
+class Tracer:
+    """
+    Records spans as ``(name, category, start_ns, end_ns, thread_id, args)`` tuples in a ring buffer that
+    keeps the last *capacity* spans.
+    """
+
+    def __init__(self, capacity: int = 65536, clock=time.perf_counter_ns):
+        self.clock = clock
+        self.spans = RingBuffer(capacity)
+
+    @property
+    def dropped(self) -> int:
+        """ Spans dropped from the buffer to make room for newer ones. """
+        return self.spans.dropped
+
+    def span(self, name: str, category: str = 'game', args: Optional[dict] = None) -> Span:
+        """ Returns a context manager that records the time spent inside it. """
+        return Span(self, name, category, args)
+
+    def record(self, name: str, category: str, start: int, end: int, args: Optional[dict] = None):
+        """ Stores a finished span. Times are in nanoseconds of :py:attr:`clock`. """
+        self.spans.append((name, category, start, end, threading.get_ident(), args))
+
+    def clear(self):
+        self.spans.clear()
+
+    def to_chrome(self) -> dict:
+        """ Returns the recorded spans in the Chrome trace event format. """
+        pid = os.getpid()
+        events = []
+        for name, category, start, end, tid, args in self.spans:
+            event = {
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': start / 1000,
+                'dur': (end - start) / 1000,
+                'pid': pid,
+                'tid': tid,
+            }
+            if args:
+                event['args'] = args
+            events.append(event)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'dropped': self.dropped}}
+
+    def export_chrome(self, file: Union[str, IO]):
+        """ Writes :py:meth:`to_chrome` as JSON to *file*, a path or a writable text file. """
+        self.spans.export(file, lambda spans: json.JSONEncoder().iterencode(self.to_chrome()))
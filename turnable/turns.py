@@ -0,0 +1,93 @@
+"""
+Turn order
+----------
+
+In a :py:class:`turnable.rooms.FightRoom` the player and the enemies act in the order given by a
+:py:class:`TurnScheduler`, a heap of entities keyed by the time of their next action. Time is measured in game
+turns: turn ``t`` is the round ``[t, t + 1)``, and an entity acts every ``1 / speed`` turns, so an entity with
+:py:attr:`turnable.chars.Entity.speed` ``2`` acts twice per round and one with ``0.5`` every other round.
+Entities acting at the same time go by :py:attr:`turnable.chars.Entity.initiative`, highest first, and then by
+the order they were added. By default the player has more initiative than enemies, so it acts first.
+
+Adding and removing entities (for example when they spawn or die) costs O(log n) and O(1).
+"""
+import heapq
+
+from itertools import count
+from typing import Dict, Iterable, List, Optional
+
+_REMOVED = None
+# Times this close to the end of a turn belong to the next one, so that speeds like 3 add up to whole turns.
+_EPSILON = 1e-9
+
+
+class TurnScheduler:
+    """ Heap of ``[time, -initiative, sequence, entity]`` entries. Removed entries are skipped when popped. """
+
+    def __init__(self, entities: Iterable = (), time: float = 0):
+        self.time = time
+        self.heap: List[list] = []
+        self.entries: Dict[object, list] = {}
+        self._seq = count()
+        for entity in entities:
+            self.add(entity)
+
+    def add(self, entity, time: Optional[float] = None):
+        """
+        Schedules the next action of *entity* at *time*. By default that's the time stored in the entity from a
+        previous scheduler, or now.
+        """
+        if entity in self.entries:
+            self.remove(entity)
+        if time is None:
+            time = max(self.time, entity._next_action)
+        entry = [time, -entity.initiative, next(self._seq), entity]
+        self.entries[entity] = entry
+        entity._next_action = time
+        heapq.heappush(self.heap, entry)
+
+    def remove(self, entity):
+        """ Unschedules *entity*. """
+        entry = self.entries.pop(entity, None)
+        if entry is not None:
+            entry[-1] = _REMOVED
+
+    def pop(self, until: float):
+        """ Removes and returns the next entity acting before *until*, or ``None``. """
+        heap = self.heap
+        while heap:
+            time, _, _, entity = heap[0]
+            if entity is _REMOVED:
+                heapq.heappop(heap)
+                continue
+            if time >= until - _EPSILON:
+                return None
+            heapq.heappop(heap)
+            del self.entries[entity]
+            self.time = max(self.time, time)
+            return entity
+        return None
+
+    def reschedule(self, entity):
+        """ Schedules the next action of an entity returned by :py:meth:`pop`, ``1 / speed`` turns later. """
+        self.add(entity, entity._next_action + 1 / entity.speed)
+
+    def catch_up(self, time: float):
+        """ Moves every entity scheduled before *time* to *time*, keeping their order. """
+        self.time = max(self.time, time)
+        late = []
+        heap = self.heap
+        while heap and heap[0][0] < time:
+            entry = heapq.heappop(heap)
+            if entry[-1] is not _REMOVED:
+                late.append(entry)
+        for entry in late:
+            entry[0] = time
+            entry[-1]._next_action = time
+            heapq.heappush(heap, entry)
+
+    def __contains__(self, entity):
+        return entity in self.entries
+
+    def __len__(self):
+        return len(self.entries)